@@ -1,11 +1,19 @@
 #!/usr/bin/env python3
 
+import gzip
+import hashlib
+import json
+import posixpath
 import subprocess
 import sys
-import shutil
 import re
 from pathlib import Path
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 SCRIPT_DIR = Path(__file__).parent.resolve()
 SITE_DIR = SCRIPT_DIR / "site"
 
@@ -14,12 +22,43 @@ ASSET_GLOBS = [
     "site/*.css",
 ]
 
+# Assets are renamed to <name>.<first FINGERPRINT_LENGTH hex digits of their content's SHA-256>.<ext>,
+# so an asset only gets a new URL (and is only re-downloaded) when its content changes
+FINGERPRINT_LENGTH = 8
+
+# Lists every deployed file with its content hash; a deploy whose manifest matches the one
+# already on the deploy branch is skipped
+MANIFEST_NAME = "asset-manifest.json"
+
+# Generated service worker that precaches every deployed file for offline use; it lives at the
+# site root so its scope covers the whole site, and keeps one cache, keyed by file and revision
+SERVICE_WORKER_NAME = "sw.js"
+SERVICE_WORKER_CACHE = "site-precache"
+
+DEV_BRANCH = "mattress"
+DEPLOY_BRANCH = "mistress"
+
+# Files under site/ scanned for asset references (and rewritten when the names they reference change)
+TEXT_SUFFIXES = {".html", ".htm", ".js", ".mjs", ".css", ".json", ".webmanifest", ".svg", ".txt"}
+
+# Third-party code, deployed as it is (only precompressed)
+EXTERNAL_DIR = "external"
+
+# Text files at least this big get precompressed .gz (and, with the brotli module installed, .br)
+# sidecars next to them
+COMPRESS_SUFFIXES = {".html", ".htm", ".js", ".css", ".json", ".svg", ".webmanifest", ".txt"}
+COMPRESS_MIN_BYTES = 1024
+
 dry = "--dry" in sys.argv
+# Build the deploy commit from the committed dev branch with git plumbing, leaving the checkout alone
+plumbing = "--plumbing" in sys.argv
+# Deploy the sources as they are, without bundling, minifying or precompressing
+build = "--no-build" not in sys.argv
 
 def run(cmd):
     print(f"[{'dry' if dry else 'run'}] {' '.join(cmd)}")
     mutating_git = (
-        cmd[0] == "git" and cmd[1] in {"add", "commit", "push", "checkout", "merge"}
+        cmd[0] == "git" and cmd[1] in {"add", "commit", "push", "checkout", "merge", "restore", "update-ref"}
     )
     if dry and (mutating_git or cmd[0] != "git"):
         return ""
@@ -30,149 +69,779 @@ def run(cmd):
         sys.exit(1)
     return result.stdout.strip()
 
-def get_sha():
-    return run(["git", "rev-parse", "--short", "HEAD"])
-
 def check_branch():
     branch = run(["git", "rev-parse", "--abbrev-ref", "HEAD"])
     if branch != "mattress":
         print(f"❌ Must be on 'mattress' branch, currently on '{branch}'")
         sys.exit(1)
 
-def collect_files():
-    files = []
-    for pattern in ASSET_GLOBS:
-        files.extend(SCRIPT_DIR.glob(pattern))
-    return files
-
-def strip_existing_sha(stem):
-    return re.sub(r"\.[a-f0-9]{7}$", "", stem)
+def is_generated(rel):
+    """Whether a site-relative path is one the deploy generates (and so never a source)."""
+    return rel in {MANIFEST_NAME, SERVICE_WORKER_NAME}
 
-def roll_filenames(files, sha):
-    rolled = []
-    for path in files:
-        if not path.is_file():
-            continue
+def worktree_site():
+    """{file: content bytes} for every source file under site/ in the working tree."""
+    return {file: file.read_bytes() for file in sorted(SITE_DIR.rglob("*"))
+            if file.is_file() and not is_generated(site_rel(file))}
 
-        base = strip_existing_sha(path.stem)
-        ext = path.suffix
-        new_name = f"{base}.{sha}{ext}"
-        new_path = path.with_name(new_name)
+def collect_files(contents):
+    return [file for file in contents
+            if any(file.relative_to(SCRIPT_DIR).match(pattern) for pattern in ASSET_GLOBS)]
 
-        print(f"🔄 {path.relative_to(SCRIPT_DIR)} → {new_path.name}")
-        if dry:
-            print(f"[dry] mv {path} → {new_path}")
-        else:
-            shutil.move(str(path), str(new_path))
-        rolled.append(new_path)
-
-    return rolled
-
-def unroll_filenames(files):
-    for path in files:
-        base = strip_existing_sha(path.stem)
-        ext = path.suffix
-        original_name = f"{base}{ext}"
-        original_path = path.with_name(original_name)
-        print(f"↩️  {path.relative_to(SCRIPT_DIR)} → {original_name}")
-        if dry:
-            print(f"[dry] mv {path} → {original_path}")
-        else:
-            shutil.move(str(path), str(original_path))
-
-def patch_lines(content_before, content_after):
-    old_lines = content_before.splitlines()
-    new_lines = content_after.splitlines()
-    out = []
-    for i, (a, b) in enumerate(zip(old_lines, new_lines)):
-        if a != b:
-            out.append(f"    - {a}")
-            out.append(f"    + {b}")
-    return "\n".join(out)
-
-def update_refs(rolled_files, sha):
-    print(f"[+] Rewriting references in {SITE_DIR}/*")
-
-    for file in SITE_DIR.glob("*"):
-        if not file.is_file():
+def strip_existing_sha(stem):
+    # 7 hex digits for names rolled by the old commit-SHA scheme, FINGERPRINT_LENGTH for content hashes
+    return re.sub(rf"\.(?:[a-f0-9]{{7}}|[a-f0-9]{{{FINGERPRINT_LENGTH}}})$", "", stem)
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def site_rel(path):
+    return path.relative_to(SITE_DIR).as_posix()
+
+def asset_key(rel):
+    """The logical name of an asset: its site-relative path without any fingerprint."""
+    stem, _, ext = rel.rpartition(".")
+    return f"{strip_existing_sha(stem)}.{ext}"
+
+def reference_pattern(suffixes):
+    """
+    One pattern for every quoted path ending in an asset extension. Which asset (if any) a match
+    names is a dict lookup, so the cost of a scan doesn't grow with the number of assets.
+    """
+    exts = "|".join(re.escape(ext) for ext in sorted(suffixes))
+    return re.compile(rf"""(["'`])([^"'`\s<>]*?)({exts})\1""")
+
+def resolve_reference(file_dir, ref, assets):
+    """The logical asset a reference names: relative to the referencing file, else to the site root."""
+    if ref.startswith("/"):
+        candidates = [ref.lstrip("/")]
+    else:
+        candidates = [posixpath.normpath(posixpath.join(file_dir, ref)), posixpath.normpath(ref)]
+    for candidate in candidates:
+        key = asset_key(candidate)
+        if key in assets:
+            return key
+    return None
+
+def scan_site(assets, contents):
+    """
+    Decode every text file in contents once and find the asset references in it. Returns
+    {file: (content, refs)}, refs being (start, end, asset key) spans of the referenced file
+    names (the directory part is kept as written). The assets in each file's refs make up the
+    site's which-file-references-what graph.
+    """
+    pattern = reference_pattern({Path(key).suffix for key in assets})
+    site = {}
+    for file, data in contents.items():
+        if file.suffix not in TEXT_SUFFIXES:
             continue
-
-        with file.open("r", encoding="utf-8") as f:
-            content = f.read()
-        original = content
-
-        for path in rolled_files:
-            rel = path.relative_to(SITE_DIR).as_posix()
-            stem, ext = rel.rsplit(".", 1)
-            ext = "." + ext
-            pattern = re.compile(rf'"{re.escape(strip_existing_sha(stem))}[^"]*?{re.escape(ext)}"')
-            replacement = f'"{strip_existing_sha(stem)}.{sha}{ext}"'
-            content = pattern.sub(replacement, content)
-
-        if content != original:
-            print(f"📝 Patched {file.name}")
-            print(patch_lines(original, content))
-            if not dry:
-                with file.open("w", encoding="utf-8") as f:
-                    f.write(content)
-
-def reset_refs(files):
-    print(f"[+] Reverting references in {SITE_DIR}/*")
-
-    for file in SITE_DIR.glob("*"):
-        if not file.is_file():
+        try:
+            content = data.decode("utf-8")
+        except UnicodeDecodeError:
             continue
+        file_dir = posixpath.dirname(site_rel(file))
+        refs = []
+        for match in pattern.finditer(content):
+            ref = match.group(2) + match.group(3)
+            key = resolve_reference(file_dir, ref, assets)
+            if key is not None:
+                refs.append((match.start(2) + ref.rfind("/") + 1, match.end(3), key))
+        site[file] = (content, refs)
+    return site
+
+def reference_graph(site):
+    """{site-relative file: sorted logical names of the assets it references}"""
+    return {site_rel(file): sorted({key for _, _, key in refs}) for file, (_, refs) in site.items() if refs}
+
+def rewrite_references(content, refs, name_of):
+    """Replace each referenced file name with name_of(asset key) in one pass over content."""
+    out, pos = [], 0
+    for start, end, key in refs:
+        out.append(content[pos:start])
+        out.append(name_of(key))
+        pos = end
+    out.append(content[pos:])
+    return "".join(out)
+
+def fingerprint_site(files, site, contents):
+    """
+    Fingerprint every asset by its content as deployed, i.e. with its own references already
+    rewritten. Dependencies are fingerprinted first, so a changed asset also changes the name of
+    every asset that references it, transitively, up to the pages loading them. A reference
+    inside a cycle is hashed by its logical name and rewritten to the final name afterwards.
+
+    Returns (renames, pages): {asset: fingerprinted path} and {file: (original, patched)} for
+    every scanned file whose references change. Nothing is written.
+    """
+    assets = {asset_key(site_rel(path)): path for path in files}
+    renames, visiting = {}, set()
+
+    def deployed_name(key):
+        path = renames.get(assets[key])
+        return path.name if path else Path(key).name
+
+    def visit(key):
+        path = assets[key]
+        if path in renames or key in visiting:
+            return
+        visiting.add(key)
+        if path in site:
+            content, refs = site[path]
+            for _, _, dep in refs:
+                visit(dep)
+            data = rewrite_references(content, refs, deployed_name).encode("utf-8")
+        else:
+            data = contents[path]
+        visiting.discard(key)
+        fingerprint = content_hash(data)[:FINGERPRINT_LENGTH]
+        base = Path(key)
+        renames[path] = path.with_name(f"{base.stem}.{fingerprint}{base.suffix}")
+
+    for key in sorted(assets):
+        visit(key)
+
+    pages = {}
+    for file, (content, refs) in site.items():
+        patched = rewrite_references(content, refs, deployed_name)
+        if patched != content:
+            pages[file] = (content, patched)
+    return renames, pages
+
+def file_entry(data):
+    return {"sha256": content_hash(data), "bytes": len(data)}
+
+def build_manifest(renames, pages, site, contents):
+    """
+    The manifest of the site as it will be deployed, which doubles as its file map: the
+    fingerprinted name of every asset, the SHA-256 and size of every file's deployed content
+    (after its references are rewritten), and which file references which assets, all by
+    deployed path.
+    """
+    files = {}
+    for file, data in contents.items():
+        if file in pages:
+            data = pages[file][1].encode("utf-8")
+        files[site_rel(renames.get(file, file))] = file_entry(data)
+    assets = {asset_key(site_rel(path)): site_rel(new_path) for path, new_path in renames.items()}
+    references = {}
+    for file, keys in reference_graph(site).items():
+        deployed = site_rel(renames.get(SITE_DIR / file, SITE_DIR / file))
+        references[deployed] = [assets[key] for key in keys]
+    return {"version": 3, "assets": dict(sorted(assets.items())), "files": files,
+            "references": dict(sorted(references.items()))}
+
+def deployed_manifest():
+    """The manifest on the deploy branch, or None if it has none yet."""
+    result = subprocess.run(["git", "show", f"{DEPLOY_BRANCH}:site/{MANIFEST_NAME}"],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        return None
+    try:
+        return json.loads(result.stdout)
+    except ValueError:
+        return None
+
+def manifest_bytes(manifest):
+    return (json.dumps(manifest, indent=2) + "\n").encode("utf-8")
+
+def deployed_files(contents, renames, pages, manifest):
+    """
+    {file: content bytes} of the site as deployed: assets under their fingerprinted names with
+    references rewritten, precompressed sidecars, and the manifest.
+    """
+    files = {}
+    for file, data in contents.items():
+        files[renames.get(file, file)] = pages[file][1].encode("utf-8") if file in pages else data
+    if build:
+        files.update(compressed_sidecars(files))
+    files[SITE_DIR / MANIFEST_NAME] = manifest_bytes(manifest)
+    return files
 
-        with file.open("r", encoding="utf-8") as f:
-            content = f.read()
-        original = content
-
-        for path in files:
-            rel = path.relative_to(SITE_DIR).as_posix()
-            stem, ext = rel.rsplit(".", 1)
-            ext = "." + ext
-            pattern = re.compile(rf'"{re.escape(strip_existing_sha(stem))}\.[^"]+{re.escape(ext)}"')
-            replacement = f'"{strip_existing_sha(stem)}{ext}"'
-            content = pattern.sub(replacement, content)
-
-        if content != original:
-            print(f"🧹 Unpatched {file.name}")
-            print(patch_lines(original, content))
-            if not dry:
-                with file.open("w", encoding="utf-8") as f:
-                    f.write(content)
-
-def deploy(rolled_files, sha):
-    print("[+] Committing rolled versions for deploy")
+def changed_assets(manifest, previous):
+    """Logical names of the assets whose fingerprint differs from the previous deploy."""
+    before = (previous or {}).get("assets", {})
+    return [name for name, path in manifest["assets"].items() if before.get(name) != path]
+
+def write_site(files):
+    """Make site/ in the working tree hold exactly files ({file: content bytes})."""
+    existing = {file for file in SITE_DIR.rglob("*") if file.is_file()}
+    for file in sorted(existing - set(files)):
+        print(f"🗑️  {file.relative_to(SCRIPT_DIR)}")
+        if not dry:
+            file.unlink()
+    for file, data in sorted(files.items()):
+        if file in existing and file.read_bytes() == data:
+            continue
+        print(f"📝 {file.relative_to(SCRIPT_DIR)} ({len(data):,} B)")
+        if not dry:
+            file.parent.mkdir(parents=True, exist_ok=True)
+            file.write_bytes(data)
+
+def change_summary(changed):
+    if not changed:
+        return "no asset changes"
+    if len(changed) <= 5:
+        return ", ".join(changed)
+    return f"{len(changed)} assets changed"
+
+def deploy(changed):
+    print("[+] Committing fingerprinted versions for deploy")
     run(["git", "add", "."])
-    run(["git", "commit", "-m", f"Deploy: roll asset filenames to SHA {sha}"])
+    run(["git", "commit", "-m", f"Deploy: fingerprint assets by content ({change_summary(changed)})"])
     run(["git", "push"])
 
-    print("[+] Fast-forwarding mistress to mattress (no merge commits allowed)")
-    run(["git", "checkout", "mistress"])
+    print(f"[+] Fast-forwarding {DEPLOY_BRANCH} to mattress (no merge commits allowed)")
+    run(["git", "checkout", DEPLOY_BRANCH])
     run(["git", "merge", "--ff-only", "mattress"])
     run(["git", "push"])
     run(["git", "checkout", "mattress"])
 
-def unroll(rolled_files):
-    print("[+] Reverting to SHA-less asset references")
-    unroll_filenames(rolled_files)
-    reset_refs(rolled_files)
-    run(["git", "add", "."])
-    run(["git", "commit", "-m", "Deploy: unroll asset filenames for dev"])
+def unroll(dev_commit):
+    print("[+] Restoring the dev sources")
+    run(["git", "restore", f"--source={dev_commit}", "--staged", "--worktree", "--", "site"])
+    run(["git", "commit", "-m", "Deploy: restore dev sources after the build"])
     run(["git", "push"])
 
+# --- SERVICE WORKER ---
+
+SERVICE_WORKER_TEMPLATE = """\
+// Generated by deploy-site.py on every deploy; do not edit.
+// Precaches exactly the files of this deploy and serves them cache-first, so a repeat visit
+// loads the site without touching the network. Files are cached under their path and content
+// revision: a deploy only downloads what changed, and activating it evicts everything the
+// previous deploys cached that this one no longer has.
+const CACHE_NAME = __CACHE_NAME__;
+const REVISIONS = __REVISIONS__;
+
+const scope = new URL(self.registration.scope);
+const cacheKey = (path) => new URL(`${path}?__rev=${REVISIONS[path]}`, scope).href;
+
+self.addEventListener("install", (event) => {
+  event.waitUntil((async () => {
+    const cache = await caches.open(CACHE_NAME);
+    await Promise.all(Object.keys(REVISIONS).map(async (path) => {
+      const key = cacheKey(path);
+      if (await cache.match(key)) return; // unchanged since an earlier deploy
+      const response = await fetch(new URL(path, scope), { cache: "reload" });
+      if (!response.ok) throw new Error(`Precaching ${path} failed: ${response.status}`);
+      await cache.put(key, response);
+    }));
+    await self.skipWaiting();
+  })());
+});
+
+self.addEventListener("activate", (event) => {
+  event.waitUntil((async () => {
+    const wanted = new Set(Object.keys(REVISIONS).map(cacheKey));
+    const cache = await caches.open(CACHE_NAME);
+    for (const request of await cache.keys()) {
+      if (!wanted.has(request.url)) await cache.delete(request);
+    }
+    await self.clients.claim();
+  })());
+});
+
+self.addEventListener("fetch", (event) => {
+  const url = new URL(event.request.url);
+  if (event.request.method !== "GET" || url.origin !== scope.origin || !url.pathname.startsWith(scope.pathname)) return;
+  let path = decodeURIComponent(url.pathname.slice(scope.pathname.length));
+  if (path === "" || path.endsWith("/")) path += "index.html";
+  if (!(path in REVISIONS)) return;
+  event.respondWith(caches.open(CACHE_NAME)
+    .then((cache) => cache.match(cacheKey(path)))
+    .then((cached) => cached || fetch(event.request)));
+});
+"""
+
+def register_service_worker(contents):
+    """
+    Add a <script> registering the service worker to the <head> of every page. Pages that
+    already mention it are left alone. Returns a new {file: content bytes}.
+    """
+    registered = dict(contents)
+    for page, data in contents.items():
+        if page.suffix not in {".html", ".htm"}:
+            continue
+        text = data.decode("utf-8")
+        head_end = re.search(r"^([ \t]*)</head>", text, re.M | re.I)
+        if head_end is None or SERVICE_WORKER_NAME in text:
+            continue
+        src = posixpath.relpath(SERVICE_WORKER_NAME, posixpath.dirname(site_rel(page)) or ".")
+        ending = "\r\n" if "\r\n" in text else "\n"
+        script = (f'{head_end.group(1)}  <script>if ("serviceWorker" in navigator) '
+                  f'navigator.serviceWorker.register("{src}");</script>{ending}')
+        registered[page] = (text[:head_end.start()] + script + text[head_end.start():]).encode("utf-8")
+    return registered
+
+def service_worker(manifest):
+    """The service worker precaching every file in the manifest, each under its content revision."""
+    revisions = {path: entry["sha256"][:FINGERPRINT_LENGTH] for path, entry in sorted(manifest["files"].items())}
+    return (SERVICE_WORKER_TEMPLATE
+            .replace("__CACHE_NAME__", json.dumps(SERVICE_WORKER_CACHE))
+            .replace("__REVISIONS__", json.dumps(revisions, indent=2))).encode("utf-8")
+
+# --- BUILD ---
+
+# Keywords after which a "/" starts a regular expression literal rather than a division
+REGEX_KEYWORDS = {"return", "typeof", "case", "do", "else", "in", "of", "new", "delete", "void",
+                  "throw", "instanceof", "yield", "await"}
+REGEX_AFTER = set("(,=:[!&|?{};+-*%<>~^}")
+
+# Whitespace next to one of these can go without changing what the code means
+JS_TIGHT = set("{}()[];,:=<>?&|!*%^~")
+CSS_TIGHT = set("{};,>")
+
+# A line break can only end a statement (through automatic semicolon insertion) between these
+JS_NO_BREAK_AFTER = set("{[(,;")
+JS_NO_BREAK_BEFORE = set(")]},;")
+
+# Runs of consecutive deferred site-module <script> tags on a page are bundled into one script
+MODULE_SCRIPT = re.compile(r'^([ \t]*)<script src="(js/[^"]+\.js)" defer></script>[ \t]*(\r?\n|$)', re.M)
+
+# The scripts and stylesheets a page loads, for the page weight report
+PAGE_RESOURCE = re.compile(r'<(?:script\b[^>]*\bsrc|link\b[^>]*\bhref)="([^"#?]+)"')
+
+def skip_gap(source, i):
+    """The end of the whitespace and comments starting at i, and whether they span a line break."""
+    n, newline = len(source), False
+    while i < n:
+        if source[i].isspace():
+            newline = newline or source[i] == "\n"
+            i += 1
+        elif source.startswith("//", i):
+            end = source.find("\n", i)
+            i = n if end < 0 else end
+        elif source.startswith("/*", i):
+            end = source.find("*/", i + 2)
+            end = n if end < 0 else end + 2
+            newline = newline or "\n" in source[i:end]
+            i = end
+        else:
+            break
+    return i, newline
+
+def skip_string(source, i):
+    """The end of the string literal starting at i."""
+    quote, i = source[i], i + 1
+    while i < len(source) and source[i] != quote:
+        i += 2 if source[i] == "\\" else 1
+    return i + 1
+
+def minify_js(source):
+    """
+    Conservative JS minification: drops comments, indentation and blank lines, and whitespace
+    next to punctuation; strings, template literals and regular expression literals are copied
+    as they are. Line breaks stay wherever automatic semicolon insertion could depend on them.
+    """
+    out, i, n = [], 0, len(source)
+    braces = []  # "{" for a block or object, "`" for a template literal's ${...}
+    word, last = "", ""  # the last identifier or keyword emitted, the last character emitted
+
+    def emit(text, is_word=False):
+        nonlocal word, last
+        out.append(text)
+        word, last = (text if is_word else ""), text[-1]
+
+    while i < n:
+        c = source[i]
+        if c.isspace() or source.startswith("//", i) or source.startswith("/*", i):
+            j, newline = skip_gap(source, i)
+            following = source[j] if j < n else ""
+            if last and following:
+                if newline and last not in JS_NO_BREAK_AFTER and following not in JS_NO_BREAK_BEFORE:
+                    out.append("\n")
+                elif last not in JS_TIGHT and following not in JS_TIGHT:
+                    out.append(" ")
+            i = j
+        elif c in "'\"":
+            j = skip_string(source, i)
+            emit(source[i:j])
+            i = j
+        elif c == "`" or (c == "}" and braces and braces[-1] == "`"):
+            if c == "}":
+                braces.pop()
+            j = i + 1
+            while j < n and source[j] != "`" and not source.startswith("${", j):
+                j += 2 if source[j] == "\\" else 1
+            if source.startswith("${", j):
+                braces.append("`")
+                j += 2
+            else:
+                j += 1
+            emit(source[i:j])
+            i = j
+        elif c == "/" and (not last or last in REGEX_AFTER or word in REGEX_KEYWORDS):
+            j, in_class = i + 1, False
+            while j < n and source[j] != "\n" and (in_class or source[j] != "/"):
+                if source[j] == "\\":
+                    j += 1
+                elif source[j] == "[":
+                    in_class = True
+                elif source[j] == "]":
+                    in_class = False
+                j += 1
+            emit(source[i:j + 1])
+            i = j + 1
+        elif c.isalnum() or c in "_$":
+            j = i
+            while j < n and (source[j].isalnum() or source[j] in "_$"):
+                j += 1
+            emit(source[i:j], is_word=True)
+            i = j
+        else:
+            if c == "{":
+                braces.append("{")
+            elif c == "}" and braces:
+                braces.pop()
+            emit(c)
+            i += 1
+    return "".join(out) + "\n"
+
+def minify_css(source):
+    """
+    Conservative CSS minification: drops comments, collapses whitespace (dropping it next to
+    braces, semicolons, commas and child combinators) and a rule's last semicolon; strings are
+    copied as they are.
+    """
+    out, i, n = [], 0, len(source)
+    while i < n:
+        c = source[i]
+        if c.isspace() or source.startswith("/*", i):
+            j = i
+            while j < n and (source[j].isspace() or source.startswith("/*", j)):
+                if source[j].isspace():
+                    j += 1
+                else:
+                    end = source.find("*/", j + 2)
+                    j = n if end < 0 else end + 2
+            following = source[j] if j < n else ""
+            if out and following and out[-1][-1] not in CSS_TIGHT and following not in CSS_TIGHT:
+                out.append(" ")
+            i = j
+        elif c in "'\"":
+            j = skip_string(source, i)
+            out.append(source[i:j])
+            i = j
+        else:
+            if c == "}" and out and out[-1] == ";":
+                out.pop()
+            out.append(c)
+            i += 1
+    return "".join(out) + "\n"
+
+def is_own_code(file):
+    return not site_rel(file).startswith(f"{EXTERNAL_DIR}/")
+
+def bundle_pages(contents):
+    """
+    Replace each run of two or more consecutive deferred site-module <script> tags on a page
+    with one tag loading their concatenation. Deferred scripts run in document order, so a run's
+    order is its dependency order. Returns ({page: new content}, {bundle file: [module files]}).
+    """
+    assets = {asset_key(site_rel(file)): file for file in collect_files(contents)}
+    pages, bundles = {}, {}
+    for page, data in contents.items():
+        if page.suffix not in {".html", ".htm"}:
+            continue
+        text = data.decode("utf-8")
+        page_dir = posixpath.dirname(site_rel(page))
+        runs = []
+        for match in MODULE_SCRIPT.finditer(text):
+            if runs and runs[-1][-1].end() == match.start():
+                runs[-1].append(match)
+            else:
+                runs.append([match])
+        runs = [tags for tags in runs if len(tags) > 1]
+        if not runs:
+            continue
+        pieces, pos = [], 0
+        for number, tags in enumerate(runs, 1):
+            keys = [resolve_reference(page_dir, tag.group(2), assets) for tag in tags]
+            if None in keys:
+                continue
+            name = f"js/{page.stem}.bundle.js" if len(runs) == 1 else f"js/{page.stem}-{number}.bundle.js"
+            indent, ending = tags[0].group(1), tags[-1].group(3)
+            pieces += [text[pos:tags[0].start()], f'{indent}<script src="{name}" defer></script>{ending}']
+            pos = tags[-1].end()
+            bundles[SITE_DIR / name] = [assets[key] for key in keys]
+        pieces.append(text[pos:])
+        pages[page] = "".join(pieces)
+    return pages, bundles
+
+def build_site(contents):
+    """
+    The production build of a site ({file: content bytes}): each page's site modules bundled,
+    the site's own JS and CSS minified, and modules only reachable through a bundle left out.
+    Third-party code under external/ is left as it is.
+    """
+    pages, bundles = bundle_pages(contents)
+    built = dict(contents)
+    for page, text in pages.items():
+        built[page] = text.encode("utf-8")
+    for file, data in contents.items():
+        if not is_own_code(file):
+            continue
+        if file.suffix in {".js", ".mjs"}:
+            built[file] = minify_js(data.decode("utf-8")).encode("utf-8")
+        elif file.suffix == ".css":
+            built[file] = minify_css(data.decode("utf-8")).encode("utf-8")
+    for bundle, modules in bundles.items():
+        # A module's last statement may rely on the line break after it to be terminated
+        built[bundle] = ";\n".join(built[module].decode("utf-8").rstrip("\n") for module in modules).encode("utf-8") + b"\n"
+
+    bundled = {module for modules in bundles.values() for module in modules}
+    site = scan_site({asset_key(site_rel(file)) for file in collect_files(built)}, built)
+    still_referenced = {key for _, refs in site.values() for _, _, key in refs}
+    for module in bundled:
+        if asset_key(site_rel(module)) not in still_referenced:
+            del built[module]
+    print(f"[+] Built {len(bundles)} bundle(s) from {len(bundled)} module(s); minified the site's own JS and CSS")
+    return built
+
+def compressed_sidecars(files):
+    """Precompressed .gz (and .br) sidecars for the text files worth compressing."""
+    sidecars = {}
+    for file, data in files.items():
+        if file.suffix not in COMPRESS_SUFFIXES or len(data) < COMPRESS_MIN_BYTES:
+            continue
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) < len(data):
+            sidecars[file.with_name(file.name + ".gz")] = compressed
+        if brotli is not None:
+            compressed = brotli.compress(data, quality=11)
+            if len(compressed) < len(data):
+                sidecars[file.with_name(file.name + ".br")] = compressed
+    return sidecars
+
+def page_weight(page, files):
+    """The files loading a page takes: the page and the scripts and stylesheets it references."""
+    by_rel = {site_rel(file): file for file in files}
+    page_dir = posixpath.dirname(site_rel(page))
+    loaded = [page]
+    for ref in PAGE_RESOURCE.findall(files[page].decode("utf-8")):
+        for candidate in (posixpath.normpath(posixpath.join(page_dir, ref)), ref.lstrip("/")):
+            if candidate in by_rel:
+                loaded.append(by_rel[candidate])
+                break
+    return loaded
+
+def transfer_size(file, files, suffix):
+    """The bytes sent for file when the client accepts the encoding of the suffix sidecar."""
+    return len(files.get(file.with_name(file.name + suffix), files[file]))
+
+def report_page_weights(source, deployed):
+    print("[+] Page weight on first load (the page, its scripts and its stylesheets):")
+    for page in sorted(file for file in deployed if file.suffix in {".html", ".htm"}):
+        before = page_weight(page, source) if page in source else []
+        after = page_weight(page, deployed)
+        line = (f"📦 {site_rel(page)}: {len(before)} requests, {sum(len(source[f]) for f in before):,} B → "
+                f"{len(after)} requests, {sum(len(deployed[f]) for f in after):,} B"
+                f" (gzip {sum(transfer_size(f, deployed, '.gz') for f in after):,} B")
+        if brotli is not None:
+            line += f", brotli {sum(transfer_size(f, deployed, '.br') for f in after):,} B"
+        print(line + ")")
+    if brotli is None:
+        print("⚠️  brotli module not installed; only .gz sidecars were written (pip install brotli)")
+
+def prepare(contents):
+    """
+    Build (unless --no-build), fingerprint and rewrite a site and generate its service worker.
+    Returns the deployed files ({file: content bytes}), the manifest and the number of assets.
+    """
+    built = register_service_worker(build_site(contents) if build else contents)
+    files = collect_files(built)
+    site = scan_site({asset_key(site_rel(path)) for path in files}, built)
+    print(f"[+] Scanned {len(site)} text file(s) under {SITE_DIR}: "
+          f"{sum(len(refs) for _, refs in site.values())} asset reference(s)")
+    renames, pages = fingerprint_site(files, site, built)
+    manifest = build_manifest(renames, pages, site, built)
+    worker = service_worker(manifest)
+    manifest["files"][SERVICE_WORKER_NAME] = file_entry(worker)
+    print(f"[+] Generated {SERVICE_WORKER_NAME} precaching {len(manifest['files']) - 1} file(s)")
+    deployed = deployed_files(built, renames, pages, manifest)
+    deployed[SITE_DIR / SERVICE_WORKER_NAME] = worker
+    if build:
+        report_page_weights(contents, deployed)
+    return deployed, manifest, len(renames)
+
+# --- PLUMBING DEPLOY ---
+
+def git(args, input=None):
+    """Run a read-only or object-writing git command and return its raw stdout."""
+    result = subprocess.run(["git", *args], input=input, cwd=SCRIPT_DIR,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        print(f"❌ Command failed: git {' '.join(args)}")
+        print(result.stderr.decode("utf-8", "replace").strip())
+        sys.exit(1)
+    return result.stdout
+
+def rev_parse(rev):
+    """The object id rev names, or None if it doesn't exist."""
+    result = subprocess.run(["git", "rev-parse", "--verify", "--quiet", rev], cwd=SCRIPT_DIR,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+def ls_tree(tree, recursive=False, paths=()):
+    """{path: (mode, type, object id)} for the entries of a tree."""
+    out = git(["ls-tree", "-z", *(["-r"] if recursive else []), tree, "--", *paths])
+    entries = {}
+    for line in out.decode("utf-8").split("\0"):
+        if line:
+            meta, path = line.split("\t", 1)
+            mode, kind, oid = meta.split(" ")
+            entries[path] = (mode, kind, oid)
+    return entries
+
+def read_blobs(oids):
+    """{object id: content} for some blobs, read through a single git cat-file --batch."""
+    out = git(["cat-file", "--batch"], input="".join(f"{oid}\n" for oid in oids).encode("ascii"))
+    blobs, pos = {}, 0
+    while pos < len(out):
+        header_end = out.index(b"\n", pos)
+        oid, _, size = out[pos:header_end].decode("ascii").split(" ")
+        start = header_end + 1
+        blobs[oid] = out[start:start + int(size)]
+        pos = start + int(size) + 1
+    return blobs
+
+def committed_site(commit):
+    """
+    {file: content bytes} for every source file under site/ in a commit, and
+    {file: (mode, object id)} of those blobs.
+    """
+    entries = {SCRIPT_DIR / path: (mode, oid)
+               for path, (mode, kind, oid) in ls_tree(commit, recursive=True, paths=["site"]).items()
+               if kind == "blob" and not is_generated(posixpath.relpath(path, "site"))}
+    blobs = read_blobs(sorted({oid for _, oid in entries.values()}))
+    return {file: blobs[oid] for file, (_, oid) in sorted(entries.items())}, entries
+
+def write_blob(data):
+    return git(["hash-object", "-w", "--stdin"], input=data).decode("ascii").strip()
+
+def edit_tree(tree, edits):
+    """
+    The id of tree with edits applied: edits maps entry names to (mode, type, id), to None to
+    remove the entry, or to a nested dict of edits for a subdirectory. Only the directories on
+    the path to an edit are rewritten; every other subtree is reused by id.
+    """
+    entries = ls_tree(tree) if tree else {}
+    for name, edit in edits.items():
+        if edit is None:
+            entries.pop(name, None)
+        elif isinstance(edit, dict):
+            _, kind, oid = entries.get(name, (None, None, None))
+            entries[name] = ("040000", "tree", edit_tree(oid if kind == "tree" else None, edit))
+        else:
+            entries[name] = edit
+    listing = "".join(f"{mode} {kind} {oid}\t{name}\0" for name, (mode, kind, oid) in sorted(entries.items()))
+    return git(["mktree", "-z"], input=listing.encode("utf-8")).decode("ascii").strip()
+
+def tree_edits(changes):
+    """Nest {repo-relative path: edit} into the per-directory dicts edit_tree takes."""
+    edits = {}
+    for path, edit in changes.items():
+        *dirs, name = path.split("/")
+        node = edits
+        for part in dirs:
+            node = node.setdefault(part, {})
+        node[name] = edit
+    return edits
+
+def blob_id(data):
+    """The id git gives a blob with this content, without writing it."""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+def deploy_plumbing(commit, modes, files, changed):
+    """
+    Commit the deployed site (files, {file: content bytes}) on top of DEPLOY_BRANCH without
+    touching the checkout. The new tree is the previous deploy's tree with only the differences
+    applied: files outside site/ are taken from the dev commit by id, only site files whose
+    content or name changed get a blob written, only the directories above them new trees, and
+    the deploy branch is moved with a compare-and-swap update-ref.
+    """
+    parent = rev_parse(f"refs/heads/{DEPLOY_BRANCH}")
+    base = parent or commit
+    deployed_site = ls_tree(base, recursive=True, paths=["site"])
+    changes, written = {}, 0
+    for file, data in files.items():
+        path = file.relative_to(SCRIPT_DIR).as_posix()
+        entry = (modes.get(file, "100644"), "blob", blob_id(data))
+        if deployed_site.get(path) != entry:
+            if rev_parse(f"{entry[2]}^{{blob}}") is None:
+                write_blob(data)
+                written += 1
+            changes[path] = entry
+    for path in deployed_site:
+        if SCRIPT_DIR / path not in files:
+            changes[path] = None
+    # Everything outside site/ is the dev commit's, reused by id
+    dev_root, base_root = ls_tree(commit), ls_tree(base)
+    for name in set(dev_root) | set(base_root):
+        if name != "site" and dev_root.get(name) != base_root.get(name):
+            changes[name] = dev_root.get(name)
+    print(f"[+] {len(changes)} path(s) differ from the last deploy; wrote {written} blob(s)")
+
+    tree = edit_tree(rev_parse(f"{base}^{{tree}}"), tree_edits(changes))
+    message = f"Deploy: fingerprint assets by content ({change_summary(changed)})\n\nBuilt from {DEV_BRANCH} {commit[:7]}."
+    deployed = git(["commit-tree", tree, *(["-p", parent] if parent else []), "-m", message]).decode("ascii").strip()
+    print(f"[+] Created deploy commit {deployed[:7]} (tree {tree[:7]})")
+
+    run(["git", "update-ref", "-m", f"deploy from {DEV_BRANCH} {commit[:7]}",
+         f"refs/heads/{DEPLOY_BRANCH}", deployed, parent or ""])
+    run(["git", "push", "origin", f"refs/heads/{DEPLOY_BRANCH}:refs/heads/{DEPLOY_BRANCH}"])
+
+def check_changes(manifest, asset_count):
+    """The assets changed since the last deploy, or None if the deploy branch already has this site."""
+    previous = deployed_manifest()
+    if manifest == previous:
+        print(f"✅ Nothing changed since the last deploy ({DEPLOY_BRANCH} already has this content). Nothing to do.")
+        return None
+    changed = changed_assets(manifest, previous)
+    print(f"[+] Fingerprinting assets by content; {len(changed)} of {asset_count} changed since the last deploy")
+    return changed
+
+def main_plumbing():
+    commit = rev_parse(f"refs/heads/{DEV_BRANCH}")
+    if commit is None:
+        print(f"❌ No '{DEV_BRANCH}' branch to deploy from")
+        sys.exit(1)
+    if run(["git", "status", "--porcelain", "--", "site"]):
+        print(f"⚠️  Uncommitted changes under site/ are not deployed; deploying {DEV_BRANCH} {commit[:7]}")
+
+    contents, entries = committed_site(commit)
+    files, manifest, asset_count = prepare(contents)
+    changed = check_changes(manifest, asset_count)
+    if changed is None:
+        return
+
+    # Files keep their mode in the dev commit; renamed and generated ones are written as 100644
+    modes = {file: mode for file, (mode, _) in entries.items()}
+    deploy_plumbing(commit, modes, files, changed)
+
+    if dry:
+        print("✅ Dry run complete. Deploy commit built but no branch moved.")
+    else:
+        print(f"✅ Deployed {DEV_BRANCH} {commit[:7]} to {DEPLOY_BRANCH}. Working tree untouched.")
+
 def main():
+    if plumbing:
+        main_plumbing()
+        return
+
     check_branch()
-    sha = get_sha()
-    print(f"[+] Rolling to SHA: {sha}")
+    dev_commit = run(["git", "rev-parse", "HEAD"])
+
+    files, manifest, asset_count = prepare(worktree_site())
+    changed = check_changes(manifest, asset_count)
+    if changed is None:
+        return
 
-    files_to_roll = collect_files()
-    rolled_files = roll_filenames(files_to_roll, sha)
-    update_refs(rolled_files, sha)
+    print(f"[+] Writing the deployed site to {SITE_DIR}")
+    write_site(files)
 
-    deploy(rolled_files, sha)
-    unroll(rolled_files)
+    deploy(changed)
+    unroll(dev_commit)
 
     if dry:
         print("✅ Dry run complete. No changes made.")
@@ -4,14 +4,65 @@
  * Loads the backend JSON data from the Git repo cloned into LightningFS.
  * The file used is "ueue-media-tracking.json" located at the root of the repo.
  * We now expect a structure with "media" and "meta" keys.
+ * The same data can instead be stored sharded (as written by trakt_converter.py --layout sharded):
+ * "ueue-media-tracking/manifest.json" holds meta and the list of shard files, and each
+ * "ueue-media-tracking/media/NN.json" holds the media records of one shard. The sharded layout is
+ * used when its manifest exists; saving then only rewrites the shards whose records changed.
  * This version does not wait for the Git clone/fetch operation, so Wikidata fetches
  * can start immediately. If the file does not exist, it is created with the default structure,
  * and a commit/push is triggered asynchronously.
  */
 let backendData = null;
 
+const BACKEND_FILE = 'ueue-media-tracking.json';
+const BACKEND_SHARD_DIR = 'ueue-media-tracking';
+const BACKEND_SHARD_COUNT = 100; // Must match SHARD_COUNT in trakt_converter.py.
+let backendLayout = "single";
+let backendManifestText = null;
+let dirtyMediaKeys = new Set();
+
+/**
+ * Returns the shard a media key is stored in: the QID number mod BACKEND_SHARD_COUNT
+ * (zero-padded, e.g. "45" for Q12345), or "other" for non-Wikidata keys.
+ */
+function shardName(key) {
+  const match = /wikidata\.org\/.*\/Q(\d+)$/.exec(key);
+  if (!match) return "other";
+  const width = String(BACKEND_SHARD_COUNT - 1).length;
+  return String(Number(BigInt(match[1]) % BigInt(BACKEND_SHARD_COUNT))).padStart(width, "0");
+}
+
+/**
+ * Returns a copy of a media map with its keys in sorted order, so saves produce stable diffs.
+ */
+function sortedMedia(media) {
+  const sorted = {};
+  Object.keys(media).sort().forEach(key => { sorted[key] = media[key]; });
+  return sorted;
+}
+
+async function loadShardedBackendData() {
+  const dir = gitSync.repoDir + '/' + BACKEND_SHARD_DIR;
+  const manifestText = await gitSync.pfs.readFile(dir + '/manifest.json', 'utf8');
+  const manifest = JSON.parse(manifestText);
+  const shards = await Promise.all((manifest.shards || []).map(path =>
+    gitSync.pfs.readFile(dir + '/' + path, 'utf8').then(text => JSON.parse(text))));
+  const media = {};
+  shards.forEach(shard => Object.assign(media, shard));
+  backendManifestText = manifestText;
+  return { media, meta: manifest.meta || { queues: [] } };
+}
+
 async function loadBackendData() {
-  const filePath = gitSync.repoDir + '/ueue-media-tracking.json';
+  const filePath = gitSync.repoDir + '/' + BACKEND_FILE;
+  dirtyMediaKeys = new Set();
+  try {
+    backendData = await loadShardedBackendData();
+    backendLayout = "sharded";
+    return backendData;
+  } catch (err) {
+    backendLayout = "single";
+  }
   try {
     const fileContent = await gitSync.pfs.readFile(filePath, 'utf8');
     backendData = JSON.parse(fileContent);
@@ -38,12 +89,52 @@ async function loadBackendData() {
 }
 
 /**
- * Saves the current backendData to the JSON file.
+ * Writes the shards holding changed media records, and the manifest if meta or the shard list changed.
+ */
+async function saveShardedBackendData() {
+  const dir = gitSync.repoDir + '/' + BACKEND_SHARD_DIR;
+  const shards = {};
+  Object.keys(backendData.media).forEach(key => {
+    const name = shardName(key);
+    (shards[name] = shards[name] || []).push(key);
+  });
+  const dirtyShards = new Set([...dirtyMediaKeys].map(shardName));
+  try {
+    await gitSync.pfs.mkdir(dir + '/media');
+  } catch (e) {
+    // Ignore if it already exists.
+  }
+  for (const name of dirtyShards) {
+    const shard = {};
+    (shards[name] || []).sort().forEach(key => { shard[key] = backendData.media[key]; });
+    await gitSync.pfs.writeFile(dir + '/media/' + name + '.json', JSON.stringify(shard, null, 2), 'utf8');
+  }
+  const manifest = {
+    layout: "sharded",
+    version: 1,
+    meta: backendData.meta,
+    shards: Object.keys(shards).sort().map(name => 'media/' + name + '.json')
+  };
+  const manifestText = JSON.stringify(manifest, null, 2);
+  if (manifestText !== backendManifestText) {
+    await gitSync.pfs.writeFile(dir + '/manifest.json', manifestText, 'utf8');
+    backendManifestText = manifestText;
+  }
+  dirtyMediaKeys = new Set();
+}
+
+/**
+ * Saves the current backendData to the JSON file (or its changed shards).
  * After writing, we dispatch a "backendUpdated" event so that UI components can re‑render.
  */
 async function saveBackendData() {
-  const filePath = gitSync.repoDir + '/ueue-media-tracking.json';
-  await gitSync.pfs.writeFile(filePath, JSON.stringify(backendData, null, 2), 'utf8');
+  if (backendLayout === "sharded") {
+    await saveShardedBackendData();
+  } else {
+    const filePath = gitSync.repoDir + '/' + BACKEND_FILE;
+    const data = { media: sortedMedia(backendData.media || {}), meta: backendData.meta };
+    await gitSync.pfs.writeFile(filePath, JSON.stringify(data, null, 2), 'utf8');
+  }
   // Notify that the backend data has updated.
   document.dispatchEvent(new Event('backendUpdated'));
 }
@@ -67,6 +158,8 @@ function ensureMediaEntry(qid) {
       "queue-votes": {}
     };
   }
+  // Callers go on to modify the entry, so its shard needs saving.
+  dirtyMediaKeys.add(key);
   return key;
 }
 
@@ -79,6 +172,7 @@ function sanitizeMediaRecord(qid, entity) {
   const key = "http://www.wikidata.org/entity/" + qid;
   if (!backendData.media || !backendData.media[key]) return;
   const record = backendData.media[key];
+  dirtyMediaKeys.add(key);
   if (entity) {
     record.meta.title = (entity.labels && entity.labels.en) ? entity.labels.en.value : qid;
     record.meta.description = (entity.descriptions && entity.descriptions.en) ? entity.descriptions.en.value : "";
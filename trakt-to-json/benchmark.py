@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Benchmark the full Converter.convert pipeline offline.
+For each size, a synthetic export is generated (synthetic_export.py), a seeded wikidata_stub.py is
+started on a free port, and trakt_converter.py is run non-interactively against it with a fresh cache
+in a child process. Reports records/sec, requests issued, bytes written and peak RSS per size.
+"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import random
+import resource
+import runpy
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import synthetic_export
+import wikidata_stub
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CONVERTER = os.path.join(SCRIPT_DIR, "trakt_converter.py")
+
+def read_proc_io():
+    """Bytes the process passed to write() (files, sockets and stderr), from /proc/self/io."""
+    try:
+        with open("/proc/self/io", "r") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+def run_child(stats_file, converter_args):
+    """
+    Child mode: run the converter as __main__ and record this process's own
+    peak RSS and write volume to stats_file when it exits.
+    """
+    def dump_stats():
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        with open(stats_file, "w", encoding="utf-8") as f:
+            json.dump({"peak_rss_kb": usage.ru_maxrss, "bytes_written": read_proc_io()}, f)
+    atexit.register(dump_stats)
+    sys.argv = [CONVERTER] + converter_args
+    sys.path.insert(0, SCRIPT_DIR)
+    runpy.run_path(CONVERTER, run_name="__main__")
+
+def count_records(export_dir):
+    total = 0
+    for sub in ("watched", "lists"):
+        for name in os.listdir(os.path.join(export_dir, sub)):
+            with open(os.path.join(export_dir, sub, name), "r", encoding="utf-8") as f:
+                total += len(json.load(f))
+    return total
+
+def benchmark_size(records, args, work_dir):
+    export_dir = os.path.join(work_dir, f"export-{records}", "export")
+    seed_file = os.path.join(work_dir, f"export-{records}", "stub-seed.json")
+    synthetic_export.generate(records, export_dir, seed_file, random.Random(args.seed))
+    total = count_records(export_dir)
+
+    server = wikidata_stub.make_server(seed_file, port=0, latency=args.latency, jitter=args.jitter,
+                                       error_rate=args.error_rate, retry_after=args.retry_after)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    host = f"127.0.0.1:{server.server_address[1]}"
+
+    output_file = os.path.join(work_dir, f"output-{records}.json")
+    stats_file = os.path.join(work_dir, f"stats-{records}.json")
+    converter_args = [export_dir, output_file, "--non-interactive",
+                      "--cache", os.path.join(work_dir, f"cache-{records}.sqlite3"),
+                      "--sparql-url", f"{base_url}/sparql", "--api-url", f"{base_url}/w/api.php",
+                      "--workers", str(args.workers), "--rate", f"{host}={args.rate}",
+                      "--log-level", args.log_level] + args.converter_args
+    start = time.perf_counter()
+    subprocess.run([sys.executable, os.path.abspath(__file__), "--child", stats_file, "--"] + converter_args,
+                   check=True)
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    with open(stats_file, "r", encoding="utf-8") as f:
+        child = json.load(f)
+    with server.state.lock:
+        stub_stats = dict(server.state.stats)
+    return {
+        "records": total,
+        "seconds": round(elapsed, 3),
+        "records_per_sec": round(total / elapsed, 1) if elapsed else None,
+        "requests": stub_stats["requests"],
+        "throttled": stub_stats["throttled"],
+        "bytes_written": child["bytes_written"],
+        "output_bytes": os.path.getsize(output_file) if os.path.exists(output_file) else 0,
+        "peak_rss_mb": round(child["peak_rss_kb"] / 1024, 1),
+    }
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3 and sys.argv[1] == "--child":
+        run_child(sys.argv[2], sys.argv[4:])
+        sys.exit(0)
+
+    # Only the parent configures logging; the child's converter sets its own --log-level
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+    parser = argparse.ArgumentParser(description="Benchmark trakt_converter against an offline Wikidata stub.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="History record counts to benchmark")
+    parser.add_argument("--latency", type=float, default=0.02, help="Stub latency per request in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random stub latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After sent with injected 429s")
+    parser.add_argument("--workers", type=int, default=8, help="Converter lookup workers")
+    parser.add_argument("--rate", type=float, default=1000.0, help="Converter rate limit for the stub host (req/s)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic exports")
+    parser.add_argument("--log-level", default="WARNING", help="Converter logging level")
+    parser.add_argument("--work-dir", help="Keep exports, outputs and caches here instead of a temp dir")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("converter_args", nargs="*", help="Extra converter arguments (after --)")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="trakt-benchmark-")
+    os.makedirs(work_dir, exist_ok=True)
+    results = []
+    for size in args.sizes:
+        logger.info(f"Benchmarking {size} records in {work_dir}...")
+        results.append(benchmark_size(size, args, work_dir))
+
+    columns = ["records", "seconds", "records_per_sec", "requests", "throttled", "bytes_written", "output_bytes", "peak_rss_mb"]
+    print("  ".join(f"{c:>15}" for c in columns))
+    for result in results:
+        print("  ".join(f"{str(result[c]):>15}" for c in columns))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
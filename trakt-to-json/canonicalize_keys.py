@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Canonicalize the record keys of an existing tracker data file or converter output (any layout).
+Every Wikidata key becomes http://www.wikidata.org/entity/Q…, merged/redirected QIDs are followed
+(wbgetentities, 50 ids per request), trakt.tv fallback keys are retried against the resolver, and
+records that collapse onto the same key are merged. Missing meta titles and descriptions are then
+filled from the same wbgetentities answers. Uses the converter's cache store, so reruns only query
+what hasn't been checked before.
+"""
+import argparse
+import json
+import logging
+import os
+
+import trakt_converter as tc
+
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Canonicalize the record keys of a ueue-media-tracking.json or converter output.")
+    parser.add_argument("path", help="ueue-media-tracking.json, a sharded directory or a flat converter output")
+    parser.add_argument("-o", "--output", help="Write the result here instead of updating path in place")
+    parser.add_argument("--offline", action="store_true",
+                        help="Only normalize URL forms; no redirect check or fallback retries")
+    parser.add_argument("--no-fallbacks", action="store_true", help="Don't retry trakt.tv fallback keys")
+    parser.add_argument("--no-enrich", action="store_true", help="Don't fill missing meta titles/descriptions")
+    parser.add_argument("--cache", default=tc.CACHE_FILENAME, help=f"Cache store (default {tc.CACHE_FILENAME})")
+    parser.add_argument("--sparql-url", default=tc.SPARQL_URL, help="SPARQL endpoint to query")
+    parser.add_argument("--api-url", default=tc.API_URL, help="MediaWiki API endpoint to query")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    parser.add_argument("--report", metavar="REPORT_JSON", help="Also write the report (with changed keys) here")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+    output_data, queues, layout = tc.read_output(args.path)
+    cache = tc.open_cache(args.cache)
+    resolver = tc.Resolver(cache, interactive=False, sparql_url=args.sparql_url, api_url=args.api_url)
+    try:
+        changed, report = resolver.canonicalize_output(output_data, online=not args.offline,
+                                                       retry_fallbacks=not args.no_fallbacks)
+        if not args.offline and not args.no_enrich:
+            enriched, report["enrich"] = resolver.enrich_output(output_data)
+            changed |= enriched
+    finally:
+        cache.close()
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(dict(report, changed_keys=sorted(changed)), f, indent=2, ensure_ascii=False)
+
+    output = args.output or args.path
+    if args.dry_run:
+        logger.info("Dry run; nothing written.")
+    elif not changed and output == args.path:
+        logger.info(f"Nothing to change; {args.path} left untouched.")
+    else:
+        in_place = output == args.path and os.path.isdir(output)
+        tc.write_output(output, layout, output_data, queues, changed if in_place else None)
+        logger.info(f"Canonicalized data written to {output}.")
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Merge a trakt_converter.py output into an existing tracker data file (ueue-media-tracking.json,
+or a sharded directory), keeping everything already in it.
+
+Existing consumptions and queue votes are indexed by their Trakt history/watchlist id (recovered
+from the note), falling back to (key, when) for entries without one, in one pass over the target,
+so each incoming entry is checked in O(1) and only genuinely new entries are added. A reconversion
+from another export path, or with shifted watchlist ranks, therefore adds nothing. Hand-entered
+notes, titles and descriptions are never overwritten; missing titles and descriptions are filled
+in from the source. Lists that received new entries are re-sorted by "when". The result is written
+once, in the target's own layout (only the changed shards of a sharded target), and a summary of
+what changed is logged.
+"""
+import argparse
+import json
+import logging
+import os
+
+from trakt_converter import history_id_from_note, merge_queues, read_output, watchlist_id_from_note, write_output
+
+logger = logging.getLogger(__name__)
+
+def consumption_id(key, consumption):
+    """Identity of a consumption: its Trakt history id, else (key, when)."""
+    history_id = history_id_from_note(consumption.get("note"))
+    if history_id is not None:
+        return ("history", history_id)
+    return (key, consumption.get("when"))
+
+def vote_id(key, queue, vote):
+    """Identity of a queue vote: its Trakt watchlist id, else (key, queue, when)."""
+    watchlist_id = watchlist_id_from_note(vote.get("note"))
+    if watchlist_id is not None:
+        return ("watchlist", queue, watchlist_id)
+    return (key, queue, vote.get("when"))
+
+def when_order(entry):
+    """Sort key putting entries in "when" order, entries without a time last."""
+    when = entry.get("when")
+    return (when is None, when or "")
+
+def merge_outputs(target, source):
+    """
+    Merge source ({key: record}) into target in place.
+    Returns (changed keys, report) where report counts what was added and skipped.
+    """
+    report = {"new_media": 0, "consumptions_added": 0, "consumptions_skipped": 0,
+              "votes_added": 0, "votes_skipped": 0, "meta_filled": 0}
+    consumptions = set()
+    votes = set()
+    for key, record in target.items():
+        for consumption in record.get("consumptions", []):
+            consumptions.add(consumption_id(key, consumption))
+        for queue, queue_votes in record.get("queue-votes", {}).items():
+            for vote in queue_votes:
+                votes.add(vote_id(key, queue, vote))
+
+    changed = set()
+    for key, incoming in source.items():
+        record = target.get(key)
+        if record is None:
+            record = target[key] = {"meta": dict(incoming.get("meta", {})), "notes": incoming.get("notes", ""),
+                                    "consumptions": [], "queue-votes": {}}
+            report["new_media"] += 1
+            changed.add(key)
+        else:
+            meta = record.setdefault("meta", {})
+            for field, value in incoming.get("meta", {}).items():
+                if value and not meta.get(field):
+                    meta[field] = value
+                    report["meta_filled"] += 1
+                    changed.add(key)
+
+        added = False
+        for consumption in incoming.get("consumptions", []):
+            ident = consumption_id(key, consumption)
+            if ident in consumptions:
+                report["consumptions_skipped"] += 1
+                continue
+            consumptions.add(ident)
+            record.setdefault("consumptions", []).append(consumption)
+            report["consumptions_added"] += 1
+            added = True
+        if added:
+            record["consumptions"].sort(key=when_order)
+            changed.add(key)
+
+        for queue, queue_votes in incoming.get("queue-votes", {}).items():
+            added = False
+            for vote in queue_votes:
+                ident = vote_id(key, queue, vote)
+                if ident in votes:
+                    report["votes_skipped"] += 1
+                    continue
+                votes.add(ident)
+                record.setdefault("queue-votes", {}).setdefault(queue, []).append(vote)
+                report["votes_added"] += 1
+                added = True
+            if added:
+                record["queue-votes"][queue].sort(key=when_order)
+                changed.add(key)
+    report["media_changed"] = len(changed)
+    return changed, report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge trakt_converter.py output into an existing ueue-media-tracking.json.")
+    parser.add_argument("source", help="Converter output (any --layout)")
+    parser.add_argument("target", help="Existing tracker data: ueue-media-tracking.json or a sharded directory")
+    parser.add_argument("-o", "--output", help="Write the merged data here instead of updating target in place")
+    parser.add_argument("--layout", choices=["backend", "sharded", "flat"],
+                        help="Layout to write (default: the target's own layout)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    parser.add_argument("--report", metavar="REPORT_JSON", help="Also write the change report (with changed keys) here")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+    source_data, source_queues, _ = read_output(args.source)
+    if os.path.exists(args.target):
+        target_data, target_queues, target_layout = read_output(args.target)
+    else:
+        logger.info(f"{args.target} does not exist yet; it will be created.")
+        target_data, target_queues, target_layout = {}, [], "backend"
+    changed, report = merge_outputs(target_data, source_data)
+    queues = merge_queues(target_queues + [q for q in source_queues if q not in target_queues], target_data)
+    report["queues_added"] = [q for q in queues if q not in target_queues]
+
+    logger.info(f"{report['new_media']} new media, {report['media_changed']} changed; "
+                f"{report['consumptions_added']} consumption(s) added, {report['consumptions_skipped']} already present; "
+                f"{report['votes_added']} queue vote(s) added, {report['votes_skipped']} already present; "
+                f"{report['meta_filled']} missing meta field(s) filled; new queues: {report['queues_added'] or 'none'}.")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(dict(report, changed_keys=sorted(changed)), f, indent=2, ensure_ascii=False)
+
+    output = args.output or args.target
+    layout = args.layout or target_layout
+    if args.dry_run:
+        logger.info("Dry run; nothing written.")
+    elif not changed and output == args.target and layout == target_layout and not report["queues_added"]:
+        logger.info(f"Nothing new; {args.target} left untouched.")
+    else:
+        # An in-place sharded merge only needs the changed shards rewritten.
+        in_place = output == args.target and layout == target_layout == "sharded"
+        write_output(output, layout, target_data, queues, changed if in_place else None)
+        logger.info(f"Merged data written to {output}.")
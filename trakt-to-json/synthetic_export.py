@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic Trakt export (watched/history-N.json and lists/watchlist-1.json) of a given size,
+plus a matching seed for wikidata_stub.py so most records resolve the way real ones do:
+  - most movies match on their Trakt slug (P8013), some only on IMDb (P345), some not at all
+  - most shows have a series episode list (P179), the rest resolve episodes by P8013 or fall back
+  - a few titles have ambiguous title-search results
+Output is deterministic for a given --seed.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+# Records per history-N.json file, like the real export's paging
+HISTORY_FILE_SIZE = 10000
+
+WORDS = ["night", "river", "ghost", "summer", "iron", "garden", "shadow", "paper", "moon", "glass",
+         "winter", "city", "last", "silent", "red", "golden", "broken", "wild", "hidden", "long"]
+
+def entity(qid, label, description):
+    return {"id": qid, "url": f"http://www.wikidata.org/entity/{qid}", "label": label, "description": description}
+
+def make_title(rng):
+    return " ".join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(1, 3)))
+
+def generate(records, out_dir, seed_path, rng):
+    movie_count = max(1, records // 4)
+    show_count = max(1, records // 200)
+    seed = {}
+    qid = [1000000]
+
+    def next_qid():
+        qid[0] += 1
+        return f"Q{qid[0]}"
+
+    movies = []
+    for i in range(movie_count):
+        title = make_title(rng)
+        year = rng.randint(1950, 2024)
+        movie = {"title": title, "year": year,
+                 "ids": {"trakt": 100000 + i, "slug": f"{title.lower().replace(' ', '-')}-{year}-{i}",
+                         "imdb": f"tt{2000000 + i}", "tmdb": 300000 + i}}
+        roll = rng.random()
+        match = entity(next_qid(), title, f"{year} film")
+        if roll < 0.75:
+            seed[f"prop:P8013|value:movies/{movie['ids']['slug']}"] = [match]
+        elif roll < 0.9:
+            seed[f"prop:P345|value:{movie['ids']['imdb']}"] = [match]
+        if rng.random() < 0.05:
+            seed[title] = [match, entity(next_qid(), title, "disambiguation page")]
+        movies.append(movie)
+
+    shows = []
+    for i in range(show_count):
+        title = make_title(rng)
+        show = {"title": title, "year": rng.randint(1980, 2024),
+                "ids": {"trakt": 500000 + i, "slug": f"{title.lower().replace(' ', '-')}-{i}",
+                        "imdb": f"tt{4000000 + i}", "tmdb": 600000 + i, "tvdb": 700000 + i}}
+        show_qid = next_qid()
+        seasons = rng.randint(1, 8)
+        episodes = []
+        for season in range(1, seasons + 1):
+            for number in range(1, rng.randint(6, 22) + 1):
+                episodes.append({"season": season, "number": number, "title": make_title(rng),
+                                 "ids": {"trakt": 9000000 + len(shows) * 1000 + len(episodes),
+                                         "imdb": f"tt{6000000 + len(shows) * 1000 + len(episodes)}"},
+                                 "qid": next_qid()})
+        roll = rng.random()
+        if roll < 0.8:
+            seed[f"prop:P8013|value:shows/{show['ids']['slug']}"] = [entity(show_qid, title, "television series")]
+            seed[f"series:{show_qid}"] = [dict(entity(ep["qid"], ep["title"], f"episode of {title}"),
+                                              season=ep["season"], number=ep["number"]) for ep in episodes]
+        elif roll < 0.9:
+            for ep in episodes:
+                seed[f"prop:P8013|value:shows/{show['ids']['slug']}/seasons/{ep['season']}/episodes/{ep['number']}"] = [
+                    entity(ep["qid"], ep["title"], f"episode of {title}")]
+        shows.append((show, episodes))
+
+    start = datetime(2015, 1, 1, tzinfo=timezone.utc)
+    history = []
+    for i in range(records):
+        when = (start + timedelta(minutes=rng.randint(0, 10 * 365 * 24 * 60))).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        if rng.random() < 0.5:
+            movie = rng.choice(movies)
+            history.append({"id": 10000000000 + i, "watched_at": when, "action": "watch", "type": "movie",
+                            "movie": movie, "application": {"id": 0}, "progress": 100.0, "duration": None})
+        else:
+            show, episodes = rng.choice(shows)
+            ep = rng.choice(episodes)
+            history.append({"id": 10000000000 + i, "watched_at": when, "action": "watch", "type": "episode",
+                            "episode": {k: v for k, v in ep.items() if k != "qid"}, "show": show,
+                            "application": {"id": 0}, "progress": 100.0, "duration": None})
+    history.sort(key=lambda rec: rec["watched_at"], reverse=True)
+
+    watchlist = []
+    for i in range(max(1, records // 20)):
+        when = (start + timedelta(minutes=rng.randint(0, 10 * 365 * 24 * 60))).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        if rng.random() < 0.7:
+            watchlist.append({"rank": i + 1, "id": 70000000 + i, "listed_at": when, "notes": None,
+                              "type": "movie", "movie": rng.choice(movies)})
+        else:
+            watchlist.append({"rank": i + 1, "id": 70000000 + i, "listed_at": when, "notes": None,
+                              "type": "show", "show": rng.choice(shows)[0]})
+
+    os.makedirs(os.path.join(out_dir, "watched"), exist_ok=True)
+    os.makedirs(os.path.join(out_dir, "lists"), exist_ok=True)
+    for n, start_index in enumerate(range(0, len(history), HISTORY_FILE_SIZE), 1):
+        with open(os.path.join(out_dir, "watched", f"history-{n}.json"), "w", encoding="utf-8") as f:
+            json.dump(history[start_index:start_index + HISTORY_FILE_SIZE], f, indent=2, ensure_ascii=False)
+    with open(os.path.join(out_dir, "lists", "watchlist-1.json"), "w", encoding="utf-8") as f:
+        json.dump(watchlist, f, indent=2, ensure_ascii=False)
+    with open(seed_path, "w", encoding="utf-8") as f:
+        json.dump(seed, f, ensure_ascii=False)
+    logger.info(f"Wrote {len(history)} history and {len(watchlist)} watchlist records to {out_dir} "
+                f"and {len(seed)} seed entries to {seed_path}.")
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic Trakt export and a matching Wikidata stub seed.")
+    parser.add_argument("out_dir", help="Directory to write the export into")
+    parser.add_argument("--records", type=int, default=1000, help="Number of history records (e.g. 1000, 10000, 100000)")
+    parser.add_argument("--seed-file", help="Where to write the stub seed (default <out_dir>/stub-seed.json)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    generate(args.records, args.out_dir, args.seed_file or os.path.join(args.out_dir, "stub-seed.json"),
+             random.Random(args.seed))
@@ -0,0 +1,47 @@
+"""
+Shared fixtures: a small synthetic Trakt export with a seeded wikidata_stub.py serving its
+entities, and converters wired to that stub with a fresh cache, so tests run offline.
+"""
+import os
+import random
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic_export
+import trakt_converter as tc
+import wikidata_stub
+
+# History records in the synthetic export (plus a watchlist of a twentieth of that)
+EXPORT_RECORDS = 120
+
+@pytest.fixture
+def export(tmp_path):
+    """(export directory, stub base URL) for a synthetic export and a stub seeded with its entities."""
+    export_dir = str(tmp_path / "export")
+    seed_file = str(tmp_path / "stub-seed.json")
+    synthetic_export.generate(EXPORT_RECORDS, export_dir, seed_file, random.Random(0))
+    server = wikidata_stub.make_server(seed_file, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield export_dir, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def make_converter(tmp_path, export):
+    """Factory for Converters (non-interactive unless asked) resolving against the stub, sharing one cache store."""
+    _, base_url = export
+    cache = tc.open_cache(str(tmp_path / "cache.sqlite3"), legacy_path=str(tmp_path / "no-legacy-cache.json"))
+    transport = tc.HttpTransport({base_url.split("//", 1)[1]: (1000.0, 100)})
+
+    def make(layout=tc.OUTPUT_LAYOUT, pause=None, **resolver_options):
+        resolver_options.setdefault("interactive", False)
+        resolver = tc.Resolver(cache, transport, sparql_url=f"{base_url}/sparql", api_url=f"{base_url}/w/api.php",
+                               **resolver_options)
+        return tc.Converter(resolver, layout=layout, pause=pause)
+    yield make
+    cache.close()
+    transport.close()
@@ -0,0 +1,32 @@
+import json
+import os
+import shutil
+
+import trakt_converter as tc
+from merge_tracking import merge_outputs
+
+def test_merge_reconversion_from_other_path_adds_nothing(tmp_path, export, make_converter):
+    export_dir, _ = export
+    first_output = str(tmp_path / "first.json")
+    make_converter().convert(export_dir, first_output)
+
+    # The same export, moved elsewhere and re-downloaded with shifted watchlist ranks.
+    moved_dir = str(tmp_path / "moved" / "trakt-export")
+    shutil.copytree(export_dir, moved_dir)
+    watchlist_file = os.path.join(moved_dir, "lists", "watchlist-1.json")
+    with open(watchlist_file, encoding="utf-8") as f:
+        watchlist = json.load(f)
+    for rec in watchlist:
+        rec["rank"] += 1
+    with open(watchlist_file, "w", encoding="utf-8") as f:
+        json.dump(watchlist, f)
+    second_output = str(tmp_path / "second.json")
+    make_converter().convert(moved_dir, second_output)
+
+    target, _, _ = tc.read_output(first_output)
+    source, _, _ = tc.read_output(second_output)
+    _, report = merge_outputs(target, source)
+    assert report["consumptions_added"] == 0
+    assert report["votes_added"] == 0
+    assert report["consumptions_skipped"] > 0
+    assert report["votes_skipped"] > 0
@@ -0,0 +1,33 @@
+import trakt_converter as tc
+import wikidata_dump_index as wdi
+
+def test_worker_closes_dump_index_after_each_job(tmp_path, export, make_converter, monkeypatch):
+    export_dir, _ = export
+    index_path = str(tmp_path / "ids.idx")
+    wdi.write_index(index_path, [f"P345{wdi.KEY_SEPARATOR}tt0000001\tQ1\n"], ["000000000001\tIndexed\t\n"])
+    with wdi.DumpIndex(index_path) as id_index:
+        config = make_converter(id_index=id_index).worker_config(2)
+
+    closed = []
+    close = wdi.DumpIndex.close
+    def record_close(index):
+        closed.append(index)
+        close(index)
+    monkeypatch.setattr(wdi.DumpIndex, "close", record_close)
+    monkeypatch.setattr(tc, "_worker_converter", None)
+    monkeypatch.setattr(tc, "_worker_id_index_path", None)
+
+    # Run the pool's initializer and jobs in this process so the worker's handles can be inspected.
+    tc.init_worker(config)
+    resolver = tc._worker_converter.resolver
+    try:
+        files = tc.export_files(export_dir)
+        for kind, filepath in files:
+            _, _, results, _ = tc.convert_file_job((kind, filepath, export_dir, set()))
+            assert results
+            assert resolver.id_index is None
+    finally:
+        resolver.cache.close()
+        resolver.transport.close()
+    assert len(closed) == len(files)
+    assert all(index.map.closed for index in closed)
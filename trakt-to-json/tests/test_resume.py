@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+import trakt_converter as tc
+
+def count_entries(output_data):
+    consumptions = sum(len(record.get("consumptions", [])) for record in output_data.values())
+    votes = sum(len(v) for record in output_data.values() for v in record.get("queue-votes", {}).values())
+    return consumptions, votes
+
+def test_resume_keeps_sharded_layout(tmp_path, export, make_converter):
+    export_dir, _ = export
+    output = str(tmp_path / "out")
+    make_converter(layout="sharded").convert(export_dir, output)
+    first, _, layout = tc.read_output(output)
+    assert layout == "sharded"
+
+    # Resuming without asking for the sharded layout again must not compact as backend.
+    make_converter(layout="backend").convert(export_dir, output, resume=True)
+    resumed, _, layout = tc.read_output(output)
+    assert layout == "sharded"
+    assert count_entries(resumed) == count_entries(first)
+    assert not os.path.exists(output + ".tmp")
+    assert not os.path.exists(output + ".journal")
+
+def test_failed_write_raises_and_resume_recovers(tmp_path, export, make_converter, monkeypatch):
+    export_dir, _ = export
+    output = str(tmp_path / "out.json")
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+    with monkeypatch.context() as m:
+        m.setattr(tc, "write_output", fail)
+        with pytest.raises(RuntimeError):
+            make_converter().convert(export_dir, output)
+    assert os.path.exists(output + ".journal")
+
+    make_converter().convert(export_dir, output, resume=True)
+    assert not os.path.exists(output + ".journal")
+    assert count_entries(tc.read_output(output)[0])[0] > 0
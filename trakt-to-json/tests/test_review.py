@@ -0,0 +1,26 @@
+def episode(rec_id, show_id, season, number, title):
+    return {"id": rec_id, "watched_at": f"2024-01-0{rec_id}T20:00:00.000Z", "type": "episode",
+            "episode": {"season": season, "number": number, "title": title, "ids": {"trakt": rec_id * 100}},
+            "show": {"title": f"Unlisted Show {show_id}", "year": 2001,
+                     "ids": {"trakt": 990000 + show_id, "slug": f"unlisted-show-{show_id}"}}}
+
+def test_deferred_review_groups_episodes_by_show(tmp_path, make_converter):
+    history = [
+        episode(1, 1, 1, 2, "Zebra Crossing"),
+        {"id": 2, "watched_at": "2024-01-02T20:00:00.000Z", "type": "movie",
+         "movie": {"title": "Unlisted Movie", "year": 1999, "ids": {"trakt": 880001, "slug": "unlisted-movie-1999"}}},
+        episode(3, 2, 1, 1, "Middle Ground"),
+        episode(4, 1, 1, 1, "Apple Cart"),
+        episode(5, 1, 1, 2, "Zebra Crossing"),
+    ]
+    asked = []
+    converter = make_converter(interactive=True, deferred_review=True, choose=lambda query, results: None,
+                               manual_entry=lambda fallback_url: asked.append(fallback_url))
+    converter.import_records(str(tmp_path / "out.json"), history)
+
+    show_1 = [url for url in asked if "/unlisted-show-1/" in url]
+    # One question per episode (the rewatch shares its question), the show's asked back to back in title order.
+    assert len(asked) == 4
+    assert [url.rsplit("/", 1)[-1] for url in show_1] == ["1", "2"]
+    start = asked.index(show_1[0])
+    assert asked[start:start + len(show_1)] == show_1
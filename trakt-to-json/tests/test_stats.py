@@ -0,0 +1,20 @@
+import trakt_converter as tc
+
+def test_operator_wait_is_its_own_stage(tmp_path, export, make_converter):
+    export_dir, _ = export
+    asked = []
+
+    def choose(query, results):
+        asked.append(query)
+        return results[0]
+
+    def manual_entry(fallback_url):
+        asked.append(fallback_url)
+        return None
+
+    stats = tc.RunStats(enabled=True)
+    converter = make_converter(interactive=True, choose=choose, manual_entry=manual_entry,
+                               pause=asked.append, stats=stats)
+    converter.convert(export_dir, str(tmp_path / "out.json"))
+    assert asked
+    assert "disambiguation_wait" in stats.report()["stage_seconds"]
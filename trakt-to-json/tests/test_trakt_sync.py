@@ -0,0 +1,100 @@
+import json
+import threading
+from collections import Counter
+
+import pytest
+
+import trakt_api_stub
+import trakt_converter as tc
+import trakt_sync
+
+HIDDEN = 10
+
+@pytest.fixture
+def trakt_stub(export):
+    """Factory starting trakt_api_stub.py on the export, minus the hide_newest latest plays; returns its URL."""
+    export_dir, _ = export
+    servers = []
+
+    def start(hide_newest=0):
+        server = trakt_api_stub.make_server(export_dir, port=0, hide_newest=hide_newest)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def run_sync(url, converter, output):
+    client = trakt_sync.TraktClient("test-client", None, url, page_size=50)
+    try:
+        return trakt_sync.sync(client, converter, output)
+    finally:
+        client.close()
+
+def history_ids(output):
+    output_data, _, layout = tc.read_output(output)
+    ids = [tc.history_id_from_note(c.get("note"))
+           for record in output_data.values() for c in record.get("consumptions", [])]
+    return Counter(ids), layout
+
+def read_state(output):
+    with open(output + trakt_sync.SYNC_STATE_SUFFIX, encoding="utf-8") as f:
+        return json.load(f)
+
+@pytest.mark.parametrize("layout", ["backend", "sharded"])
+def test_incremental_sync(tmp_path, trakt_stub, make_converter, layout):
+    output = str(tmp_path / ("out" if layout == "sharded" else "out.json"))
+    first = run_sync(trakt_stub(hide_newest=HIDDEN), make_converter(layout=layout), output)
+    before, found_layout = history_ids(output)
+    assert found_layout == layout
+    assert first["history_fetched"] == sum(before.values())
+
+    # Later plays show up; a converter defaulting to another layout must keep the output's own.
+    other = "sharded" if layout == "backend" else "backend"
+    second = run_sync(trakt_stub(), make_converter(layout=other), output)
+    after, found_layout = history_ids(output)
+    assert found_layout == layout
+    assert second["history_fetched"] < first["history_fetched"]
+    assert sum(after.values()) == sum(before.values()) + HIDDEN
+    assert max(after.values()) == 1
+    assert second["cursor"] > first["cursor"]
+    assert read_state(output)["cursor"] == second["cursor"]
+
+def test_failed_write_keeps_cursor(tmp_path, trakt_stub, make_converter, monkeypatch):
+    output = str(tmp_path / "out.json")
+    run_sync(trakt_stub(hide_newest=HIDDEN), make_converter(), output)
+    state = read_state(output)
+    before, _ = history_ids(output)
+
+    url = trakt_stub()
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+    with monkeypatch.context() as m:
+        m.setattr(tc, "write_output", fail)
+        with pytest.raises(RuntimeError):
+            run_sync(url, make_converter(), output)
+    assert read_state(output) == state
+    assert history_ids(output)[0] == before
+
+    # The next run picks the records up again (from the journal and the API).
+    run_sync(url, make_converter(), output)
+    after, _ = history_ids(output)
+    assert sum(after.values()) == sum(before.values()) + HIDDEN
+    assert max(after.values()) == 1
+
+def test_incremental_sync_only_checks_new_keys(tmp_path, trakt_stub, make_converter):
+    output = str(tmp_path / "out.json")
+    run_sync(trakt_stub(hide_newest=HIDDEN), make_converter(), output)
+
+    converter = make_converter()
+    checked = []
+    resolve_redirects = converter.resolver.resolve_redirects
+    def record_redirects(qids):
+        checked.extend(qids)
+        return resolve_redirects(qids)
+    converter.resolver.resolve_redirects = record_redirects
+    run_sync(trakt_stub(), converter, output)
+    output_data, _, _ = tc.read_output(output)
+    assert 0 < len(checked) <= HIDDEN < len(output_data)
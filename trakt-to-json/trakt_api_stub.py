@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Offline stand-in for the Trakt API sync endpoints trakt_sync.py uses, serving a Trakt export directory
+(watched/history-*.json and lists/watchlist-*.json) as the account's data:
+  /sync/last_activities   movies/episodes watched_at and watchlisted_at, derived from the records
+  /sync/history           newest first, paged (page, limit), filtered by start_at/end_at
+  /sync/watchlist         paged (page, limit)
+
+Paged responses carry Trakt's X-Pagination-* headers. Requests without a trakt-api-key header get
+401 and, with --require-token, requests without a Bearer token too.
+To simulate new activity between syncs, restart the stub on a larger export, or pass --hide-newest N
+to leave out the N most recent plays.
+
+Point trakt_sync.py at it with --trakt-url http://127.0.0.1:8098.
+GET /stats returns request counters; POST /stats returns and zeroes them.
+"""
+import argparse
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from trakt_converter import export_files, iter_json_array
+from trakt_sync import latest
+
+logger = logging.getLogger(__name__)
+
+# Page size when a request doesn't ask for one (Trakt's own default)
+DEFAULT_LIMIT = 10
+
+def load_export(export_dir, hide_newest=0):
+    """Load an export into {"history": [...] newest first, "watchlist": [...]}."""
+    data = {"history": [], "watchlist": []}
+    for kind, filepath in export_files(export_dir):
+        data[kind].extend(iter_json_array(filepath))
+    data["history"].sort(key=lambda rec: (rec.get("watched_at") or "", rec.get("id") or 0), reverse=True)
+    data["history"] = data["history"][hide_newest:]
+    return data
+
+def last_activities(data):
+    def newest(records, field, record_type):
+        return latest(*(rec.get(field) for rec in records if rec.get("type") == record_type))
+    history, watchlist = data["history"], data["watchlist"]
+    return {
+        "all": latest(*(rec.get("watched_at") for rec in history), *(rec.get("listed_at") for rec in watchlist)),
+        "movies": {"watched_at": newest(history, "watched_at", "movie"),
+                   "watchlisted_at": newest(watchlist, "listed_at", "movie")},
+        "episodes": {"watched_at": newest(history, "watched_at", "episode"),
+                     "watchlisted_at": newest(watchlist, "listed_at", "episode")},
+        "shows": {"watchlisted_at": newest(watchlist, "listed_at", "show")},
+        "seasons": {"watchlisted_at": newest(watchlist, "listed_at", "season")},
+    }
+
+class StubState:
+    def __init__(self, data, require_token):
+        self.data = data
+        self.require_token = require_token
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stats = {"requests": 0, "pages": 0, "items_sent": 0, "unauthorized": 0}
+
+    def count(self, **deltas):
+        with self.lock:
+            for name, delta in deltas.items():
+                self.stats[name] += delta
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def send_json(self, status, body, headers=None):
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def send_page(self, items, params):
+            page = max(1, int(params.get("page", ["1"])[0]))
+            limit = max(1, int(params.get("limit", [str(DEFAULT_LIMIT)])[0]))
+            page_count = max(1, -(-len(items) // limit))
+            chunk = items[(page - 1) * limit:page * limit]
+            state.count(pages=1, items_sent=len(chunk))
+            self.send_json(200, chunk, {
+                "X-Pagination-Page": str(page),
+                "X-Pagination-Limit": str(limit),
+                "X-Pagination-Page-Count": str(page_count),
+                "X-Pagination-Item-Count": str(len(items)),
+            })
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            params = parse_qs(parsed.query)
+            if parsed.path == "/stats":
+                with state.lock:
+                    stats = dict(state.stats)
+                self.send_json(200, stats)
+                return
+            state.count(requests=1)
+            authorized = self.headers.get("trakt-api-key") and (
+                not state.require_token or (self.headers.get("Authorization") or "").startswith("Bearer "))
+            if not authorized:
+                state.count(unauthorized=1)
+                self.send_json(401, {"error": "unauthorized"})
+                return
+            if parsed.path == "/sync/last_activities":
+                self.send_json(200, last_activities(state.data))
+            elif parsed.path == "/sync/history":
+                start_at = params.get("start_at", [""])[0]
+                end_at = params.get("end_at", [""])[0]
+                items = [rec for rec in state.data["history"]
+                         if (not start_at or (rec.get("watched_at") or "") >= start_at)
+                         and (not end_at or (rec.get("watched_at") or "") <= end_at)]
+                self.send_page(items, params)
+            elif parsed.path == "/sync/watchlist":
+                self.send_page(state.data["watchlist"], params)
+            else:
+                self.send_json(404, {"error": f"unknown path {parsed.path}"})
+
+        def do_POST(self):
+            if urlparse(self.path).path == "/stats":
+                with state.lock:
+                    stats = dict(state.stats)
+                state.reset()
+                self.send_json(200, stats)
+            else:
+                self.send_json(404, {"error": "not found"})
+    return Handler
+
+def make_server(export_dir, host="127.0.0.1", port=8098, hide_newest=0, require_token=False):
+    state = StubState(load_export(export_dir, hide_newest), require_token)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    logger.info(f"Serving {len(state.data['history'])} history and {len(state.data['watchlist'])} watchlist record(s) "
+                f"from {export_dir}.")
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve an offline stand-in for the Trakt API sync endpoints used by trakt_sync.py.")
+    parser.add_argument("export_dir", help="Trakt export directory to serve as the account's data")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8098)
+    parser.add_argument("--hide-newest", type=int, default=0, metavar="N",
+                        help="Leave out the N most recent plays (to sync them later by restarting without it)")
+    parser.add_argument("--require-token", action="store_true", help="Also require an OAuth Bearer token")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+    server = make_server(args.export_dir, args.host, args.port, args.hide_newest, args.require_token)
+    logger.info(f"Listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
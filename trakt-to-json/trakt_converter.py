@@ -1,71 +1,526 @@
 #!/usr/bin/env python3
+"""
+Convert a Trakt.tv export into the content tracker's JSON.
+
+Run it as a script (see --help), or use it as a library. All state lives in the objects, so a
+long-running process can keep one warm cache and resolver across many imports, and several
+independent converters can run side by side:
+
+    stats = RunStats(enabled=True)
+    cache = open_cache("wikidata_cache.sqlite3", stats=stats)
+    resolver = Resolver(cache, HttpTransport(stats=stats), interactive=False, stats=stats)
+    Converter(resolver).convert("trakt-export/user", "ueue-media-tracking.json")
+
+The cache store, HTTP transport and the operator decision callbacks (choose, manual_entry, pause)
+are injectable. The module-level constants below are only defaults.
+"""
 import os
 import json
 import glob
+import copy
+import sqlite3
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import logging
-from urllib.parse import quote
+import re
+import sys
+import unicodedata
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote, urlparse
 import argparse
+import cProfile
+import multiprocessing
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
 
 # --- CONFIGURATION ---
+#
+# Defaults for the Resolver, HttpTransport, OutputJournal and Converter settings of the same name.
 
 # Base URLs for fallback keys
 TRAKT_MOVIE_BASE = "https://trakt.tv/movies"
 TRAKT_EPISODE_BASE = "https://trakt.tv/shows"
 
+# Canonical form of Wikidata record keys (what the site looks records up by)
+WIKIDATA_ENTITY_BASE = "http://www.wikidata.org/entity/"
+
+# Entities per wbgetentities request (the API's limit for normal clients)
+WBGETENTITIES_BATCH_SIZE = 50
+
+# Finish every run with a key canonicalization pass (normalize, follow redirects, retry fallbacks)
+CANONICALIZE_KEYS = True
+
+# ... and by filling missing meta titles/descriptions from wbgetentities
+ENRICH_META = True
+
 # The name of the queue used for watchlists
 WATCHLIST_QUEUE = "watchlist"
 
-# Delay between HTTP requests (in seconds) to be nice to the APIs
-QUERY_DELAY = 0.5
+# Wikidata endpoints used by the converter
+SPARQL_URL = "https://query.wikidata.org/sparql"
+API_URL = "https://www.wikidata.org/w/api.php"
+USER_AGENT = "TraktConverter/1.0 (https://example.org)"
+
+# Allowed request rate per endpoint host as (requests per second, burst size), to be nice to the APIs
+RATE_LIMITS = {
+    "query.wikidata.org": (2.0, 2),
+    "www.wikidata.org": (5.0, 5),
+}
+
+# Worker threads used for lookups in non-interactive mode (they share one connection pool)
+HTTP_WORKERS = 4
+
+# Retries (with exponential backoff or the server's Retry-After) on 429/5xx responses
+HTTP_MAX_RETRIES = 5
+HTTP_BACKOFF_BASE = 1.0
+
+# Output layout: "backend" writes the site's ueue-media-tracking.json schema ({media, meta: {queues}}),
+# "sharded" writes the same data as a directory of shard files plus a manifest, "flat" the old {key: record}
+OUTPUT_LAYOUT = "backend"
+
+# Sharded layout: Wikidata records go to shard "QID number mod SHARD_COUNT", everything else to "other"
+SHARD_COUNT = 100
+SHARD_MANIFEST = "manifest.json"
+SHARD_DIR = "media"
+
+# Number of journaled records between compactions of the output JSON
+JOURNAL_COMPACT_EVERY = 500
+
+# Characters read at a time when streaming Trakt export files
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Number of values resolved per batched SPARQL VALUES query during prefetch
+PREFETCH_BATCH_SIZE = 200
+
+# Resolve episodes through their show's full episode list (one query per show) before per-episode IDs
+SERIES_LOOKUP = True
+
+# Cache database for Wikidata API responses (for both SPARQL and wbsearchentities)
+CACHE_FILENAME = "wikidata_cache.sqlite3"
+
+# Legacy whole-file JSON cache, migrated into CACHE_FILENAME on first run
+LEGACY_CACHE_FILENAME = "wikidata_cache.json"
+
+# How long cached matches and cached "no match" results stay valid (in seconds, None = forever)
+CACHE_MAX_AGE = None
+NEGATIVE_CACHE_MAX_AGE = 30 * 24 * 3600
+
+# Local title index over every label in the cache, searched before wbsearchentities
+TITLE_INDEX = True
+
+# Local title matches below this similarity (0-1, trigram Dice coefficient) are ignored
+TITLE_INDEX_MIN_SCORE = 0.6
+
+# Most local title matches offered for one search
+TITLE_INDEX_LIMIT = 10
 
-# Cache file for Wikidata API responses (for both SPARQL and wbsearchentities)
-CACHE_FILENAME = "wikidata_cache.json"
+# Interactive runs look up this many upcoming records in the background while a prompt is open (0 = off)
+LOOKAHEAD_RECORDS = 5
 
-# Global cache dictionary.
-wikidata_cache = {}
+# Export files converted in parallel worker processes with --jobs (1 = in this process)
+JOBS = 1
 
-# Global flag for interactive mode
+# Interactive mode: ambiguous and unmatched records are asked about as they come up
 INTERACTIVE_MODE = True
 
+# Deferred review: ambiguous/unmatched records are queued instead of prompted for
+DEFERRED_REVIEW = False
+
 # --- LOGGING CONFIGURATION ---
-logging.basicConfig(
-    level=logging.INFO,  # Set to INFO; DEBUG messages won't be shown by default.
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
+# (basicConfig is only applied when run as a script, so importing the module leaves logging alone)
 logger = logging.getLogger(__name__)
 
+# --- RUN STATISTICS ---
+#
+# With --stats, the converter records per-stage wall time, cache hit/miss/negative counts,
+# HTTP latency per endpoint and the candidate tier each record was resolved at, and writes
+# them as a JSON report at the end. Stage times are summed over worker threads, so with
+# concurrent lookups they can add up to more than the total wall time.
+
+class RunStats:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stage_seconds = defaultdict(float)
+        self.cache = defaultdict(Counter)
+        self.http_latency = defaultdict(list)
+        self.http_status = defaultdict(Counter)
+        self.tiers = Counter()
+        self.counters = Counter()
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.stage_seconds[name] += elapsed
+
+    def cache_event(self, namespace, event):
+        """event is "hit", "negative" (cached empty result) or "miss"."""
+        if self.enabled:
+            with self.lock:
+                self.cache[namespace][event] += 1
+
+    def http(self, host, seconds, status):
+        if self.enabled:
+            with self.lock:
+                self.http_latency[host].append(seconds)
+                self.http_status[host][str(status)] += 1
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += amount
+
+    def tier(self, tier):
+        if self.enabled:
+            with self.lock:
+                self.tiers[tier] += 1
+
+    def snapshot(self):
+        """Picklable raw counters, for a worker process to hand back to the parent."""
+        with self.lock:
+            return {
+                "stage_seconds": dict(self.stage_seconds),
+                "cache": {namespace: dict(events) for namespace, events in self.cache.items()},
+                "http_latency": {host: list(values) for host, values in self.http_latency.items()},
+                "http_status": {host: dict(status) for host, status in self.http_status.items()},
+                "tiers": dict(self.tiers),
+                "counters": dict(self.counters),
+            }
+
+    def merge(self, snapshot):
+        """Add a worker's snapshot to these statistics."""
+        with self.lock:
+            for name, value in snapshot["stage_seconds"].items():
+                self.stage_seconds[name] += value
+            for namespace, events in snapshot["cache"].items():
+                self.cache[namespace].update(events)
+            for host, values in snapshot["http_latency"].items():
+                self.http_latency[host].extend(values)
+            for host, status in snapshot["http_status"].items():
+                self.http_status[host].update(status)
+            self.tiers.update(snapshot["tiers"])
+            self.counters.update(snapshot["counters"])
+
+    def reset(self):
+        self.__init__(self.enabled)
+
+    def report(self):
+        def percentile(sorted_values, fraction):
+            return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+        http = {}
+        for host, latencies in self.http_latency.items():
+            ordered = sorted(latencies)
+            http[host] = {
+                "requests": len(ordered),
+                "status": dict(self.http_status[host]),
+                "p50_ms": round(percentile(ordered, 0.5) * 1000, 1),
+                "p90_ms": round(percentile(ordered, 0.9) * 1000, 1),
+                "p99_ms": round(percentile(ordered, 0.99) * 1000, 1),
+                "max_ms": round(ordered[-1] * 1000, 1),
+            }
+        return {
+            "wall_seconds": round(time.perf_counter() - self.started, 3),
+            "stage_seconds": {name: round(value, 3) for name, value in sorted(self.stage_seconds.items())},
+            "cache": {namespace: dict(events) for namespace, events in sorted(self.cache.items())},
+            "http": http,
+            "tiers": dict(self.tiers.most_common()),
+            "counters": dict(self.counters),
+        }
+
 # --- CACHE FUNCTIONS ---
+#
+# The cache lives in a SQLite database with one row per lookup, so a miss costs a single
+# INSERT instead of re-serializing the whole cache. Property lookups and title searches are
+# kept in separate namespaces, and every row records when it was fetched so stale and
+# negative (empty) results can expire and be looked up again.
+
+CACHE_NS_PROP = "prop"
+CACHE_NS_TITLE = "title"
+CACHE_NS_RESOLUTION = "resolution"
+CACHE_NS_SERIES = "series"
+CACHE_NS_REDIRECT = "redirect"
+CACHE_NS_ENTITY = "entity"
+
+class CacheStore:
+    """
+    Lazily-loaded Wikidata response cache backed by SQLite.
+    Entries are read on demand and memoized in memory; writes go straight to disk.
+    Callables in listeners are called with (namespace, results) for every entry written,
+    which is how resolvers keep their local title index current. One store can be shared
+    by several resolvers.
+    """
+
+    def __init__(self, path, max_age=CACHE_MAX_AGE, negative_max_age=NEGATIVE_CACHE_MAX_AGE, stats=None):
+        self.path = path
+        self.max_age = max_age
+        self.negative_max_age = negative_max_age
+        self.stats = stats or RunStats()
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.memo = {}
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " results TEXT NOT NULL,"
+            " fetched_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self.conn.commit()
 
-def load_cache():
-    global wikidata_cache
-    if os.path.exists(CACHE_FILENAME):
+    def is_fresh(self, results, fetched_at):
+        max_age = self.max_age if results else self.negative_max_age
+        return max_age is None or time.time() - fetched_at <= max_age
+
+    def get(self, namespace, key):
+        """Return the cached result list, or None if missing or expired."""
+        with self.stats.stage("cache_lookup"), self.lock:
+            entry = self.memo.get((namespace, key))
+            if entry is None:
+                row = self.conn.execute(
+                    "SELECT results, fetched_at FROM entries WHERE namespace = ? AND key = ?",
+                    (namespace, key)).fetchone()
+                if row is None:
+                    return None
+                entry = (json.loads(row[0]), row[1])
+                self.memo[(namespace, key)] = entry
+        results, fetched_at = entry
+        if not self.is_fresh(results, fetched_at):
+            return None
+        return results
+
+    def put(self, namespace, key, results):
+        self.put_many(namespace, [(key, results)])
+
+    def put_many(self, namespace, items):
+        """Store several (key, results) pairs in one transaction."""
+        now = time.time()
+        with self.stats.stage("cache_write"), self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO entries (namespace, key, results, fetched_at) VALUES (?, ?, ?, ?)",
+                [(namespace, key, json.dumps(results, ensure_ascii=False), now) for key, results in items])
+            self.conn.commit()
+            for key, results in items:
+                self.memo[(namespace, key)] = (results, now)
+        for listener in list(self.listeners):
+            for key, results in items:
+                listener(namespace, results)
+
+    def rows(self, namespaces):
+        """(namespace, results) of every stored entry in the given namespaces."""
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT namespace, results FROM entries WHERE namespace IN ({', '.join('?' * len(namespaces))})",
+                list(namespaces)).fetchall()
+        return [(namespace, json.loads(results)) for namespace, results in rows]
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def prop_cache_key(prop, value):
+    return f"{prop}|{value}"
+
+def migrate_json_cache(json_path, store):
+    """
+    One-shot import of the legacy wikidata_cache.json into the SQLite store.
+    Keys shaped "prop:P|value:V" go to the prop namespace; everything else was a title search.
+    Entries are stamped with the JSON file's modification time, the best guess of when they were fetched.
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        legacy = json.load(f)
+    fetched_at = os.path.getmtime(json_path)
+    prop_rows, title_rows = [], []
+    for key, results in legacy.items():
+        if key.startswith("prop:") and "|value:" in key:
+            prop, value = key[len("prop:"):].split("|value:", 1)
+            prop_rows.append((CACHE_NS_PROP, prop_cache_key(prop, value), json.dumps(results, ensure_ascii=False), fetched_at))
+        else:
+            title_rows.append((CACHE_NS_TITLE, key, json.dumps(results, ensure_ascii=False), fetched_at))
+    with store.lock:
+        store.conn.executemany(
+            "INSERT OR IGNORE INTO entries (namespace, key, results, fetched_at) VALUES (?, ?, ?, ?)",
+            prop_rows + title_rows)
+        store.conn.commit()
+    logger.info(f"Migrated {len(prop_rows)} property and {len(title_rows)} title entries from {json_path}.")
+
+def open_cache(path=CACHE_FILENAME, legacy_path=LEGACY_CACHE_FILENAME, stats=None):
+    """
+    Open a cache store. On first run, the legacy JSON cache (if present) is migrated into it.
+    """
+    first_run = not os.path.exists(path)
+    store = CacheStore(path, stats=stats)
+    if first_run and legacy_path and os.path.exists(legacy_path):
         try:
-            with open(CACHE_FILENAME, "r", encoding="utf-8") as f:
-                wikidata_cache = json.load(f)
-            logger.info(f"Loaded cache with {len(wikidata_cache)} entries.")
+            migrate_json_cache(legacy_path, store)
         except Exception as e:
-            logger.error(f"Error loading cache: {e}")
-            wikidata_cache = {}
-    else:
-        wikidata_cache = {}
-        logger.info("No cache file found; starting with an empty cache.")
+            logger.error(f"Error migrating legacy cache {legacy_path}: {e}")
+    logger.info(f"Opened cache with {store.count()} entries.")
+    return store
 
-def save_cache():
-    try:
-        with open(CACHE_FILENAME, "w", encoding="utf-8") as f:
-            json.dump(wikidata_cache, f, indent=2, ensure_ascii=False)
-        logger.debug(f"Saved cache with {len(wikidata_cache)} entries.")
-    except Exception as e:
-        logger.error(f"Error saving cache: {e}")
+# --- HTTP ENGINE ---
+#
+# All Wikidata requests go through one keep-alive Session and a token bucket per endpoint host.
+# A 429/503 pauses every worker using that host (honouring Retry-After) and halves its rate,
+# which then creeps back up to the configured limit on successful requests.
+
+class TokenBucket:
+    """Thread-safe token bucket with a shared pause for server-requested backoff."""
+
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def backoff(self, delay):
+        """Pause the bucket for delay seconds and halve its rate."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+            self.tokens = 0
 
-def auto_save_cache():
-    """Helper to save the cache immediately."""
-    save_cache()
+    def recover(self):
+        """Step the rate back towards the configured maximum after a success."""
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 8)
+
+def make_session(workers, user_agent=USER_AGENT, pool_connections=len(RATE_LIMITS)):
+    """A keep-alive session whose connection pool is large enough for every worker."""
+    new_session = requests.Session()
+    new_session.headers["User-Agent"] = user_agent
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=workers)
+    new_session.mount("https://", adapter)
+    new_session.mount("http://", adapter)
+    return new_session
+
+def retry_after_seconds(response, attempt, backoff_base=HTTP_BACKOFF_BASE):
+    """Delay requested by the server's Retry-After header, else exponential backoff."""
+    header = response.headers.get("Retry-After")
+    if header:
+        try:
+            return max(0.0, float(header))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(header).timestamp() - time.time())
+            except Exception:
+                pass
+    return backoff_base * (2 ** attempt)
+
+class HttpTransport:
+    """
+    The rate-limited, retrying HTTP client resolvers send their requests through.
+    Anything with the same request(method, url, **kwargs) -> response interface can be
+    injected into a Resolver instead (e.g. a recording or offline transport).
+    """
+
+    def __init__(self, rate_limits=None, workers=HTTP_WORKERS, user_agent=USER_AGENT,
+                 max_retries=HTTP_MAX_RETRIES, backoff_base=HTTP_BACKOFF_BASE, stats=None):
+        self.rate_limits = dict(RATE_LIMITS if rate_limits is None else rate_limits)
+        self.workers = workers
+        self.user_agent = user_agent
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.stats = stats or RunStats()
+        self.session = make_session(workers, user_agent, max(1, len(self.rate_limits)))
+        self.rate_limiters = {}
+        self.rate_limiters_lock = threading.Lock()
+
+    def rate_limiter(self, url):
+        host = urlparse(url).netloc
+        with self.rate_limiters_lock:
+            if host not in self.rate_limiters:
+                rate, burst = self.rate_limits.get(host, (1.0, 1))
+                self.rate_limiters[host] = TokenBucket(rate, burst)
+            return self.rate_limiters[host]
+
+    def request(self, method, url, **kwargs):
+        """
+        Rate-limited request over the shared session.
+        Retries 429 and 5xx responses with backoff, then raises for any remaining HTTP error.
+        """
+        limiter = self.rate_limiter(url)
+        host = urlparse(url).netloc
+        for attempt in range(self.max_retries + 1):
+            with self.stats.stage("rate_limit_wait"):
+                limiter.acquire()
+            start = time.perf_counter()
+            with self.stats.stage("http"):
+                response = self.session.request(method, url, **kwargs)
+            self.stats.http(host, time.perf_counter() - start, response.status_code)
+            if response.status_code == 429 or response.status_code >= 500:
+                if attempt < self.max_retries:
+                    delay = retry_after_seconds(response, attempt, self.backoff_base)
+                    logger.warning(f"HTTP {response.status_code} from {host}; backing off {delay:.1f}s.")
+                    limiter.backoff(delay)
+                    continue
+            response.raise_for_status()
+            limiter.recover()
+            return response
+
+    def close(self):
+        self.session.close()
+
+def ordered_map(fn, items, workers=HTTP_WORKERS):
+    """
+    Like map(), but runs fn on a thread pool while yielding results in input order.
+    At most a few items per worker are in flight, so items can be a lazy generator.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for item in items:
+            in_flight.append(executor.submit(fn, item))
+            if len(in_flight) >= workers * 4:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
 
 # --- INTERACTIVE FUNCTIONS ---
+#
+# The default operator callbacks: a Resolver asks choose(query, results) to pick among several
+# matches and manual_entry(fallback_url) for a QID when nothing matched, and a Converter calls
+# pause(message) between records in interactive mode. Any callables with the same signatures
+# can be injected instead (e.g. a web UI, or canned answers).
+
+def prompt_input(prompt):
+    return input(prompt)
 
 def interactive_choose_from_results(query, results):
     """
@@ -77,7 +532,7 @@ def interactive_choose_from_results(query, results):
         label = r.get("label", "N/A")
         desc = r.get("description", "")
         logger.info(f"  [{i}] id: {r.get('id')}  label: {label}  description: {desc}")
-    selection = input("Enter the number of the correct result (or press Enter for none): ").strip()
+    selection = prompt_input("Enter the number of the correct result (or press Enter for none): ").strip()
     if selection == "":
         logger.debug("No selection made by the user.")
         return None
@@ -101,132 +556,107 @@ def prompt_manual_entry(fallback_url):
     prompt = (f"No Wikidata match was found using any candidate or title search.\n"
               f"Fallback will be: {fallback_url}\n"
               "Enter a Wikidata entity id (e.g., Q12345) manually to override, or press Enter to use the fallback: ")
-    manual = input(prompt).strip()
+    manual = prompt_input(prompt).strip()
     if manual:
         logger.info(f"User manually entered entity id: {manual}")
-        return {"url": f"https://www.wikidata.org/wiki/{manual}", "label": "", "description": ""}
+        return {"url": canonical_key(f"https://www.wikidata.org/wiki/{manual}"), "label": "", "description": ""}
     return None
 
-# --- FUNCTIONS FOR WIKIDATA LOOKUP VIA SPARQL ---
-
-def wikidata_lookup_by_property(prop, value):
-    """
-    Look up a Wikidata entity by a specific property using SPARQL.
-    Returns a list of results, each as a dict with keys 'id', 'url', 'label', and 'description'.
-    Results are cached.
-    """
-    norm_value = value.strip()
-    cache_key = f"prop:{prop}|value:{norm_value}"
-    if cache_key in wikidata_cache:
-        logger.debug(f"Cache hit for key '{cache_key}'.")
-        return wikidata_cache[cache_key].copy()
-    
-    query = f"""
-    SELECT ?item ?itemLabel ?itemDescription WHERE {{
-      ?item wdt:{prop} "{norm_value}" .
-      SERVICE wikibase:label {{ bd:serviceParam wikibase:language "en". }}
-    }}
-    """
-    url = "https://query.wikidata.org/sparql"
-    params = {"query": query, "format": "json"}
-    logger.debug(f"Performing SPARQL query for {prop} with value '{norm_value}'.")
-    try:
-        response = requests.get(url, params=params, headers={'User-Agent': 'TraktConverter/1.0 (https://example.org)'})
-        response.raise_for_status()
-        data = response.json()
-        results = []
-        for binding in data.get("results", {}).get("bindings", []):
-            item_url = binding.get("item", {}).get("value")
-            if item_url:
-                entity_id = item_url.rsplit("/", 1)[-1]
-                label_val = binding.get("itemLabel", {}).get("value", "")
-                desc_val = binding.get("itemDescription", {}).get("value", "")
-                results.append({
-                    "id": entity_id,
-                    "url": item_url,
-                    "label": label_val,
-                    "description": desc_val
-                })
-        wikidata_cache[cache_key] = results  # Cache even empty responses.
-        auto_save_cache()
-        logger.debug(f"SPARQL query complete. Found {len(results)} result(s) for {prop}='{norm_value}'.")
-        time.sleep(QUERY_DELAY)
-        return results.copy()
-    except Exception as e:
-        logger.error(f"Error in SPARQL query for {prop}='{norm_value}': {e}")
-        wikidata_cache[cache_key] = []
-        auto_save_cache()
-        return []
-
-# --- FUNCTIONS FOR TITLE LOOKUP VIA wbsearchentities ---
-
-def wikidata_search_by_title(title):
-    """
-    Fallback title search using wbsearchentities.
-    Returns a list of results, each as a dict with keys 'id', 'url', 'label', and 'description' (if available).
-    """
-    norm_title = title.strip()
-    if norm_title in wikidata_cache:
-        logger.debug(f"Cache hit for title '{norm_title}'.")
-        return wikidata_cache[norm_title].copy()
-    
-    url = "https://www.wikidata.org/w/api.php"
-    params = {
-        "action": "wbsearchentities",
-        "format": "json",
-        "language": "en",
-        "search": norm_title,
-        "type": "item"
-    }
-    logger.debug(f"Performing title search for '{norm_title}'.")
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        results_raw = response.json().get("search", [])
-        results = []
-        for item in results_raw:
-            entity_id = item.get("id")
-            url_val = f"https://www.wikidata.org/wiki/{entity_id}" if entity_id else ""
-            results.append({
-                "id": entity_id,
-                "url": url_val,
-                "label": item.get("label", ""),
-                "description": item.get("description", "")
-            })
-        wikidata_cache[norm_title] = results
-        auto_save_cache()
-        logger.debug(f"Title search complete. Found {len(results)} result(s) for '{norm_title}'.")
-        time.sleep(QUERY_DELAY)
-        return results.copy()
-    except Exception as e:
-        logger.error(f"Error performing title search for '{norm_title}': {e}")
-        wikidata_cache[norm_title] = []
-        auto_save_cache()
-        return []
+# --- STREAMING EXPORT READER ---
+
+def iter_json_array(filepath, stats=None):
+    """
+    Incrementally yield the elements of a top-level JSON array file, one record at a time.
+    Only the current record plus one read chunk is held in memory, so large history
+    files never need to be loaded whole. Raises json.JSONDecodeError on malformed input.
+    """
+    decoder = json.JSONDecoder()
+    with open(filepath, "r", encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        eof = False
+
+        def fill():
+            nonlocal buf, pos, eof
+            chunk = f.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                eof = True
+            buf = buf[pos:] + chunk
+            pos = 0
+
+        def skip_whitespace():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos].isspace():
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill()
 
-# --- KEY DETERMINATION FUNCTION ---
+        skip_whitespace()
+        if pos >= len(buf) or buf[pos] != "[":
+            raise json.JSONDecodeError("Expected a JSON array", buf, pos)
+        pos += 1
+        first = True
+        while True:
+            skip_whitespace()
+            if pos >= len(buf):
+                raise json.JSONDecodeError("Unterminated JSON array", buf, pos)
+            if buf[pos] == "]":
+                return
+            if not first:
+                if buf[pos] != ",":
+                    raise json.JSONDecodeError("Expected ',' between array elements", buf, pos)
+                pos += 1
+                skip_whitespace()
+            with stats.stage("file_load") if stats else nullcontext():
+                while True:
+                    try:
+                        record, end = decoder.raw_decode(buf, pos)
+                    except json.JSONDecodeError:
+                        if eof:
+                            raise
+                        fill()
+                        continue
+                    if end == len(buf) and not eof:
+                        # A bare number could continue in the next chunk; read more and re-parse.
+                        fill()
+                        continue
+                    break
+            pos = end
+            first = False
+            yield record
+
+def export_files(export_dir):
+    """
+    (kind, filepath) for the history and watchlist files of a Trakt export, in conversion order:
+    history before watchlist, and history-2.json before history-10.json.
+    """
+    def page_number(filepath):
+        digits = re.findall(r"\d+", os.path.basename(filepath))
+        return (int(digits[-1]) if digits else 0, filepath)
+    patterns = [("history", os.path.join(export_dir, "watched", "history-*.json")),
+                ("watchlist", os.path.join(export_dir, "lists", "watchlist-*.json"))]
+    return [(kind, filepath) for kind, pattern in patterns
+            for filepath in sorted(glob.glob(pattern), key=page_number)]
+
+def iter_export_records(export_dir, stats=None):
+    """Yield (kind, record) for every record in the history and watchlist files of a Trakt export."""
+    for kind, filepath in export_files(export_dir):
+        try:
+            for rec in iter_json_array(filepath, stats):
+                yield kind, rec
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading file {filepath}: {e}")
+
+# --- CANDIDATES AND IDENTITIES ---
 #
-# Now returns a dict with "key" and "meta". If a Wikidata match is found, meta holds the title/description.
-# Otherwise meta is set to empty strings.
-
-def get_wikidata_key(trakt_obj, content_type, extra=None):
-    """
-    Try candidate lookups in this order:
-      For movies:
-         1. Trakt.tv ID (P8013): "movies/{slug}"
-         2. Trakt.tv film ID (P12492): trakt id
-         3. IMDb (P345)
-         4. TMDB (P4947)
-         5. TVDB (P12196)
-      For episodes:
-         1. Trakt.tv ID (P8013): "shows/{show_slug}/seasons/{season}/episodes/{number}"
-         2. IMDb (P345), then TMDB (P4947), then TVDB (P12196)
-      For shows:
-         1. Trakt.tv ID (P8013): "shows/{slug}"
-         2. Then IMDb, TMDB, TVDB.
-    Then perform a title search if running interactively.
-    In non-interactive mode, the title search is skipped.
-    Returns the Wikidata entity info as a dict if found, or None.
+# Pure helpers shared by the resolver, the prefetch phase and the output passes.
+
+def build_candidates(trakt_obj, content_type, extra=None):
+    """
+    Build the ordered list of (label, property, value) candidates for a Trakt object.
+    Shared by get_wikidata_key and the prefetch phase so both try the exact same values.
     """
     candidates = []
     ids = trakt_obj.get("ids", {})
@@ -238,278 +668,1846 @@ def get_wikidata_key(trakt_obj, content_type, extra=None):
         trakt_id = ids.get("trakt")
         if trakt_id:
             candidates.append(("trakt_film", "P12492", str(trakt_id)))
-        imdb = ids.get("imdb")
-        if imdb:
-            candidates.append(("imdb", "P345", imdb))
-        tmdb = ids.get("tmdb")
-        if tmdb:
-            candidates.append(("tmdb", "P4947", str(tmdb)))
-        tvdb = ids.get("tvdb")
-        if tvdb:
-            candidates.append(("tvdb", "P12196", str(tvdb)))
     elif content_type == "episode":
         show_slug = extra.get("ids", {}).get("slug") if extra else None
         season = trakt_obj.get("season")
         number = trakt_obj.get("number")
         if show_slug and season is not None and number is not None:
             candidates.append(("trakt", "P8013", f"shows/{show_slug}/seasons/{season}/episodes/{number}"))
-        imdb = ids.get("imdb")
-        if imdb:
-            candidates.append(("imdb", "P345", imdb))
-        tmdb = ids.get("tmdb")
-        if tmdb:
-            candidates.append(("tmdb", "P4947", str(tmdb)))
-        tvdb = ids.get("tvdb")
-        if tvdb:
-            candidates.append(("tvdb", "P12196", str(tvdb)))
     elif content_type == "show":
         slug = ids.get("slug")
         if slug:
             candidates.append(("trakt", "P8013", f"shows/{slug}"))
-        imdb = ids.get("imdb")
-        if imdb:
-            candidates.append(("imdb", "P345", imdb))
-        tmdb = ids.get("tmdb")
-        if tmdb:
-            candidates.append(("tmdb", "P4947", str(tmdb)))
-        tvdb = ids.get("tvdb")
-        if tvdb:
-            candidates.append(("tvdb", "P12196", str(tvdb)))
-    
-    # Try each candidate.
-    for label, prop, value in candidates:
-        logger.info(f"Searching Wikidata using {label.upper()} (property {prop}) with value '{value}'.")
-        results = wikidata_lookup_by_property(prop, value)
-        if results:
-            if len(results) == 1:
-                candidate = results[0]
-                logger.info(f"Found unique candidate match: {candidate['url']} for {label.upper()}='{value}'.")
-                return candidate
-            elif len(results) > 1:
-                if INTERACTIVE_MODE:
-                    logger.info(f"\nCandidate {label.upper()} lookup for value '{value}' returned {len(results)} results.")
-                    chosen = interactive_choose_from_results(f"{prop} {value}", results)
-                    if chosen:
-                        logger.info(f"User selected candidate: {chosen['url']} for {label.upper()}='{value}'.")
-                        return chosen
+    else:
+        return candidates
+
+    imdb = ids.get("imdb")
+    if imdb:
+        candidates.append(("imdb", "P345", imdb))
+    tmdb = ids.get("tmdb")
+    if tmdb:
+        candidates.append(("tmdb", "P4947", str(tmdb)))
+    tvdb = ids.get("tvdb")
+    if tvdb:
+        candidates.append(("tvdb", "P12196", str(tvdb)))
+    return candidates
+
+def record_candidates(trakt_record):
+    """
+    Build the candidate list for a whole Trakt history/watchlist record
+    (the same object determine_key passes on to get_wikidata_key).
+    """
+    record_type = trakt_record.get("type")
+    if record_type == "movie" and trakt_record.get("movie"):
+        return build_candidates(trakt_record["movie"], "movie")
+    if record_type == "episode" and trakt_record.get("episode") and trakt_record.get("show"):
+        return build_candidates(trakt_record["episode"], "episode", extra=trakt_record["show"])
+    if record_type == "show" and trakt_record.get("show"):
+        return build_candidates(trakt_record["show"], "show")
+    return []
+
+def record_subject(trakt_record):
+    """The Trakt object a record's title fallback searches for (movie, episode or show)."""
+    return trakt_record.get(trakt_record.get("type")) or {}
+
+def trakt_identity(trakt_record):
+    """
+    A stable identity for the Trakt object a record refers to, e.g. "movie:85630" or
+    "episode:1424:18:22". Returns None when the record has no usable ids.
+    """
+    record_type = trakt_record.get("type")
+    if record_type in ("movie", "show"):
+        ids = (trakt_record.get(record_type) or {}).get("ids", {})
+        ident = ids.get("trakt") or ids.get("slug")
+        return f"{record_type}:{ident}" if ident else None
+    if record_type == "episode":
+        episode = trakt_record.get("episode") or {}
+        show_ids = (trakt_record.get("show") or {}).get("ids", {})
+        show_ident = show_ids.get("trakt") or show_ids.get("slug")
+        season = episode.get("season")
+        number = episode.get("number")
+        if show_ident and season is not None and number is not None:
+            return f"episode:{show_ident}:{season}:{number}"
+    return None
+
+def show_identity(show):
+    if not show:
+        return None
+    ids = show.get("ids", {})
+    return ids.get("trakt") or ids.get("slug")
+
+def ordinal(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+def sparql_string_literal(value):
+    """Escape a value for use as a quoted SPARQL string literal."""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def add_review_options(review, source, results):
+    """Collect lookup results as options for a deferred review question, skipping duplicates."""
+    seen = {o.get("id") for o in review["options"]}
+    for r in results:
+        if r.get("id") not in seen:
+            review["options"].append(dict(r, source=source))
+            seen.add(r.get("id"))
+
+# --- KEY CANONICALIZATION ---
+#
+# Record keys are Wikidata entity URLs in one canonical form, WIKIDATA_ENTITY_BASE + QID, which is
+# what the site builds when it looks a record up. Older outputs (and cached resolutions) can hold
+# https://www.wikidata.org/wiki/Q… keys from title search and manual entry, QIDs that have since
+# been merged into another item (redirects), and trakt.tv fallback URLs for records that didn't
+# resolve at the time. Resolver.canonicalize_output rewrites all of them: URL forms are normalized,
+# QIDs are followed through redirects with batched wbgetentities calls, trakt.tv fallbacks are
+# retried against the resolver, and records that end up under the same key are merged into one.
+
+WIKIDATA_KEY_RE = re.compile(r"^https?://(?:www\.|m\.)?wikidata\.org/(?:wiki/(?:Special:EntityPage/)?|entity/)(Q\d+)/?$", re.I)
+
+def entity_url(qid):
+    return f"{WIKIDATA_ENTITY_BASE}{qid}"
+
+def canonical_key(key):
+    """WIKIDATA_ENTITY_BASE + QID for any form of Wikidata entity URL; other keys are returned unchanged."""
+    match = WIKIDATA_KEY_RE.match(key or "")
+    return entity_url(match.group(1).upper()) if match else key
+
+def key_qid(key):
+    """The QID of a canonical Wikidata key, or None."""
+    return key[len(WIKIDATA_ENTITY_BASE):] if key.startswith(WIKIDATA_ENTITY_BASE) else None
+
+def merge_records(into, other):
+    """Fold record other into record into: fill missing meta, keep both notes, union the entries."""
+    meta = into.setdefault("meta", {})
+    for field, value in other.get("meta", {}).items():
+        if value and not meta.get(field):
+            meta[field] = value
+    notes = [n for n in (into.get("notes", ""), other.get("notes", "")) if n]
+    into["notes"] = "\n".join(dict.fromkeys(notes))
+    seen = {(c.get("when"), c.get("note")) for c in into.setdefault("consumptions", [])}
+    for consumption in other.get("consumptions", []):
+        if (consumption.get("when"), consumption.get("note")) not in seen:
+            into["consumptions"].append(consumption)
+            seen.add((consumption.get("when"), consumption.get("note")))
+    for queue, votes in other.get("queue-votes", {}).items():
+        existing = into.setdefault("queue-votes", {}).setdefault(queue, [])
+        seen = {(v.get("when"), v.get("note")) for v in existing}
+        for vote in votes:
+            if (vote.get("when"), vote.get("note")) not in seen:
+                existing.append(vote)
+                seen.add((vote.get("when"), vote.get("note")))
+
+# --- LOCAL TITLE INDEX ---
+#
+# Every entity label the cache has seen (property lookups, series episode lists, earlier title
+# searches, wbgetentities answers and resolved records) is indexed in memory, so the title
+# fallback can offer local candidates without a wbsearchentities round trip. Labels are
+# normalized (case, accents and punctuation folded) and split into character trigrams; a search
+# ranks entities by the Dice coefficient of their trigram sets, exact normalized matches first.
+# The index is built from the cache on the first title search and kept current as new results
+# are cached.
+
+TITLE_INDEX_NAMESPACES = (CACHE_NS_PROP, CACHE_NS_TITLE, CACHE_NS_SERIES, CACHE_NS_ENTITY, CACHE_NS_RESOLUTION)
+
+def normalize_title(title):
+    """Casefold, strip accents and reduce punctuation/whitespace to single spaces."""
+    decomposed = unicodedata.normalize("NFKD", title or "")
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+    return " ".join(re.findall(r"\w+", stripped))
+
+def title_trigrams(normalized):
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class TitleIndex:
+    def __init__(self, stats=None):
+        self.stats = stats or RunStats()
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.entities = {}
+        self.by_label = defaultdict(set)
+        self.by_trigram = defaultdict(set)
+        self.trigram_counts = {}
+
+    def add(self, qid, label, description=""):
+        """Index one entity label. An entity can be indexed under several labels."""
+        normalized = normalize_title(label)
+        if not qid or not normalized:
+            return
+        entity = self.entities.setdefault(qid, {"id": qid, "label": label, "description": description})
+        if description and not entity["description"]:
+            entity["description"] = description
+        if qid in self.by_label[normalized]:
+            return
+        self.by_label[normalized].add(qid)
+        trigrams = title_trigrams(normalized)
+        self.trigram_counts[(qid, normalized)] = len(trigrams)
+        for trigram in trigrams:
+            self.by_trigram[trigram].add((qid, normalized))
+
+    def add_results(self, results):
+        for r in results:
+            self.add(r.get("id"), r.get("label", ""), r.get("description", ""))
+
+    def add_cached(self, namespace, results):
+        """Cache listener: index an entry's results, if the index has been built yet (otherwise load() will)."""
+        if not self.loaded or namespace not in TITLE_INDEX_NAMESPACES:
+            return
+        with self.lock:
+            if namespace == CACHE_NS_RESOLUTION:
+                self.add_resolution(results)
+            else:
+                self.add_results(results)
+
+    def add_resolution(self, resolution):
+        key = resolution.get("key", "")
+        title = resolution.get("meta", {}).get("title", "")
+        if "wikidata.org/" in key and title:
+            self.add(key.rsplit("/", 1)[-1], title, resolution["meta"].get("description", ""))
+
+    def load(self, store):
+        """Build the index from every label in the cache store (once)."""
+        with self.lock:
+            if self.loaded:
+                return
+            with self.stats.stage("title_index_build"):
+                rows = store.rows(TITLE_INDEX_NAMESPACES)
+                for namespace, results in rows:
+                    if namespace == CACHE_NS_RESOLUTION:
+                        self.add_resolution(results)
                     else:
-                        logger.info(f"No candidate confirmed for {label.upper()}='{value}'.")
+                        self.add_results(results)
+            self.loaded = True
+        logger.info(f"Built local title index with {len(self.entities)} entities from {len(rows)} cache entries.")
+
+    def search(self, title, limit=TITLE_INDEX_LIMIT, min_score=TITLE_INDEX_MIN_SCORE):
+        """
+        Local candidates for a title, best first, shaped like Resolver.search_by_title's results
+        with an extra 'score'. Returns an empty list when nothing is similar enough.
+        """
+        normalized = normalize_title(title)
+        if not normalized:
+            return []
+        trigrams = title_trigrams(normalized)
+        with self.lock:
+            shared = Counter()
+            for trigram in trigrams:
+                shared.update(self.by_trigram.get(trigram, ()))
+            scores = {}
+            for (qid, label), count in shared.items():
+                score = 1.0 if label == normalized else 2 * count / (len(trigrams) + self.trigram_counts[(qid, label)])
+                if score >= min_score and score > scores.get(qid, 0):
+                    scores[qid] = score
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], self.entities[item[0]]["label"]))[:limit]
+            return [dict(self.entities[qid], url=entity_url(qid), score=round(score, 3))
+                    for qid, score in ranked]
+
+# --- RESOLVER ---
+#
+# A Resolver turns Trakt records into record keys and meta. It owns everything a resolution
+# depends on: the cache store, the HTTP transport, an optional dump index, the resolution memo,
+# the show episode tables and the local title index, plus the operator callbacks. Nothing is
+# shared through module state, so resolvers with different caches, endpoints or modes can live
+# in one process, and one resolver can serve many conversions with its memo and cache warm.
+
+class Resolver:
+    def __init__(self, cache, transport=None, id_index=None, interactive=INTERACTIVE_MODE,
+                 deferred_review=DEFERRED_REVIEW, series_lookup=SERIES_LOOKUP, title_index=TITLE_INDEX,
+                 sparql_url=SPARQL_URL, api_url=API_URL, workers=HTTP_WORKERS,
+                 choose=interactive_choose_from_results, manual_entry=prompt_manual_entry, stats=None):
+        """
+        cache is a CacheStore (see open_cache). transport defaults to an HttpTransport with
+        workers connections; id_index is an optional wikidata_dump_index.DumpIndex.
+        choose(query, results) and manual_entry(fallback_url) are asked in interactive mode
+        and during the deferred review session, timed as the disambiguation_wait stage.
+        """
+        self.cache = cache
+        self.stats = stats or cache.stats
+        self.transport = transport or HttpTransport(workers=workers, stats=self.stats)
+        self.id_index = id_index
+        self.interactive = interactive
+        self.deferred_review = deferred_review
+        self.series_lookup = series_lookup
+        self.use_title_index = title_index
+        self.sparql_url = sparql_url
+        self.api_url = api_url
+        self.workers = workers
+        self.choose = choose
+        self.manual_entry = manual_entry
+        self.resolutions = {}
+        self.resolutions_lock = threading.Lock()
+        self.series_tables = {}
+        self.series_tables_lock = threading.Lock()
+        self.title_index = TitleIndex(self.stats)
+        self.cache.listeners.append(self.title_index.add_cached)
+
+    def map(self, fn, items):
+        """ordered_map over this resolver's worker count."""
+        return ordered_map(fn, items, self.workers)
+
+    def ask_choice(self, query, results):
+        """choose(query, results), timed as operator wait rather than resolver time."""
+        with self.stats.stage("disambiguation_wait"):
+            return self.choose(query, results)
+
+    def ask_manual_entry(self, fallback_url):
+        """manual_entry(fallback_url), timed as operator wait rather than resolver time."""
+        with self.stats.stage("disambiguation_wait"):
+            return self.manual_entry(fallback_url)
+
+    def close(self):
+        """Detach from the cache store (the cache and transport themselves stay open)."""
+        if self.title_index.add_cached in self.cache.listeners:
+            self.cache.listeners.remove(self.title_index.add_cached)
+
+    # --- SPARQL lookup ---
+
+    def lookup_by_property(self, prop, value):
+        """
+        Look up a Wikidata entity by a specific property using SPARQL.
+        Returns a list of results, each as a dict with keys 'id', 'url', 'label', and 'description'.
+        Results are cached. When a local dump index is set, it is consulted first and only
+        values it doesn't know go to the cache and the network.
+        """
+        norm_value = value.strip()
+        if self.id_index is not None:
+            indexed = self.id_index.lookup(prop, norm_value)
+            if indexed:
+                logger.debug(f"Dump index hit for {prop}='{norm_value}'.")
+                self.stats.cache_event(prop, "index")
+                return indexed
+        cache_key = prop_cache_key(prop, norm_value)
+        cached = self.cache.get(CACHE_NS_PROP, cache_key)
+        if cached is not None:
+            logger.debug(f"Cache hit for key '{cache_key}'.")
+            self.stats.cache_event(prop, "hit" if cached else "negative")
+            return cached.copy()
+        self.stats.cache_event(prop, "miss")
+
+        query = f"""
+        SELECT ?item ?itemLabel ?itemDescription WHERE {{
+          ?item wdt:{prop} {sparql_string_literal(norm_value)} .
+          SERVICE wikibase:label {{ bd:serviceParam wikibase:language "en". }}
+        }}
+        """
+        params = {"query": query, "format": "json"}
+        logger.debug(f"Performing SPARQL query for {prop} with value '{norm_value}'.")
+        try:
+            response = self.transport.request("GET", self.sparql_url, params=params)
+            data = response.json()
+            results = []
+            for binding in data.get("results", {}).get("bindings", []):
+                item_url = binding.get("item", {}).get("value")
+                if item_url:
+                    entity_id = item_url.rsplit("/", 1)[-1]
+                    label_val = binding.get("itemLabel", {}).get("value", "")
+                    desc_val = binding.get("itemDescription", {}).get("value", "")
+                    results.append({
+                        "id": entity_id,
+                        "url": item_url,
+                        "label": label_val,
+                        "description": desc_val
+                    })
+            self.cache.put(CACHE_NS_PROP, cache_key, results)  # Cache even empty responses.
+            logger.debug(f"SPARQL query complete. Found {len(results)} result(s) for {prop}='{norm_value}'.")
+            return results.copy()
+        except Exception as e:
+            # Not cached, so a transient failure is retried on the next run.
+            logger.error(f"Error in SPARQL query for {prop}='{norm_value}': {e}")
+            return []
+
+    # --- Batched prefetch via SPARQL VALUES ---
+
+    def lookup_batch(self, prop, values):
+        """
+        Resolve many values of one property with a single SPARQL query using a VALUES block.
+        Returns a dict mapping each value to its list of results (same shape as
+        lookup_by_property), or None if the request failed.
+        Values with no match map to an empty list.
+        """
+        values_clause = " ".join(sparql_string_literal(v) for v in values)
+        query = f"""
+        SELECT ?v ?item ?itemLabel ?itemDescription WHERE {{
+          VALUES ?v {{ {values_clause} }}
+          ?item wdt:{prop} ?v .
+          SERVICE wikibase:label {{ bd:serviceParam wikibase:language "en". }}
+        }}
+        """
+        logger.debug(f"Performing batched SPARQL query for {prop} with {len(values)} value(s).")
+        try:
+            # POST so large VALUES blocks don't run into URL length limits.
+            response = self.transport.request("POST", self.sparql_url, data={"query": query, "format": "json"})
+            data = response.json()
+        except Exception as e:
+            logger.error(f"Error in batched SPARQL query for {prop} ({len(values)} values): {e}")
+            return None
+
+        found = {v: [] for v in values}
+        for binding in data.get("results", {}).get("bindings", []):
+            value = binding.get("v", {}).get("value")
+            item_url = binding.get("item", {}).get("value")
+            if value not in found or not item_url:
+                continue
+            entity_id = item_url.rsplit("/", 1)[-1]
+            found[value].append({
+                "id": entity_id,
+                "url": item_url,
+                "label": binding.get("itemLabel", {}).get("value", ""),
+                "description": binding.get("itemDescription", {}).get("value", "")
+            })
+        return found
+
+    def prefetch_property_values(self, values_by_prop):
+        """
+        Fill the cache for every (property, value) pair not already cached,
+        issuing one batched query per PREFETCH_BATCH_SIZE values of each property.
+        Failed batches are left uncached so the per-record lookup can retry them.
+        Batches run concurrently on the worker pool. Values found in the dump index are
+        never queried.
+        Returns a dict mapping each (property, value) pair resolved to at least one result
+        to its number of results.
+        """
+        matched = {}
+        batches = []
+        for prop, values in values_by_prop.items():
+            pending = {}
+            for value in values:
+                norm_value = value.strip()
+                if self.id_index is not None:
+                    indexed = self.id_index.lookup(prop, norm_value)
+                    if indexed:
+                        matched[(prop, norm_value)] = len(indexed)
+                        continue
+                cached = self.cache.get(CACHE_NS_PROP, prop_cache_key(prop, norm_value))
+                if cached is not None:
+                    if cached:
+                        matched[(prop, norm_value)] = len(cached)
                 else:
-                    candidate = results[0]
-                    logger.info(f"Found candidate match (non-interactive): {candidate['url']} for {label.upper()}='{value}'.")
-                    return candidate
-    # Fallback: Title search.
-    title = trakt_obj.get("title")
-    if title:
-        if INTERACTIVE_MODE:
-            logger.info(f"Falling back to title search for '{title}'.")
-            results = wikidata_search_by_title(title)
+                    pending[norm_value] = None
+            if not pending:
+                continue
+            pending = list(pending)
+            self.stats.count(f"prefetched_{prop}", len(pending))
+            logger.info(f"Prefetching {len(pending)} uncached {prop} value(s) in batches of {PREFETCH_BATCH_SIZE}.")
+            for start in range(0, len(pending), PREFETCH_BATCH_SIZE):
+                batches.append((prop, pending[start:start + PREFETCH_BATCH_SIZE]))
+
+        for (prop, batch), found in zip(batches, self.map(lambda b: self.lookup_batch(*b), batches)):
+            if found is None:
+                continue
+            self.cache.put_many(CACHE_NS_PROP, [(prop_cache_key(prop, value), results)
+                                                for value, results in found.items()])
+            matched.update(((prop, value), len(results)) for value, results in found.items() if results)
+        return matched
+
+    def prefetch_candidate_lists(self, pending):
+        """
+        Resolve lists of candidates tier by tier: every list's first candidate is resolved,
+        then only lists still without a unique match move on to their next candidate.
+        """
+        tier = 0
+        while pending:
+            values_by_prop = {}
+            for candidates in pending:
+                _, prop, value = candidates[tier]
+                values_by_prop.setdefault(prop, []).append(value)
+            matched = self.prefetch_property_values(values_by_prop)
+            still_pending = []
+            for candidates in pending:
+                _, prop, value = candidates[tier]
+                unique = matched.get((prop, value.strip())) == 1
+                if not unique and len(candidates) > tier + 1:
+                    still_pending.append(candidates)
+            pending = still_pending
+            tier += 1
+
+    def prefetch_records(self, records):
+        """
+        Resolve the candidate external IDs of many records in bulk, before they are resolved
+        one by one. Candidates are prefetched tier by tier: every record's first candidate is
+        resolved, then only records still without a match (or with several matches, which may
+        be rejected interactively) move on to their next candidate.
+        Episodes are first looked up in their show's episode table (one query per show),
+        and only those it doesn't answer uniquely go through the per-episode candidates.
+        The per-record get_wikidata_key then only reads the prefilled cache.
+        """
+        pending = []
+        episodes = []
+        shows = {}
+        for rec in records:
+            with self.stats.stage("candidate_build"):
+                candidates = record_candidates(rec)
+            show_ident = show_identity(rec.get("show")) if rec.get("type") == "episode" else None
+            if self.series_lookup and show_ident and rec.get("episode"):
+                shows.setdefault(show_ident, rec["show"])
+                episodes.append((rec["show"], rec["episode"], candidates))
+            elif candidates:
+                pending.append(candidates)
+
+        if shows:
+            logger.info(f"Resolving episode tables for {len(shows)} show(s).")
+            self.prefetch_candidate_lists([c for c in (build_candidates(show, "show") for show in shows.values()) if c])
+            for _ in self.map(self.series_episode_table, shows.values()):
+                pass
+        for show, episode, candidates in episodes:
+            if candidates and len(self.lookup_series_episode(show, episode) or []) != 1:
+                pending.append(candidates)
+
+        logger.info(f"Prefetching Wikidata matches for {len(pending)} record(s).")
+        self.prefetch_candidate_lists(pending)
+
+    # --- Show-level episode resolution ---
+    #
+    # Rather than resolving each episode through its own external IDs, a show's QID is resolved
+    # once and all of its episodes are fetched in one query: items that are part of the series
+    # (P179) and of a season (P4908) carrying the episode number as a series ordinal (P1545),
+    # where the season in turn carries its season number the same way. The resulting
+    # (season, number) table answers every episode of that show locally.
+
+    def series_episodes(self, show_qid):
+        """
+        Fetch every episode of a series with its season and episode number.
+        Returns a list of result dicts (with extra 'season' and 'number' keys), or None on error.
+        Results are cached per series.
+        """
+        cached = self.cache.get(CACHE_NS_SERIES, show_qid)
+        if cached is not None:
+            logger.debug(f"Cache hit for series '{show_qid}'.")
+            self.stats.cache_event("series", "hit" if cached else "negative")
+            return cached
+        self.stats.cache_event("series", "miss")
+
+        query = f"""
+        SELECT ?item ?itemLabel ?itemDescription ?seasonNumber ?episodeNumber WHERE {{
+          ?item wdt:P179 wd:{show_qid} ;
+                p:P4908 ?seasonStatement .
+          ?seasonStatement ps:P4908 ?season ;
+                           pq:P1545 ?episodeNumber .
+          ?season p:P179 ?seriesStatement .
+          ?seriesStatement ps:P179 wd:{show_qid} ;
+                           pq:P1545 ?seasonNumber .
+          SERVICE wikibase:label {{ bd:serviceParam wikibase:language "en". }}
+        }}
+        """
+        logger.debug(f"Performing series episode query for {show_qid}.")
+        try:
+            response = self.transport.request("POST", self.sparql_url, data={"query": query, "format": "json"})
+            data = response.json()
+        except Exception as e:
+            logger.error(f"Error in series episode query for {show_qid}: {e}")
+            return None
+        episodes = []
+        for binding in data.get("results", {}).get("bindings", []):
+            item_url = binding.get("item", {}).get("value")
+            if not item_url:
+                continue
+            episodes.append({
+                "id": item_url.rsplit("/", 1)[-1],
+                "url": item_url,
+                "label": binding.get("itemLabel", {}).get("value", ""),
+                "description": binding.get("itemDescription", {}).get("value", ""),
+                "season": ordinal(binding.get("seasonNumber", {}).get("value")),
+                "number": ordinal(binding.get("episodeNumber", {}).get("value"))
+            })
+        self.cache.put(CACHE_NS_SERIES, show_qid, episodes)
+        logger.debug(f"Series episode query complete. Found {len(episodes)} episode(s) for {show_qid}.")
+        return episodes
+
+    def resolve_show_qid(self, show):
+        """The show's QID if one of its candidates matches exactly one item, else None (never guesses)."""
+        for label, prop, value in build_candidates(show, "show"):
+            results = self.lookup_by_property(prop, value)
+            if len(results) == 1:
+                return results[0]["id"]
+            if len(results) > 1:
+                return None
+        return None
+
+    def series_episode_table(self, show):
+        """
+        The (season, number) -> [results] table for a Trakt show object, built once per show.
+        Returns None when the show can't be resolved or its episodes can't be fetched.
+        """
+        ident = show_identity(show)
+        if not ident:
+            return None
+        with self.series_tables_lock:
+            if ident in self.series_tables:
+                return self.series_tables[ident]
+        table = None
+        show_qid = self.resolve_show_qid(show)
+        if show_qid:
+            episodes = self.series_episodes(show_qid)
+            if episodes is not None:
+                table = {}
+                for ep in episodes:
+                    table.setdefault((ep["season"], ep["number"]), []).append(ep)
+                logger.debug(f"Built episode table for show {ident} ({show_qid}) with {len(table)} episode(s).")
+        with self.series_tables_lock:
+            self.series_tables[ident] = table
+        return table
+
+    def lookup_series_episode(self, show, episode):
+        """Results for an episode from its show's episode table, or None if the show has no table."""
+        if not self.series_lookup:
+            return None
+        table = self.series_episode_table(show)
+        if table is None:
+            return None
+        return [dict(r) for r in table.get((episode.get("season"), episode.get("number")), [])]
+
+    # --- Title lookup via wbsearchentities ---
+
+    def search_by_title(self, title, local=True):
+        """
+        Fallback title search using wbsearchentities.
+        Returns a list of results, each as a dict with keys 'id', 'url', 'label', and 'description' (if available).
+        With local=True (and the title index on), candidates from the local title index are
+        returned instead when there are any; they carry a 'score' key. Only a local miss goes
+        to the network.
+        """
+        norm_title = title.strip()
+        if local and self.use_title_index:
+            self.title_index.load(self.cache)
+            with self.stats.stage("title_index_search"):
+                local_results = self.title_index.search(norm_title)
+            if local_results:
+                logger.debug(f"Local title index returned {len(local_results)} candidate(s) for '{norm_title}'.")
+                self.stats.cache_event("title", "local")
+                return local_results
+        cached = self.cache.get(CACHE_NS_TITLE, norm_title)
+        if cached is not None:
+            logger.debug(f"Cache hit for title '{norm_title}'.")
+            self.stats.cache_event("title", "hit" if cached else "negative")
+            return cached.copy()
+        self.stats.cache_event("title", "miss")
+
+        params = {
+            "action": "wbsearchentities",
+            "format": "json",
+            "language": "en",
+            "search": norm_title,
+            "type": "item"
+        }
+        logger.debug(f"Performing title search for '{norm_title}'.")
+        try:
+            response = self.transport.request("GET", self.api_url, params=params)
+            results_raw = response.json().get("search", [])
+            results = []
+            for item in results_raw:
+                entity_id = item.get("id")
+                url_val = entity_url(entity_id) if entity_id else ""
+                results.append({
+                    "id": entity_id,
+                    "url": url_val,
+                    "label": item.get("label", ""),
+                    "description": item.get("description", "")
+                })
+            self.cache.put(CACHE_NS_TITLE, norm_title, results)
+            logger.debug(f"Title search complete. Found {len(results)} result(s) for '{norm_title}'.")
+            return results.copy()
+        except Exception as e:
+            logger.error(f"Error performing title search for '{norm_title}': {e}")
+            return []
+
+    # --- Key determination ---
+    #
+    # Returns a dict with "key" and "meta". If a Wikidata match is found, meta holds the title/description.
+    # Otherwise meta is set to empty strings.
+
+    def get_wikidata_key(self, trakt_obj, content_type, extra=None, review=None):
+        """
+        Try candidate lookups in this order:
+          For movies:
+             1. Trakt.tv ID (P8013): "movies/{slug}"
+             2. Trakt.tv film ID (P12492): trakt id
+             3. IMDb (P345)
+             4. TMDB (P4947)
+             5. TVDB (P12196)
+          For episodes:
+             1. The show's episode table (P179 part of the series, one query per show)
+             2. Trakt.tv ID (P8013): "shows/{show_slug}/seasons/{season}/episodes/{number}"
+             3. IMDb (P345), then TMDB (P4947), then TVDB (P12196)
+          For shows:
+             1. Trakt.tv ID (P8013): "shows/{slug}"
+             2. Then IMDb, TMDB, TVDB.
+        Then perform a title search if running interactively: local title index candidates are
+        offered first, and Wikidata is only searched if there are none or none is chosen.
+        In non-interactive mode, the title search is skipped.
+        When a review dict is passed (deferred review mode), nothing is asked: once a lookup is
+        ambiguous, every remaining candidate and title search result is collected into
+        review["options"] and None is returned so the record can be decided later.
+        Returns the Wikidata entity info as a dict if found, or None.
+        """
+        with self.stats.stage("candidate_build"):
+            candidates = build_candidates(trakt_obj, content_type, extra)
+        if content_type == "episode" and extra and self.series_lookup:
+            candidates.insert(0, ("series", "P179", f"shows/{show_identity(extra)}/seasons/{trakt_obj.get('season')}/episodes/{trakt_obj.get('number')}"))
+
+        # Try each candidate.
+        for label, prop, value in candidates:
+            logger.info(f"Searching Wikidata using {label.upper()} (property {prop}) with value '{value}'.")
+            if prop == "P179":
+                results = self.lookup_series_episode(extra, trakt_obj) or []
+            else:
+                results = self.lookup_by_property(prop, value)
+            if review is not None and (review["options"] or len(results) > 1):
+                add_review_options(review, f"{prop} {value}", results)
+                continue
             if results:
-                logger.info(f"\nTitle search for '{title}' returned {len(results)} results.")
-                chosen = interactive_choose_from_results(f"Title search: {title}", results)
-                if chosen:
-                    wikidata_result = {
-                        "url": f"https://www.wikidata.org/wiki/{chosen.get('id')}",
-                        "label": chosen.get("label", ""),
-                        "description": chosen.get("description", "")
-                    }
-                    logger.info(f"User confirmed title search result: {wikidata_result['url']} for '{title}'.")
-                    return wikidata_result
+                if len(results) == 1:
+                    candidate = results[0]
+                    logger.info(f"Found unique candidate match: {candidate['url']} for {label.upper()}='{value}'.")
+                    return dict(candidate, tier=label)
+                elif len(results) > 1:
+                    if self.interactive:
+                        logger.info(f"\nCandidate {label.upper()} lookup for value '{value}' returned {len(results)} results.")
+                        chosen = self.ask_choice(f"{prop} {value}", results)
+                        if chosen:
+                            logger.info(f"User selected candidate: {chosen['url']} for {label.upper()}='{value}'.")
+                            return dict(chosen, tier=label)
+                        else:
+                            logger.info(f"No candidate confirmed for {label.upper()}='{value}'.")
+                    else:
+                        # Flagged as a guess so it is not persisted as a confirmed resolution.
+                        candidate = dict(results[0], guessed=True, tier=label)
+                        logger.info(f"Found candidate match (non-interactive): {candidate['url']} for {label.upper()}='{value}'.")
+                        return candidate
+        # Fallback: Title search.
+        title = trakt_obj.get("title")
+        if title and review is not None:
+            logger.info(f"Deferring review; collecting title search results for '{title}'.")
+            results = self.search_by_title(title)
+            add_review_options(review, f"Title search: {title}", results)
+        elif title:
+            if self.interactive:
+                logger.info(f"Falling back to title search for '{title}'.")
+                results = self.search_by_title(title)
+                if results:
+                    logger.info(f"\nTitle search for '{title}' returned {len(results)} results.")
+                    chosen = self.ask_choice(f"Title search: {title}", results)
+                    if chosen is None and any("score" in r for r in results):
+                        # Only local candidates were offered; ask Wikidata for the ones the index doesn't know.
+                        offered = {r.get("id") for r in results}
+                        remote = [r for r in self.search_by_title(title, local=False) if r.get("id") not in offered]
+                        if remote:
+                            logger.info(f"\nWikidata title search for '{title}' returned {len(remote)} more results.")
+                            chosen = self.ask_choice(f"Title search: {title}", remote)
+                    if chosen:
+                        wikidata_result = {
+                            "url": entity_url(chosen.get('id')),
+                            "label": chosen.get("label", ""),
+                            "description": chosen.get("description", ""),
+                            "tier": "title"
+                        }
+                        logger.info(f"User confirmed title search result: {wikidata_result['url']} for '{title}'.")
+                        return wikidata_result
+                    else:
+                        logger.info(f"No title search result confirmed for '{title}'.")
                 else:
-                    logger.info(f"No title search result confirmed for '{title}'.")
+                    logger.info(f"No Wikidata match found from title search for '{title}'.")
             else:
-                logger.info(f"No Wikidata match found from title search for '{title}'.")
+                logger.info(f"Non-interactive mode: Skipping title search for '{title}'.")
+        return None
+
+    # --- Resolution memo ---
+    #
+    # determine_key results are memoized per Trakt object identity, so rewatches and repeated
+    # watchlist entries resolve in O(1) and reuse earlier interactive choices or manual QIDs.
+    # Wikidata matches and operator decisions are also persisted in the cache store so later
+    # runs start warm; automatic fallbacks are only remembered for this resolver, so they
+    # get retried against Wikidata next time.
+
+    def lookup_resolution(self, identity):
+        with self.resolutions_lock:
+            result = self.resolutions.get(identity)
+        if result is None:
+            result = self.cache.get(CACHE_NS_RESOLUTION, identity)
+            if result is not None:
+                with self.resolutions_lock:
+                    self.resolutions[identity] = result
+        return result
+
+    def remember_resolution(self, identity, result, persist):
+        if identity is None:
+            return
+        with self.resolutions_lock:
+            self.resolutions[identity] = result
+        if persist:
+            self.cache.put(CACHE_NS_RESOLUTION, identity, result)
+
+    def determine_key(self, trakt_record):
+        """
+        Memoized wrapper around resolve_key: repeat records for the same Trakt object reuse
+        the earlier resolution instead of running the candidate cascade again.
+        """
+        identity = trakt_identity(trakt_record)
+        if identity is not None:
+            result = self.lookup_resolution(identity)
+            if result is not None:
+                logger.debug(f"Reusing resolution for {identity}: {result['key']}")
+                self.stats.count("memo_hits")
+                self.stats.tier(result.get("tier", "unknown"))
+                return dict(copy.deepcopy(result), key=canonical_key(result["key"]))
+        result, persist = self.resolve_key(trakt_record)
+        result["key"] = canonical_key(result["key"])
+        self.stats.tier(result["tier"])
+        if "review" in result:
+            result["review"]["identity"] = identity
+        self.remember_resolution(identity, result, persist)
+        return copy.deepcopy(result)
+
+    def resolve_key(self, trakt_record):
+        """
+        Given a Trakt record, determine its unique key and meta information.
+        Logs a summary (record type, title, and IDs), then attempts to obtain a Wikidata match.
+        If no match is found, computes the fallback Trakt.tv URL.
+        In interactive mode, asks manual_entry to override the fallback.
+        In deferred review mode, ambiguous or unmatched records are not prompted for; the result
+        instead carries a "review" question to be answered later by Converter.review_deferred.
+        Returns a tuple of a dict with "key" and "meta" (where meta has "title" and "description")
+        and whether the result is worth persisting (a Wikidata match or an operator decision).
+        """
+        record_type = trakt_record.get("type")
+        if record_type == "movie":
+            movie = trakt_record.get("movie", {})
+            summary = f"Movie: '{movie.get('title')}' | IDs: {movie.get('ids')}"
+        elif record_type == "episode":
+            episode = trakt_record.get("episode", {})
+            show = trakt_record.get("show", {})
+            summary = (f"Episode: '{episode.get('title', '(no title)')}' from show '{show.get('title')}' | "
+                       f"Season {episode.get('season')}, Episode {episode.get('number')} | IDs: {episode.get('ids')}")
+        elif record_type == "show":
+            show = trakt_record.get("show", {})
+            summary = f"Show: '{show.get('title')}' | IDs: {show.get('ids')}"
         else:
-            logger.info(f"Non-interactive mode: Skipping title search for '{title}'.")
-    return None
+            summary = "Unknown record type."
 
-def determine_key(trakt_record):
-    """
-    Given a Trakt record, determine its unique key and meta information.
-    Logs a summary (record type, title, and IDs), then attempts to obtain a Wikidata match.
-    If no match is found, computes the fallback Trakt.tv URL.
-    In interactive mode, prompts the user to override the fallback.
-    Returns a dict with "key" and "meta" (where meta has "title" and "description").
-    """
-    record_type = trakt_record.get("type")
-    if record_type == "movie":
-        movie = trakt_record.get("movie", {})
-        summary = f"Movie: '{movie.get('title')}' | IDs: {movie.get('ids')}"
-    elif record_type == "episode":
-        episode = trakt_record.get("episode", {})
-        show = trakt_record.get("show", {})
-        summary = (f"Episode: '{episode.get('title', '(no title)')}' from show '{show.get('title')}' | "
-                   f"Season {episode.get('season')}, Episode {episode.get('number')} | IDs: {episode.get('ids')}")
-    elif record_type == "show":
-        show = trakt_record.get("show", {})
-        summary = f"Show: '{show.get('title')}' | IDs: {show.get('ids')}"
-    else:
-        summary = "Unknown record type."
-    
-    logger.info("=" * 30)
-    logger.info(f"Processing record: {summary}")
-    
-    wikidata_result = None
-    if record_type == "movie":
-        movie = trakt_record.get("movie")
-        if movie:
-            wikidata_result = get_wikidata_key(movie, "movie")
-            if wikidata_result is None:
-                slug = movie.get("ids", {}).get("slug")
-                fallback = f"{TRAKT_MOVIE_BASE}/{slug}" if slug else f"trakt://{trakt_record.get('id','unknown')}"
+        logger.info("=" * 30)
+        logger.info(f"Processing record: {summary}")
+
+        review = {"options": []} if self.deferred_review else None
+        wikidata_result = None
+        if record_type == "movie":
+            movie = trakt_record.get("movie")
+            if movie:
+                wikidata_result = self.get_wikidata_key(movie, "movie", review=review)
+                if wikidata_result is None:
+                    slug = movie.get("ids", {}).get("slug")
+                    fallback = f"{TRAKT_MOVIE_BASE}/{slug}" if slug else f"trakt://{trakt_record.get('id','unknown')}"
+                else:
+                    fallback = wikidata_result["url"]
+        elif record_type == "episode":
+            episode = trakt_record.get("episode")
+            show = trakt_record.get("show")
+            if episode and show:
+                wikidata_result = self.get_wikidata_key(episode, "episode", extra=show, review=review)
+                if wikidata_result is None:
+                    slug = show.get("ids", {}).get("slug")
+                    season = episode.get("season")
+                    number = episode.get("number")
+                    fallback = (f"{TRAKT_EPISODE_BASE}/{slug}/seasons/{season}/episodes/{number}"
+                                if slug and season is not None and number is not None
+                                else f"trakt://{trakt_record.get('id','unknown')}")
+                else:
+                    fallback = wikidata_result["url"]
+        elif record_type == "show":
+            show = trakt_record.get("show")
+            if show:
+                wikidata_result = self.get_wikidata_key(show, "show", review=review)
+                if wikidata_result is None:
+                    slug = show.get("ids", {}).get("slug")
+                    fallback = f"{TRAKT_EPISODE_BASE}/{slug}" if slug else f"trakt://{trakt_record.get('id','unknown')}"
+                else:
+                    fallback = wikidata_result["url"]
+        else:
+            fallback = f"trakt://{trakt_record.get('id','unknown')}"
+
+        tier = "fallback"
+        if wikidata_result:
+            key = wikidata_result["url"]
+            tier = wikidata_result.get("tier", "unknown")
+            meta = {
+                "title": wikidata_result.get("label", ""),
+                "description": wikidata_result.get("description", "")
+            }
+        elif review is not None:
+            logger.info(f"Deferred for review with {len(review['options'])} option(s): {fallback}")
+            question = {"group": fallback, "summary": summary, "fallback": fallback, "options": review["options"]}
+            if record_type in ("movie", "episode", "show"):
+                question["title"] = (trakt_record.get(record_type) or {}).get("title") or ""
+            if record_type in ("episode", "show") and show_identity(trakt_record.get("show")):
+                # A show and its episodes are reviewed together (see Converter.review_deferred).
+                question["show"] = f"show:{show_identity(trakt_record['show'])}"
+                question["show_title"] = trakt_record["show"].get("title") or ""
+            return {"key": fallback, "meta": {"title": "", "description": ""}, "tier": "review",
+                    "review": question}, False
+        else:
+            if self.interactive:
+                manual = self.ask_manual_entry(fallback)
+                if manual:
+                    key = manual["url"] if isinstance(manual, dict) else manual
+                    tier = "manual"
+                    meta = {"title": manual.get("label", ""), "description": manual.get("description", "")} if isinstance(manual, dict) else {"title": "", "description": ""}
+                else:
+                    key = fallback
+                    meta = {"title": "", "description": ""}
             else:
-                fallback = wikidata_result["url"]
-    elif record_type == "episode":
-        episode = trakt_record.get("episode")
-        show = trakt_record.get("show")
-        if episode and show:
-            wikidata_result = get_wikidata_key(episode, "episode", extra=show)
-            if wikidata_result is None:
-                slug = show.get("ids", {}).get("slug")
-                season = episode.get("season")
-                number = episode.get("number")
-                fallback = (f"{TRAKT_EPISODE_BASE}/{slug}/seasons/{season}/episodes/{number}"
-                            if slug and season is not None and number is not None
-                            else f"trakt://{trakt_record.get('id','unknown')}")
+                key = fallback
+                meta = {"title": "", "description": ""}
+
+        logger.info(f"Resolved to record key: {key}")
+        confirmed = bool(wikidata_result) and not wikidata_result.get("guessed")
+        return {"key": key, "meta": meta, "tier": tier}, confirmed or self.interactive
+
+    def speculate_record(self, trakt_record):
+        """Run the lookup part of the candidate cascade for a record, without prompting (see Converter lookahead)."""
+        identity = trakt_identity(trakt_record)
+        if identity is not None and self.lookup_resolution(identity) is not None:
+            self.stats.count("lookahead_skipped")
+            return
+        self.stats.count("lookahead_records")
+        try:
+            if self.series_lookup and trakt_record.get("type") == "episode" and trakt_record.get("show"):
+                if len(self.lookup_series_episode(trakt_record["show"], trakt_record.get("episode") or {}) or []) == 1:
+                    return
+            for label, prop, value in record_candidates(trakt_record):
+                if len(self.lookup_by_property(prop, value)) == 1:
+                    return
+            title = record_subject(trakt_record).get("title")
+            if title:
+                self.search_by_title(title)
+        except Exception as e:
+            logger.debug(f"Lookahead for {identity} failed: {e}")
+
+    # --- Key canonicalization and meta enrichment (see KEY CANONICALIZATION) ---
+
+    def entities_batch(self, qids):
+        """
+        One wbgetentities request for up to WBGETENTITIES_BATCH_SIZE QIDs. Caches where each QID
+        redirects to (redirect namespace) and its English label and description (entity namespace),
+        so the redirect check and the meta enrichment share requests. Returns False if it failed.
+        """
+        params = {"action": "wbgetentities", "format": "json", "ids": "|".join(qids),
+                  "props": "info|labels|descriptions", "languages": "en"}
+        try:
+            response = self.transport.request("GET", self.api_url, params=params)
+            entities = response.json().get("entities", {})
+        except Exception as e:
+            logger.error(f"Error in wbgetentities request for {len(qids)} id(s): {e}")
+            return False
+        redirects = {}
+        found = {}
+        for entity in entities.values():
+            redirect = entity.get("redirects")
+            if redirect and redirect.get("from") and redirect.get("to"):
+                redirects[redirect["from"]] = redirect["to"]
+            if "missing" in entity or not entity.get("id"):
+                continue
+            found[entity["id"]] = [{
+                "id": entity["id"],
+                "url": entity_url(entity["id"]),
+                "label": entity.get("labels", {}).get("en", {}).get("value", ""),
+                "description": entity.get("descriptions", {}).get("en", {}).get("value", "")
+            }]
+        self.cache.put_many(CACHE_NS_REDIRECT, [(qid, [{"id": redirects[qid]}] if qid in redirects else [])
+                                                for qid in qids])
+        entity_rows = {qid: found.get(redirects.get(qid, qid), []) for qid in qids}
+        entity_rows.update(found)
+        self.cache.put_many(CACHE_NS_ENTITY, list(entity_rows.items()))
+        return True
+
+    def fetch_entities(self, qids, namespace):
+        """
+        Make sure the namespace (redirect or entity) has a cached answer for every QID, issuing
+        batched wbgetentities requests on the worker pool for the ones it doesn't.
+        Returns {qid: cached results} (QIDs whose batch failed are left out).
+        """
+        answers = {}
+        pending = []
+        for qid in sorted(set(qids)):
+            cached = self.cache.get(namespace, qid)
+            if cached is None:
+                pending.append(qid)
             else:
-                fallback = wikidata_result["url"]
-    elif record_type == "show":
-        show = trakt_record.get("show")
-        if show:
-            wikidata_result = get_wikidata_key(show, "show")
-            if wikidata_result is None:
-                slug = show.get("ids", {}).get("slug")
-                fallback = f"{TRAKT_EPISODE_BASE}/{slug}" if slug else f"trakt://{trakt_record.get('id','unknown')}"
+                answers[qid] = cached
+        batches = [pending[i:i + WBGETENTITIES_BATCH_SIZE] for i in range(0, len(pending), WBGETENTITIES_BATCH_SIZE)]
+        if batches:
+            logger.info(f"Fetching {len(pending)} QID(s) in {len(batches)} wbgetentities request(s).")
+        for batch, ok in zip(batches, self.map(self.entities_batch, batches)):
+            if ok:
+                for qid in batch:
+                    cached = self.cache.get(namespace, qid)
+                    if cached is not None:
+                        answers[qid] = cached
+        return answers
+
+    def resolve_redirects(self, qids):
+        """
+        Map each QID to the item it redirects to (itself if not redirected or unknown).
+        Answers are cached, so only QIDs not checked before (or whose "not redirected" answer
+        has expired) are sent.
+        """
+        answers = self.fetch_entities(qids, CACHE_NS_REDIRECT)
+        return {qid: answers[qid][0]["id"] if answers.get(qid) else qid for qid in qids}
+
+    def retry_fallback_key(self, key):
+        """
+        Try to resolve a trakt.tv fallback key again (episode table and Trakt ID property
+        lookup, unique matches only). Returns a canonical key, or None.
+        """
+        if key.startswith(TRAKT_MOVIE_BASE + "/"):
+            candidates = [("P8013", f"movies/{key[len(TRAKT_MOVIE_BASE) + 1:]}")]
+        elif key.startswith(TRAKT_EPISODE_BASE + "/"):
+            path = key[len(TRAKT_EPISODE_BASE) + 1:]
+            candidates = [("P8013", f"shows/{path}")]
+            parts = path.split("/")
+            if len(parts) == 5 and parts[1] == "seasons" and parts[3] == "episodes":
+                show = {"ids": {"slug": parts[0]}}
+                results = self.lookup_series_episode(show, {"season": ordinal(parts[2]), "number": ordinal(parts[4])})
+                if results and len(results) == 1:
+                    return canonical_key(results[0]["url"])
+        else:
+            return None
+        for prop, value in candidates:
+            results = self.lookup_by_property(prop, value)
+            if len(results) == 1:
+                return canonical_key(results[0]["url"])
+        return None
+
+    def canonicalize_output(self, output_data, online=True, retry_fallbacks=True, keys=None):
+        """
+        Rewrite output_data ({key: record}) in place so every key is canonical, merging records that
+        collapse onto the same key. With online=False only the URL form is normalized (no redirect
+        check and no fallback retries). With keys, only those keys are checked; the rest are kept
+        as they are (a checked key can still merge into one of them). Returns (keys whose records
+        changed or were removed, report).
+        """
+        checked = list(output_data) if keys is None else [key for key in keys if key in output_data]
+        mapping = {key: key for key in output_data}
+        mapping.update((key, canonical_key(key)) for key in checked)
+        report = {"normalized": sum(1 for key in checked if mapping[key] != key), "redirected": 0,
+                  "fallbacks_resolved": 0, "merged": 0}
+        if online:
+            if retry_fallbacks:
+                fallbacks = [key for key in checked if key_qid(mapping[key]) is None]
+                for key, resolved in zip(fallbacks, self.map(self.retry_fallback_key, fallbacks)):
+                    if resolved:
+                        mapping[key] = resolved
+                        report["fallbacks_resolved"] += 1
+            targets = self.resolve_redirects([qid for qid in (key_qid(mapping[key]) for key in checked) if qid])
+            for key in checked:
+                new = mapping[key]
+                qid = key_qid(new)
+                if qid and targets.get(qid, qid) != qid:
+                    mapping[key] = entity_url(targets[qid])
+                    report["redirected"] += 1
+
+        changed = set()
+        canonical = {}
+        for key, record in output_data.items():
+            new = mapping[key]
+            if new != key:
+                changed.update((key, new))
+            if new in canonical:
+                merge_records(canonical[new], record)
+                changed.add(new)
+                report["merged"] += 1
             else:
-                fallback = wikidata_result["url"]
-    else:
-        fallback = f"trakt://{trakt_record.get('id','unknown')}"
-    
-    if wikidata_result:
-        key = wikidata_result["url"]
-        meta = {
-            "title": wikidata_result.get("label", ""),
-            "description": wikidata_result.get("description", "")
+                canonical[new] = record
+        output_data.clear()
+        output_data.update(canonical)
+        report["keys"] = len(output_data)
+        logger.info(f"Canonicalized keys: {report['normalized']} normalized, {report['redirected']} redirected, "
+                    f"{report['fallbacks_resolved']} fallback(s) resolved, {report['merged']} record(s) merged; "
+                    f"{report['keys']} key(s) remain.")
+        return changed, report
+
+    # Manual entries, title-search picks taken from old caches and records whose label lookup came
+    # back empty can end up with an empty meta title or description, which the site would otherwise
+    # have to fetch per item at render time. enrich_output fills them from wbgetentities, 50 QIDs
+    # per request, reusing the entity answers cached by the redirect check.
+
+    def enrich_output(self, output_data, keys=None):
+        """
+        Fill missing meta titles and descriptions of Wikidata records in output_data in place (only
+        of the records under keys, if given). Existing values are never overwritten.
+        Returns (keys whose meta changed, report).
+        """
+        missing = {}
+        for key in (output_data if keys is None else keys):
+            if key not in output_data:
+                continue
+            qid = key_qid(key)
+            meta = output_data[key].get("meta", {})
+            if qid and (not meta.get("title") or not meta.get("description")):
+                missing[key] = qid
+        answers = self.fetch_entities(missing.values(), CACHE_NS_ENTITY) if missing else {}
+        changed = set()
+        report = {"missing": len(missing), "titles_filled": 0, "descriptions_filled": 0}
+        for key, qid in missing.items():
+            if not answers.get(qid):
+                continue
+            entity = answers[qid][0]
+            meta = output_data[key].setdefault("meta", {})
+            for field, value, counter in (("title", entity.get("label"), "titles_filled"),
+                                          ("description", entity.get("description"), "descriptions_filled")):
+                if value and not meta.get(field):
+                    meta[field] = value
+                    report[counter] += 1
+                    changed.add(key)
+        logger.info(f"Enriched meta: {report['titles_filled']} title(s) and {report['descriptions_filled']} "
+                    f"description(s) filled for {len(missing)} record(s) with missing meta.")
+        return changed, report
+
+# --- OUTPUT JOURNAL ---
+#
+# Resolved records are appended to "<output_file>.journal" as one JSON line each, and the
+# journal is compacted into the output JSON every compact_every records (and at the end).
+# Bytes written per record stay constant, and after a crash the output plus the journal
+# describe everything resolved so far, which is what --resume picks up from.
+# In deferred review mode, records that need a decision go to "<output_file>.review" instead,
+# one JSON line each, until review_deferred answers them.
+
+def history_id_from_note(note):
+    """Recover the Trakt history id from an "imported from <path>:<id>" consumption note."""
+    if isinstance(note, str) and note.startswith("imported from ") and ":" in note:
+        return note.rsplit(":", 1)[-1]
+    return None
+
+def watchlist_id_from_note(note):
+    """Recover the Trakt watchlist id from a vote note holding the original record JSON."""
+    try:
+        rec = json.loads(note)
+    except Exception:
+        return None
+    if isinstance(rec, dict) and rec.get("id") is not None:
+        return str(rec["id"])
+    return None
+
+def apply_entry(output_data, entry):
+    """Add one resolved history consumption or watchlist vote to output_data. Returns its key."""
+    key = entry["key"]
+    # Create record with new format if it doesn't exist.
+    if key not in output_data:
+        output_data[key] = {
+            "meta": entry["meta"],
+            "notes": "",
+            "consumptions": [],
+            "queue-votes": {}
         }
+    if entry["kind"] == "history":
+        output_data[key]["consumptions"].append(entry["item"])
     else:
-        if INTERACTIVE_MODE:
-            manual = prompt_manual_entry(fallback)
-            if manual:
-                key = manual["url"] if isinstance(manual, dict) else manual
-                meta = {"title": manual.get("label", ""), "description": manual.get("description", "")} if isinstance(manual, dict) else {"title": "", "description": ""}
-            else:
-                key = fallback
-                meta = {"title": "", "description": ""}
-        else:
-            key = fallback
-            meta = {"title": "", "description": ""}
-    
-    logger.info(f"Resolved to record key: {key}")
-    return {"key": key, "meta": meta}
+        output_data[key]["queue-votes"].setdefault(WATCHLIST_QUEUE, []).append(entry["item"])
+    return key
 
-# --- PROCESSING FUNCTIONS ---
+# --- OUTPUT LAYOUTS ---
+#
+# output_data is always {key: record}; the layouts only differ in how it is written.
+# Media keys are written in sorted order so reruns and incremental updates produce stable
+# diffs. In the sharded layout every record lives in one small shard file, so a new
+# consumption rewrites only its shard (and the manifest only changes when a shard is added or
+# the queue list changes). The JSON is formatted exactly like the site's saveBackendData
+# (JSON.stringify with 2-space indent), so a file written by either side round-trips unchanged.
 
-def flush_output_data(output_file, output_data):
-    """
-    Write the current output_data to the output_file.
-    This version flushes and fsyncs to force the OS to write the data to disk immediately.
-    """
+def sorted_media(output_data):
+    return {key: output_data[key] for key in sorted(output_data)}
+
+def queue_names(output_data):
+    return sorted({queue for record in output_data.values() for queue in record.get("queue-votes", {})})
+
+def backend_document(output_data, queues=None):
+    """output_data in the site's ueue-media-tracking.json schema."""
+    return {"media": sorted_media(output_data), "meta": {"queues": queues if queues is not None else queue_names(output_data)}}
+
+def shard_name(key):
+    """The shard a media key is stored in, e.g. "45" for .../entity/Q12345 (SHARD_COUNT 100)."""
+    qid = key.rsplit("/", 1)[-1]
+    if "wikidata.org/" in key and qid[:1] == "Q" and qid[1:].isdigit():
+        return f"{int(qid[1:]) % SHARD_COUNT:0{len(str(SHARD_COUNT - 1))}d}"
+    return "other"
+
+def shard_path(name):
+    return f"{SHARD_DIR}/{name}.json"
+
+def write_json_atomic(path, data):
+    """Write JSON via a temp file, fsynced before it replaces path."""
+    tmp_file = path + ".tmp"
     try:
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(output_data, f, indent=2, ensure_ascii=False)
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
             f.flush()
             os.fsync(f.fileno())
-        logger.debug(f"Flushed output to {output_file}.")
-    except Exception as e:
-        logger.error(f"Error flushing output file: {e}")
+        os.replace(tmp_file, path)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
 
-def process_history_file(filepath, output_data, output_file, export_dir):
-    logger.info(f"Processing history file: {filepath}")
+def read_output(output_file):
+    """
+    Read an existing output in any layout: a sharded directory, the backend schema or the flat
+    {key: record} file. Returns (output_data, queues, layout).
+    """
+    manifest_file = os.path.join(output_file, SHARD_MANIFEST)
+    if os.path.isdir(output_file) and os.path.exists(manifest_file):
+        with open(manifest_file, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        output_data = {}
+        for path in manifest.get("shards", []):
+            with open(os.path.join(output_file, path), "r", encoding="utf-8") as f:
+                output_data.update(json.load(f))
+        return output_data, manifest.get("meta", {}).get("queues", []), "sharded"
+    with open(output_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data.get("media"), dict) and isinstance(data.get("meta"), dict):
+        return data["media"], data["meta"].get("queues", []), "backend"
+    return data, [], "flat"
+
+def merge_queues(queues, output_data):
+    """Existing queues (kept in their order) followed by any new ones used in output_data."""
+    return queues + [q for q in queue_names(output_data) if q not in queues]
+
+def write_shards(directory, output_data, queues, dirty=None):
+    """
+    Write output_data as a sharded directory. Only the shards holding keys in dirty are
+    rewritten (all of them if dirty is None or there is no manifest yet); shards left
+    empty are removed.
+    """
+    if os.path.isfile(directory):
+        raise ValueError(f"{directory} is a file; the sharded layout writes a directory")
+    os.makedirs(os.path.join(directory, SHARD_DIR), exist_ok=True)
+    manifest_file = os.path.join(directory, SHARD_MANIFEST)
+    shards = defaultdict(list)
+    for key in output_data:
+        shards[shard_name(key)].append(key)
+    if dirty is None or not os.path.exists(manifest_file):
+        dirty_shards = set(shards)
+    else:
+        dirty_shards = {shard_name(key) for key in dirty}
+    for name in sorted(dirty_shards):
+        path = os.path.join(directory, shard_path(name))
+        if name in shards:
+            write_json_atomic(path, {key: output_data[key] for key in sorted(shards[name])})
+        elif os.path.exists(path):
+            os.remove(path)
+    manifest = {"layout": "sharded", "version": 1, "meta": {"queues": queues},
+                "shards": [shard_path(name) for name in sorted(shards)]}
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            records = json.load(f)
-        logger.debug(f"Found {len(records)} history records in file.")
-    except Exception as e:
-        logger.error(f"Error reading file {filepath}: {e}")
-        return
+        with open(manifest_file, "r", encoding="utf-8") as f:
+            unchanged = json.load(f) == manifest
+    except (OSError, ValueError):
+        unchanged = False
+    if not unchanged:
+        write_json_atomic(manifest_file, manifest)
 
-    # Compute relative path from the parent of the parent of export_dir.
+def write_output(output_file, layout, output_data, queues, dirty=None):
+    """Write output_data in the given layout (see write_shards for dirty)."""
+    if layout == "sharded":
+        write_shards(output_file, output_data, queues, dirty)
+    elif layout == "backend":
+        write_json_atomic(output_file, backend_document(output_data, queues))
+    else:
+        write_json_atomic(output_file, sorted_media(output_data))
+
+class OutputJournal:
+    """
+    The output_data being built plus its on-disk journal and the set of Trakt ids already converted.
+    touched holds the keys that received records in this run (including replayed ones), which is
+    all the final canonicalization and enrichment passes look at.
+    """
+
+    def __init__(self, output_file, resume=False, layout=None, compact_every=JOURNAL_COMPACT_EVERY, stats=None):
+        self.output_file = output_file.rstrip("/\\") or output_file
+        self.layout = layout or OUTPUT_LAYOUT
+        self.compact_every = compact_every
+        self.stats = stats or RunStats()
+        self.journal_file = self.output_file + ".journal"
+        self.review_file = self.output_file + ".review"
+        self.output_data = {}
+        self.queues = []
+        self.dirty = set()
+        self.touched = set()
+        self.seen = {"history": set(), "watchlist": set()}
+        self.pending = 0
+        replayed = 0
+        if resume:
+            replayed = self.load_existing()
+        else:
+            for path in (self.journal_file, self.review_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            if self.layout == "sharded" and os.path.isdir(self.output_file):
+                # Start from an empty directory so shards of a previous run don't linger.
+                for path in glob.glob(os.path.join(self.output_file, SHARD_DIR, "*.json")) + [
+                        os.path.join(self.output_file, SHARD_MANIFEST)]:
+                    if os.path.exists(path):
+                        os.remove(path)
+        self.journal = open(self.journal_file, "a", encoding="utf-8")
+        if replayed:
+            self.compact()
+
+    def load_existing(self):
+        """
+        Load the previous output and replay any journal written after its last compaction.
+        An existing output keeps its own layout, whatever layout was asked for.
+        Returns the number of replayed journal entries.
+        """
+        if os.path.exists(self.output_file):
+            try:
+                self.output_data, self.queues, layout = read_output(self.output_file)
+                if layout != self.layout:
+                    logger.info(f"{self.output_file} is in the {layout} layout; keeping it instead of {self.layout}.")
+                    self.layout = layout
+            except Exception as e:
+                logger.error(f"Error reading existing output {self.output_file}: {e}")
+                self.output_data = {}
+        for record in self.output_data.values():
+            for consumption in record.get("consumptions", []):
+                history_id = history_id_from_note(consumption.get("note"))
+                if history_id:
+                    self.seen["history"].add(history_id)
+            for vote in record.get("queue-votes", {}).get(WATCHLIST_QUEUE, []):
+                watchlist_id = watchlist_id_from_note(vote.get("note"))
+                if watchlist_id:
+                    self.seen["watchlist"].add(watchlist_id)
+        replayed = 0
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn final line from a crash mid-write; everything before it is intact.
+                        logger.warning(f"Ignoring truncated journal line in {self.journal_file}.")
+                        break
+                    if entry["id"] in self.seen[entry["kind"]]:
+                        continue
+                    key = apply_entry(self.output_data, entry)
+                    self.dirty.add(key)
+                    self.touched.add(key)
+                    self.seen[entry["kind"]].add(entry["id"])
+                    replayed += 1
+        # Records waiting for review count as handled so they aren't queued twice.
+        for entry in self.load_review_queue():
+            self.seen[entry["kind"]].add(entry["id"])
+        logger.info(f"Resuming with {len(self.seen['history'])} history and "
+                    f"{len(self.seen['watchlist'])} watchlist record(s) already converted "
+                    f"({replayed} replayed from journal).")
+        return replayed
+
+    def is_done(self, kind, rec):
+        return str(rec.get("id")) in self.seen[kind]
+
+    def add(self, kind, rec, key, meta, item):
+        entry = {"kind": kind, "id": str(rec.get("id")), "key": key, "meta": meta, "item": item}
+        key = apply_entry(self.output_data, entry)
+        self.dirty.add(key)
+        self.touched.add(key)
+        self.seen[kind].add(entry["id"])
+        with self.stats.stage("flush"):
+            self.journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.journal.flush()
+        self.pending += 1
+        if self.pending >= self.compact_every:
+            self.compact()
+
+    def defer(self, kind, rec, item, question):
+        """Queue a record for the review session instead of adding it to the output."""
+        entry = {"kind": kind, "id": str(rec.get("id")), "item": item, "question": question}
+        self.seen[kind].add(entry["id"])
+        with open(self.review_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def load_review_queue(self):
+        entries = []
+        if os.path.exists(self.review_file):
+            with open(self.review_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        logger.warning(f"Ignoring truncated review line in {self.review_file}.")
+                        break
+        return entries
+
+    def save_review_queue(self, entries):
+        """Rewrite the review queue with the entries still unanswered (removing it if none are left)."""
+        if not entries:
+            if os.path.exists(self.review_file):
+                os.remove(self.review_file)
+            return
+        tmp_file = self.review_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp_file, self.review_file)
+
+    def compact(self):
+        """
+        Atomically rewrite the output from output_data, then truncate the journal.
+        Flushes and fsyncs so the compacted output is on disk before the journal is dropped.
+        In the sharded layout only the shards holding records changed since the last
+        compaction are rewritten. Returns True if the output was written; a failure is logged
+        and leaves the journal (and so every entry) in place.
+        """
+        try:
+            with self.stats.stage("flush"):
+                write_output(self.output_file, self.layout, self.output_data,
+                             merge_queues(self.queues, self.output_data), self.dirty)
+            self.journal.truncate(0)
+            self.journal.flush()
+            self.pending = 0
+            self.dirty.clear()
+            logger.debug(f"Compacted output to {self.output_file}.")
+            return True
+        except Exception as e:
+            logger.error(f"Error compacting output file: {e}")
+            return False
+
+    def canonicalize(self, resolver, online=True):
+        """
+        Run the resolver's key canonicalization pass over the records touched in this run; the next
+        compaction writes the result. The rest of the output is left to canonicalize_keys.py.
+        """
+        changed, _ = resolver.canonicalize_output(self.output_data, online=online, keys=self.touched)
+        self.dirty.update(changed)
+        self.touched = (self.touched | changed) & self.output_data.keys()
+
+    def enrich(self, resolver):
+        """Fill missing meta of the records touched in this run; the next compaction writes the result."""
+        changed, _ = resolver.enrich_output(self.output_data, keys=self.touched)
+        self.dirty.update(changed)
+
+    def close(self):
+        """
+        Final compaction; the journal is removed once everything is in the output file.
+        Returns True if the output was written.
+        """
+        written = self.compact()
+        self.journal.close()
+        if self.pending == 0 and os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        return written
+
+
+# --- PROCESSING FUNCTIONS ---
+
+def journal_result(journal, kind, rec, res, item):
+    """Add a converted record to the journal, or queue it for review. Returns True if added."""
+    if "review" in res:
+        journal.defer(kind, rec, item, res["review"])
+        return False
+    journal.add(kind, rec, res["key"], res["meta"], item)
+    return True
+
+def history_rel_path(filepath, export_dir):
+    """The history file's path as written into consumption notes: relative to the export's grandparent, with forward slashes."""
     base_dir = os.path.dirname(os.path.dirname(os.path.normpath(export_dir)))
-    rel_path = os.path.relpath(filepath, start=base_dir)
-    # Replace backslashes with forward slashes.
-    rel_path = rel_path.replace(os.sep, '/')
-    for rec in records:
-        res = determine_key(rec)
-        key = res["key"]
-        meta = res["meta"]
-        # Create record with new format if it doesn't exist.
-        if key not in output_data:
-            output_data[key] = {
-                "meta": meta,
-                "notes": "",
-                "consumptions": [],
-                "queue-votes": {}
-            }
-        # Create consumption with updated note.
-        consumption = {
-            "when": rec.get("watched_at"),
-            "note": f"imported from {rel_path}:{rec.get('id')}",
-            "rating": rec.get("rating", None)
+    return os.path.relpath(filepath, start=base_dir).replace(os.sep, '/')
+
+# --- CONVERTER ---
+#
+# A Converter runs one Trakt export (or a --review session) through a Resolver into an output
+# file: prefetch, per-file conversion (sequential with lookahead when prompting, concurrent
+# otherwise, or across worker processes with jobs > 1), the deferred review session and the
+# final canonicalization and enrichment passes. import_records does the same for records pulled
+# from somewhere else (trakt_sync.py feeds it from the Trakt API). It keeps no state between calls
+# beyond what the resolver keeps, so one resolver (and its warm cache and memo) can serve any
+# number of converters and conversions.
+
+class Converter:
+    def __init__(self, resolver, layout=OUTPUT_LAYOUT, prefetch=True, lookahead=LOOKAHEAD_RECORDS, jobs=JOBS,
+                 canonicalize=CANONICALIZE_KEYS, enrich=ENRICH_META, compact_every=JOURNAL_COMPACT_EVERY,
+                 pause=prompt_input):
+        """
+        pause(message) is called after each record in interactive mode (pass None to not pause).
+        jobs > 1 needs a non-interactive or deferred review resolver, since prompts can't be
+        shared between processes.
+        """
+        if jobs > 1 and resolver.interactive and not resolver.deferred_review:
+            raise ValueError("jobs > 1 needs a non-interactive or deferred review resolver")
+        self.resolver = resolver
+        self.stats = resolver.stats
+        self.layout = layout
+        self.prefetch = prefetch
+        self.lookahead = max(0, lookahead)
+        self.jobs = max(1, jobs)
+        self.canonicalize = canonicalize
+        self.enrich = enrich
+        self.compact_every = compact_every
+        self.pause = pause
+
+    @property
+    def prompting(self):
+        """Whether records are asked about as they come up (interactive, not deferred)."""
+        return self.resolver.interactive and not self.resolver.deferred_review
+
+    def prefetch_export(self, export_dir, skip=None):
+        """
+        Walk the whole export up front and resolve candidate external IDs in bulk
+        (see Resolver.prefetch_records). Records for which skip(kind, record) is true
+        (e.g. already converted) are left out.
+        """
+        self.resolver.prefetch_records(rec for kind, rec in iter_export_records(export_dir, self.stats)
+                                       if not (skip and skip(kind, rec)))
+
+    # --- Speculative lookahead ---
+    #
+    # Interactive runs spend most of their time waiting in input(). While a prompt is open, the
+    # lookups for the next `lookahead` records (episode table, candidate properties and, if
+    # those don't settle it, the title search) run on background threads and land in the cache,
+    # so the next question is ready as soon as the operator answers. Only lookups run ahead;
+    # prompts and resolutions still happen in order on the main thread. Lookahead for a record is
+    # deduplicated by Trakt identity, skipped once that identity has been resolved (e.g. by an
+    # earlier answer for the same movie), and cancelled if the main thread reaches the record first.
+
+    def resolve_with_lookahead(self, records):
+        """
+        Yield (record, determine_key result) in input order, one record at a time, while the
+        lookups for the next `lookahead` records run in the background.
+        """
+        resolver = self.resolver
+        ahead = self.lookahead
+        if ahead <= 0:
+            for rec in records:
+                yield rec, resolver.determine_key(rec)
+            return
+        records = iter(records)
+        window = deque()
+        pending = {}
+        executor = ThreadPoolExecutor(max_workers=min(ahead, resolver.workers), thread_name_prefix="lookahead")
+
+        def fill():
+            while len(window) <= ahead:
+                rec = next(records, None)
+                if rec is None:
+                    return
+                window.append(rec)
+                key = trakt_identity(rec) or id(rec)
+                if key not in pending:
+                    pending[key] = executor.submit(resolver.speculate_record, rec)
+
+        try:
+            fill()
+            while window:
+                rec = window.popleft()
+                future = pending.pop(trakt_identity(rec) or id(rec), None)
+                if future is not None:
+                    if future.cancel():
+                        self.stats.count("lookahead_cancelled")
+                    else:
+                        # Already running: let it finish so its lookups aren't issued twice.
+                        future.result()
+                fill()
+                yield rec, resolver.determine_key(rec)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    # --- Per-file conversion ---
+
+    def resolve_records(self, records):
+        """
+        Yield (record, determine_key result) in input order.
+        Non-interactive and deferred review runs resolve records concurrently on the resolver's
+        worker pool; interactive runs stay sequential so prompts come one at a time, with the
+        lookups for the next few records running ahead in the background.
+        """
+        if self.prompting:
+            yield from self.resolve_with_lookahead(records)
+        else:
+            yield from self.resolver.map(lambda rec: (rec, self.resolver.determine_key(rec)), records)
+
+    def convert_records(self, kind, records, is_done, source=None):
+        """
+        Yield (record, determine_key result, item) for each history or watchlist record not yet
+        done, where item is the record's consumption or queue vote. A consumption's note names
+        its source (an export file path, or the API endpoint it was synced from) and record id.
+        """
+        records = (rec for rec in records if not is_done(kind, rec))
+        for rec, res in self.resolve_records(records):
+            if kind == "history":
+                # Create consumption with updated note.
+                item = {
+                    "when": rec.get("watched_at"),
+                    "note": f"imported from {source}:{rec.get('id')}",
+                    "rating": rec.get("rating", None)
+                }
+            else:
+                item = {
+                    "when": rec.get("listed_at"),
+                    "note": json.dumps(rec, ensure_ascii=False)
+                }
+            yield rec, res, item
+
+    def convert_history_file(self, filepath, export_dir, is_done):
+        """Yield (record, determine_key result, consumption) for each history record not yet done."""
+        return self.convert_records("history", iter_json_array(filepath, self.stats), is_done,
+                                    source=history_rel_path(filepath, export_dir))
+
+    def convert_watchlist_file(self, filepath, is_done):
+        """Yield (record, determine_key result, vote) for each watchlist record not yet done."""
+        return self.convert_records("watchlist", iter_json_array(filepath, self.stats), is_done)
+
+    def process_records(self, kind, converted, journal):
+        """Journal the (record, result, item) triples of convert_records, pausing after each in interactive mode."""
+        for rec, res, item in converted:
+            if not journal_result(journal, kind, rec, res, item):
+                continue
+            logger.debug(f"Added {kind} record under key: {res['key']}")
+            if self.prompting and self.pause:
+                with self.stats.stage("disambiguation_wait"):
+                    if kind == "history":
+                        self.pause("History record processed. Press ENTER to continue...")
+                    else:
+                        self.pause(f"Watchlist record for key: {res['key']} processed. Press ENTER to continue...")
+
+    def process_history_file(self, filepath, journal, export_dir):
+        logger.info(f"Processing history file: {filepath}")
+        try:
+            self.process_records("history", self.convert_history_file(filepath, export_dir, journal.is_done), journal)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading file {filepath}: {e}")
+
+    def process_watchlist_file(self, filepath, journal):
+        logger.info(f"Processing watchlist file: {filepath}")
+        try:
+            self.process_records("watchlist", self.convert_watchlist_file(filepath, journal.is_done), journal)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading file {filepath}: {e}")
+
+    # --- Parallel file conversion ---
+    #
+    # With jobs > 1, export files are converted by worker processes, each with its own Resolver:
+    # its own HTTP transport with a 1/jobs share of every host's rate limit, reading and writing
+    # the same SQLite cache store (WAL mode allows concurrent readers and serialized writers).
+    # A lookup or resolution cached by one worker is a cache hit for the others. Workers don't
+    # touch the output: each returns its file's converted records, and the parent applies them
+    # to the journal in export file order and record order, so the output is the same as a
+    # one-process run. Interactive prompts can't be shared between processes, so the review
+    # session of a deferred review run happens in the parent.
+
+    def worker_config(self, jobs):
+        """The settings a worker process rebuilds this converter's resolver from, picklable for the pool initializer."""
+        resolver = self.resolver
+        transport = resolver.transport
+        rate_limits = getattr(transport, "rate_limits", RATE_LIMITS)
+        return {
+            "cache_path": resolver.cache.path,
+            "cache_max_age": resolver.cache.max_age,
+            "negative_cache_max_age": resolver.cache.negative_max_age,
+            "rate_limits": {host: (rate / jobs, max(1, burst // jobs)) for host, (rate, burst) in rate_limits.items()},
+            "user_agent": getattr(transport, "user_agent", USER_AGENT),
+            "max_retries": getattr(transport, "max_retries", HTTP_MAX_RETRIES),
+            "backoff_base": getattr(transport, "backoff_base", HTTP_BACKOFF_BASE),
+            "workers": resolver.workers,
+            "sparql_url": resolver.sparql_url,
+            "api_url": resolver.api_url,
+            "interactive": resolver.interactive,
+            "deferred_review": resolver.deferred_review,
+            "series_lookup": resolver.series_lookup,
+            "title_index": resolver.use_title_index,
+            "id_index": resolver.id_index.path if resolver.id_index is not None else None,
+            "stats": self.stats.enabled,
+            "log_level": logging.getLogger().level,
         }
-        output_data[key]["consumptions"].append(consumption)
-        logger.debug(f"Added history record under key: {key}")
-        flush_output_data(output_file, output_data)
-        if INTERACTIVE_MODE:
-            input("History record processed. Press ENTER to continue...")
-
-def process_watchlist_file(filepath, output_data, output_file):
-    logger.info(f"Processing watchlist file: {filepath}")
+
+    def process_files_parallel(self, files, journal, export_dir, jobs):
+        """Convert files on a pool of jobs worker processes and apply the results in file order."""
+        jobs_list = [(kind, filepath, export_dir, journal.seen[kind]) for kind, filepath in files]
+        with multiprocessing.Pool(jobs, initializer=init_worker, initargs=(self.worker_config(jobs),)) as pool:
+            for kind, filepath, results, snapshot in pool.imap(convert_file_job, jobs_list):
+                for rec, res, item in results:
+                    journal_result(journal, kind, rec, res, item)
+                self.stats.merge(snapshot)
+                logger.info(f"Merged {len(results)} {kind} record(s) from {filepath}.")
+
+    # --- Deferred review and the whole run ---
+
+    def review_deferred(self, journal):
+        """
+        Second pass of deferred review: one interactive session over the review queue.
+        Records sharing a question (the same Trakt object, e.g. every rewatch of a movie or every
+        watchlist entry for a show) are grouped so each decision is asked once and applied to all.
+        Questions about the same show (the show itself and each of its episodes) are asked one
+        after another, sorted by title. Unanswered groups stay queued if the session is interrupted.
+        """
+        resolver = self.resolver
+        entries = journal.load_review_queue()
+        groups = {}
+        for entry in entries:
+            groups.setdefault(entry["question"]["group"], []).append(entry)
+        shows = {}
+        for group, items in groups.items():
+            shows.setdefault(items[0]["question"].get("show") or group, []).append(group)
+        order = [group for show_groups in shows.values()
+                 for group in sorted(show_groups, key=lambda g: groups[g][0]["question"].get("title") or "")]
+        logger.info(f"Reviewing {len(groups)} question(s) covering {len(entries)} record(s).")
+        remaining = dict(groups)
+        current_show = None
+        try:
+            for n, group in enumerate(order, 1):
+                items = groups[group]
+                question = items[0]["question"]
+                show = question.get("show")
+                if show and show != current_show and len(shows[show]) > 1:
+                    logger.info("#" * 30)
+                    logger.info(f"Show '{question.get('show_title')}': {len(shows[show])} question(s)")
+                current_show = show
+                logger.info("=" * 30)
+                logger.info(f"[{n}/{len(groups)}] {question['summary']} ({len(items)} record(s))")
+                chosen = None
+                if question["options"]:
+                    chosen = resolver.ask_choice(question["summary"], question["options"])
+                if chosen is None:
+                    chosen = resolver.ask_manual_entry(question["fallback"])
+                if chosen:
+                    key = chosen["url"]
+                    meta = {"title": chosen.get("label", ""), "description": chosen.get("description", "")}
+                    tier = "manual"
+                else:
+                    key = question["fallback"]
+                    meta = {"title": "", "description": ""}
+                    tier = "fallback"
+                resolver.remember_resolution(question.get("identity"), {"key": key, "meta": meta, "tier": tier}, persist=True)
+                for entry in items:
+                    journal.add(entry["kind"], {"id": entry["id"]}, key, meta, entry["item"])
+                logger.info(f"Resolved {len(items)} record(s) to record key: {key}")
+                del remaining[group]
+        finally:
+            journal.save_review_queue([entry for items in remaining.values() for entry in items])
+
+    def finish(self, journal):
+        if self.canonicalize:
+            journal.canonicalize(self.resolver)
+        if self.enrich:
+            journal.enrich(self.resolver)
+
+    def convert(self, export_dir, output_file, resume=False, review_only=False):
+        """
+        Convert a Trakt export directory into output_file (a directory in the sharded layout).
+        With resume, records already in the output (or its journal) are skipped; with
+        review_only, only the review session queued by an earlier deferred review run is held.
+        Returns the output data ({key: record}); raises RuntimeError if the output couldn't be
+        written (the records stay in the journal for --resume).
+        """
+        journal = OutputJournal(output_file, resume=resume or review_only, layout=self.layout,
+                                compact_every=self.compact_every, stats=self.stats)
+        try:
+            if review_only:
+                self.review_deferred(journal)
+            else:
+                self.convert_export(export_dir, journal)
+            self.finish(journal)
+        finally:
+            written = journal.close()
+        if not written:
+            raise RuntimeError(f"Could not write {output_file}; the converted records are kept in its journal.")
+        return journal.output_data
+
+    def convert_export(self, export_dir, journal):
+        """Convert every export file into journal, then hold the review session of a deferred review run."""
+        if self.prefetch:
+            self.prefetch_export(export_dir, skip=journal.is_done)
+        files = export_files(export_dir)
+        logger.info(f"Found {sum(kind == 'history' for kind, _ in files)} history file(s) in '{export_dir}/watched' "
+                    f"and {sum(kind == 'watchlist' for kind, _ in files)} watchlist file(s) in '{export_dir}/lists'.")
+        if self.jobs > 1 and len(files) > 1:
+            self.process_files_parallel(files, journal, export_dir, min(self.jobs, len(files)))
+        else:
+            for kind, filepath in files:
+                if kind == "history":
+                    self.process_history_file(filepath, journal, export_dir)
+                else:
+                    self.process_watchlist_file(filepath, journal)
+        if self.resolver.deferred_review and self.resolver.interactive:
+            self.review_deferred(journal)
+
+    def import_records(self, output_file, history=(), watchlist=(), source="trakt-api"):
+        """
+        Convert history and watchlist records obtained elsewhere than an export directory (e.g.
+        pulled from the Trakt API by trakt_sync.py) into output_file, on top of what it already
+        holds. Records whose Trakt id is already in the output are skipped, so overlapping
+        batches are harmless. History notes read "imported from <source>:<id>".
+        Returns the output data ({key: record}); raises RuntimeError if the output couldn't be
+        written (the records stay in the journal and are replayed next time).
+        """
+        journal = OutputJournal(output_file, resume=True, layout=self.layout,
+                                compact_every=self.compact_every, stats=self.stats)
+        try:
+            history = [rec for rec in history if not journal.is_done("history", rec)]
+            watchlist = [rec for rec in watchlist if not journal.is_done("watchlist", rec)]
+            logger.info(f"Importing {len(history)} new history and {len(watchlist)} new watchlist record(s) from {source}.")
+            if self.prefetch and (history or watchlist):
+                self.resolver.prefetch_records(history + watchlist)
+            self.process_records("history", self.convert_records("history", history, journal.is_done, source), journal)
+            self.process_records("watchlist", self.convert_records("watchlist", watchlist, journal.is_done), journal)
+            if self.resolver.deferred_review and self.resolver.interactive:
+                self.review_deferred(journal)
+            if history or watchlist:
+                self.finish(journal)
+        finally:
+            written = journal.close()
+        if not written:
+            raise RuntimeError(f"Could not write {output_file}; the imported records are kept in its journal.")
+        return journal.output_data
+
+# Worker processes (see Converter.process_files_parallel) build one converter each in
+# init_worker; it is private to that child process and never set in the parent. The dump
+# index, if any, is opened per job and closed when the job ends: pool workers are terminated
+# rather than shut down, so nothing held across jobs would ever be closed.
+_worker_converter = None
+_worker_id_index_path = None
+
+def init_worker(config):
+    """Pool initializer: build this process's own cache store, transport, resolver and converter."""
+    global _worker_converter, _worker_id_index_path
+    logging.getLogger().setLevel(config["log_level"])
+    stats = RunStats(enabled=config["stats"])
+    cache = CacheStore(config["cache_path"], config["cache_max_age"], config["negative_cache_max_age"], stats=stats)
+    transport = HttpTransport(config["rate_limits"], config["workers"], config["user_agent"],
+                              config["max_retries"], config["backoff_base"], stats=stats)
+    _worker_id_index_path = config["id_index"]
+    resolver = Resolver(cache, transport, interactive=config["interactive"],
+                        deferred_review=config["deferred_review"], series_lookup=config["series_lookup"],
+                        title_index=config["title_index"], sparql_url=config["sparql_url"],
+                        api_url=config["api_url"], workers=config["workers"], stats=stats)
+    _worker_converter = Converter(resolver, prefetch=False, jobs=1, canonicalize=False, enrich=False, pause=None)
+
+def convert_file_job(job):
+    """
+    Worker: convert one export file. Returns (kind, filepath, results, stats snapshot), where
+    results lists ({"id": ...}, determine_key result, consumption or vote) in file order.
+    """
+    kind, filepath, export_dir, done_ids = job
+    converter = _worker_converter
+    is_done = lambda k, rec: str(rec.get("id")) in done_ids
+    logger.info(f"Processing {kind} file: {filepath}")
+    results = []
+    id_index = None
+    if _worker_id_index_path:
+        from wikidata_dump_index import DumpIndex
+        id_index = DumpIndex(_worker_id_index_path)
+    converter.resolver.id_index = id_index
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            records = json.load(f)
-        logger.debug(f"Found {len(records)} watchlist records in file.")
-    except Exception as e:
+        if kind == "history":
+            converted = converter.convert_history_file(filepath, export_dir, is_done)
+        else:
+            converted = converter.convert_watchlist_file(filepath, is_done)
+        for rec, res, item in converted:
+            results.append(({"id": rec.get("id")}, res, item))
+    except (OSError, ValueError) as e:
         logger.error(f"Error reading file {filepath}: {e}")
-        return
-
-    for rec in records:
-        logger.info("=" * 30)
-        res = determine_key(rec)
-        key = res["key"]
-        meta = res["meta"]
-        # Create record with new format if it doesn't exist.
-        if key not in output_data:
-            output_data[key] = {
-                "meta": meta,
-                "notes": "",
-                "consumptions": [],
-                "queue-votes": {}
-            }
-        vote = {
-            "when": rec.get("listed_at"),
-            "note": json.dumps(rec, ensure_ascii=False)
-        }
-        if WATCHLIST_QUEUE not in output_data[key]["queue-votes"]:
-            output_data[key]["queue-votes"][WATCHLIST_QUEUE] = []
-        output_data[key]["queue-votes"][WATCHLIST_QUEUE].append(vote)
-        logger.debug(f"Added watchlist record under key: {key}")
-        flush_output_data(output_file, output_data)
-        if INTERACTIVE_MODE:
-            input(f"Watchlist record for key: {key} processed. Press ENTER to continue...")
-
-def process_trakt_export(export_dir, output_file):
-    output_data = {}
-    history_pattern = os.path.join(export_dir, "watched", "history-*.json")
-    history_files = glob.glob(history_pattern)
-    logger.info(f"Found {len(history_files)} history file(s) in '{export_dir}/watched'.")
-    for filepath in history_files:
-        process_history_file(filepath, output_data, output_file, export_dir)
-    watchlist_pattern = os.path.join(export_dir, "lists", "watchlist-*.json")
-    watchlist_files = glob.glob(watchlist_pattern)
-    logger.info(f"Found {len(watchlist_files)} watchlist file(s) in '{export_dir}/lists'.")
-    for filepath in watchlist_files:
-        process_watchlist_file(filepath, output_data, output_file)
-    return output_data
+    finally:
+        converter.resolver.id_index = None
+        if id_index is not None:
+            id_index.close()
+    snapshot = converter.stats.snapshot()
+    converter.stats.reset()
+    return kind, filepath, results, snapshot
 
 # --- MAIN SCRIPT ---
 
@@ -518,24 +2516,112 @@ if __name__ == "__main__":
         description="Convert a Trakt.tv export into custom JSON for your content tracker."
     )
     parser.add_argument("export_dir", help="Path to the Trakt export directory")
-    parser.add_argument("output_file", help="Path for the output JSON file")
+    parser.add_argument("output_file", help="Path for the output JSON file (a directory with --layout sharded)")
     parser.add_argument("--non-interactive", action="store_true",
                         help="Run in non-interactive mode (no pauses or prompts)")
+    parser.add_argument("--no-prefetch", action="store_true",
+                        help="Skip the batched Wikidata prefetch and look up each record individually")
+    parser.add_argument("--no-series-lookup", action="store_true",
+                        help="Resolve episodes only through their own IDs, not their show's episode list")
+    parser.add_argument("--no-title-index", action="store_true",
+                        help="Always search titles on Wikidata instead of the local index of cached labels first")
+    parser.add_argument("--lookahead", type=int, default=LOOKAHEAD_RECORDS,
+                        help=f"Upcoming records to look up in the background during interactive prompts (default {LOOKAHEAD_RECORDS}, 0 = off)")
+    parser.add_argument("--jobs", type=int, default=JOBS,
+                        help="Convert export files in this many worker processes sharing the cache (needs --non-interactive or --defer-review)")
+    parser.add_argument("--workers", type=int, default=HTTP_WORKERS,
+                        help=f"Concurrent lookup workers in non-interactive mode (default {HTTP_WORKERS})")
+    parser.add_argument("--rate", action="append", default=[], metavar="HOST=RPS",
+                        help="Override the request rate for an endpoint host, e.g. query.wikidata.org=1.5")
+    parser.add_argument("--defer-review", action="store_true",
+                        help="Resolve unambiguous records first and queue the rest for one grouped review session at the end")
+    parser.add_argument("--review", action="store_true",
+                        help="Only run the review session for records queued by an earlier --defer-review run")
+    parser.add_argument("--resume", action="store_true",
+                        help="Keep the existing output/journal and only convert records not already in it")
+    parser.add_argument("--layout", choices=["backend", "sharded", "flat"], default=OUTPUT_LAYOUT,
+                        help=f"Output layout: the site's ueue-media-tracking.json schema, a sharded directory "
+                             f"with a manifest, or the old flat {{key: record}} JSON (default {OUTPUT_LAYOUT}); "
+                             f"--resume keeps an existing output's own layout")
+    parser.add_argument("--no-canonicalize", action="store_true",
+                        help="Skip the final key pass (redirect check via wbgetentities, fallback retries, merging duplicate keys)")
+    parser.add_argument("--no-enrich", action="store_true",
+                        help="Skip filling missing meta titles/descriptions from wbgetentities at the end")
+    parser.add_argument("--cache", default=CACHE_FILENAME,
+                        help=f"Path of the Wikidata cache store (default {CACHE_FILENAME})")
+    parser.add_argument("--sparql-url", default=SPARQL_URL,
+                        help="SPARQL endpoint to query (e.g. a local wikidata_stub.py)")
+    parser.add_argument("--api-url", default=API_URL,
+                        help="MediaWiki API endpoint to query (e.g. a local wikidata_stub.py)")
+    parser.add_argument("--id-index", metavar="INDEX_FILE",
+                        help="Resolve external IDs from a local index built by wikidata_dump_index.py before querying Wikidata")
+    parser.add_argument("--stats", metavar="REPORT_JSON",
+                        help="Write a JSON report of stage timings, cache and HTTP statistics and resolution tiers")
+    parser.add_argument("--profile", metavar="PSTATS_FILE",
+                        help="Run under cProfile and dump the profile to this file")
+    parser.add_argument("--log-level", default="INFO",
+                        help="Logging level (DEBUG, INFO, WARNING, ...)")
     args = parser.parse_args()
 
-    if args.non_interactive:
-        INTERACTIVE_MODE = False
+    logging.basicConfig(
+        level=args.log_level.upper(),
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+    interactive = not args.non_interactive
+    if not interactive:
         logger.info("Running in non-interactive mode.")
+    if args.defer_review:
+        logger.info("Deferring ambiguous and unmatched records to a review queue.")
+    jobs = max(1, args.jobs)
+    if jobs > 1 and interactive and not args.defer_review:
+        parser.error("--jobs needs --non-interactive or --defer-review")
+    workers = max(1, args.workers)
+    rate_limits = dict(RATE_LIMITS)
+    for override in args.rate:
+        host, _, rps = override.partition("=")
+        rate_limits[host] = (float(rps), max(1, int(float(rps))))
+
+    id_index = None
+    if args.id_index:
+        from wikidata_dump_index import DumpIndex
+        id_index = DumpIndex(args.id_index)
+        logger.info(f"Using dump index {args.id_index} with {id_index.entry_count} identifiers.")
+    stats = RunStats(enabled=bool(args.stats))
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
 
-    load_cache()
+    cache = open_cache(args.cache, stats=stats)
+    transport = HttpTransport(rate_limits, workers, stats=stats)
+    resolver = Resolver(cache, transport, id_index, interactive=interactive, deferred_review=args.defer_review,
+                        series_lookup=not args.no_series_lookup, title_index=not args.no_title_index,
+                        sparql_url=args.sparql_url, api_url=args.api_url, workers=workers, stats=stats)
+    converter = Converter(resolver, layout=args.layout, prefetch=not args.no_prefetch, lookahead=args.lookahead,
+                          jobs=jobs, canonicalize=not args.no_canonicalize, enrich=not args.no_enrich)
     logger.info("Starting conversion...")
-    data = process_trakt_export(args.export_dir, args.output_file)
-    
+    exit_code = 0
     try:
-        with open(args.output_file, "w", encoding="utf-8") as out_f:
-            json.dump(data, out_f, indent=2, ensure_ascii=False)
+        converter.convert(args.export_dir, args.output_file, resume=args.resume, review_only=args.review)
         logger.info(f"Conversion complete. Output written to {args.output_file}")
-    except Exception as e:
-        logger.error(f"Error writing output file: {e}")
+    except KeyboardInterrupt:
+        logger.info(f"Interrupted. Progress saved to {args.output_file}; rerun with --resume to continue.")
+    except RuntimeError as e:
+        logger.error(f"Conversion failed: {e} Rerun with --resume once the problem is fixed.")
+        exit_code = 1
+
+    logger.info(f"Cache store {args.cache} holds {cache.count()} entries.")
+    cache.close()
+    if id_index is not None:
+        id_index.close()
 
-    save_cache()
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        logger.info(f"Profile written to {args.profile}")
+    if args.stats:
+        with open(args.stats, "w", encoding="utf-8") as f:
+            json.dump(stats.report(), f, indent=2)
+        logger.info(f"Stats report written to {args.stats}")
+    sys.exit(exit_code)
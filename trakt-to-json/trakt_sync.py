@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Pull new history and watchlist entries straight from the Trakt API and convert them into the tracker
+output, instead of downloading a full export and re-converting it.
+
+A sync first asks /sync/last_activities whether anything was watched or watchlisted since the last
+sync; if not, that single request is the whole sync. Otherwise /sync/history is paged with
+start_at set to the high-water watched_at cursor of the previous sync (so only new plays come
+back), and /sync/watchlist is paged only when the watchlist changed. All requests share one
+keep-alive connection pool. New records go through the converter's Resolver and
+Converter.import_records, exactly like export records; entries already in the output are
+skipped by Trakt id, so the overlap at the cursor (start_at is inclusive) is harmless.
+
+The cursor and the last activity timestamps are kept in "<output>.sync" and only advanced once
+the new records are written, so an interrupted or failed sync simply repeats on the next run
+(a failed write exits with status 1).
+
+Point it at a local stand-in with --trakt-url http://127.0.0.1:8098 (see trakt_api_stub.py).
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from urllib.parse import urlparse
+
+import trakt_converter as tc
+
+logger = logging.getLogger(__name__)
+
+# Trakt API endpoint and version header
+TRAKT_API_URL = "https://api.trakt.tv"
+TRAKT_API_VERSION = "2"
+
+# Items per page requested from paginated endpoints
+SYNC_PAGE_SIZE = 100
+
+# Allowed request rate for the Trakt API as (requests per second, burst size); Trakt allows 1000 GETs per 5 minutes
+TRAKT_RATE_LIMIT = (3.0, 3)
+
+# Sync state kept next to the output
+SYNC_STATE_SUFFIX = ".sync"
+
+# Where the client id and access token are read from if not given on the command line
+CLIENT_ID_ENV = "TRAKT_CLIENT_ID"
+ACCESS_TOKEN_ENV = "TRAKT_ACCESS_TOKEN"
+
+# --- TRAKT API CLIENT ---
+
+class TraktClient:
+    """
+    Minimal Trakt API client for the sync endpoints: authenticated GETs over a pooled,
+    rate-limited tc.HttpTransport, with transparent paging.
+    """
+
+    def __init__(self, client_id, access_token, api_url=TRAKT_API_URL, transport=None,
+                 page_size=SYNC_PAGE_SIZE, stats=None):
+        self.api_url = api_url.rstrip("/")
+        self.page_size = page_size
+        self.stats = stats or tc.RunStats()
+        host = urlparse(self.api_url).netloc
+        self.transport = transport or tc.HttpTransport({host: TRAKT_RATE_LIMIT}, workers=1, stats=self.stats)
+        self.headers = {
+            "Content-Type": "application/json",
+            "trakt-api-version": TRAKT_API_VERSION,
+            "trakt-api-key": client_id,
+        }
+        if access_token:
+            self.headers["Authorization"] = f"Bearer {access_token}"
+
+    def get(self, path, params=None):
+        response = self.transport.request("GET", f"{self.api_url}{path}", params=params, headers=self.headers)
+        self.stats.count("trakt_requests")
+        return response
+
+    def pages(self, path, params=None):
+        """
+        Yield every item of a paginated endpoint, one page request at a time, following the
+        X-Pagination-Page-Count header (a response without it is a single page).
+        """
+        page = 1
+        while True:
+            response = self.get(path, dict(params or {}, page=page, limit=self.page_size))
+            items = response.json()
+            yield from items
+            page_count = int(response.headers.get("X-Pagination-Page-Count", page))
+            logger.debug(f"Fetched page {page}/{page_count} of {path} ({len(items)} item(s)).")
+            if page >= page_count or not items:
+                return
+            page += 1
+
+    def last_activities(self):
+        return self.get("/sync/last_activities").json()
+
+    def history(self, start_at=None):
+        """Watched history, newest first; with start_at, only plays at or after that time."""
+        return self.pages("/sync/history", {"start_at": start_at} if start_at else None)
+
+    def watchlist(self):
+        return self.pages("/sync/watchlist")
+
+    def close(self):
+        self.transport.close()
+
+# --- SYNC STATE ---
+
+def latest(*timestamps):
+    """The latest of some ISO 8601 UTC timestamps (Trakt's fixed format sorts as text), or None."""
+    present = [t for t in timestamps if t]
+    return max(present) if present else None
+
+def activity_marks(activities):
+    """The last watched and last watchlisted times from a /sync/last_activities response."""
+    def section(name):
+        return activities.get(name) or {}
+    return {
+        "watched_at": latest(section("movies").get("watched_at"), section("episodes").get("watched_at")),
+        "watchlisted_at": latest(section("movies").get("watchlisted_at"), section("shows").get("watchlisted_at"),
+                                 section("seasons").get("watchlisted_at"), section("episodes").get("watchlisted_at")),
+    }
+
+def load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_state(path, state):
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_file, path)
+
+# --- SYNC ---
+
+def sync(client, converter, output_file, state_file=None, full=False):
+    """
+    Bring output_file up to date with the Trakt account behind client, converting new records
+    through converter. With full, the cursor is ignored and the whole history and watchlist are
+    fetched (entries already in the output are still skipped). Returns a report dict.
+    """
+    state_file = state_file or (output_file.rstrip("/\\") + SYNC_STATE_SUFFIX)
+    state = {} if full else load_state(state_file)
+    marks = activity_marks(client.last_activities())
+    report = {"history_fetched": 0, "watchlist_fetched": 0, "cursor": state.get("cursor")}
+
+    history = []
+    if marks["watched_at"] is None or marks["watched_at"] != state.get("watched_at"):
+        logger.info(f"Fetching history since {state.get('cursor') or 'the beginning'}.")
+        history = list(client.history(start_at=state.get("cursor")))
+    else:
+        logger.info("No new plays since the last sync.")
+    watchlist = []
+    if marks["watchlisted_at"] is None or marks["watchlisted_at"] != state.get("watchlisted_at"):
+        logger.info("Watchlist changed since the last sync; fetching it.")
+        watchlist = list(client.watchlist())
+    else:
+        logger.info("Watchlist unchanged since the last sync.")
+    report["history_fetched"] = len(history)
+    report["watchlist_fetched"] = len(watchlist)
+
+    if history or watchlist or not os.path.exists(output_file):
+        converter.import_records(output_file, history, watchlist, source=f"{urlparse(client.api_url).netloc}/sync/history")
+
+    # Only advanced once the records are in the output (import_records raises otherwise),
+    # so an interrupted or failed sync is repeated.
+    new_state = dict(state, watched_at=marks["watched_at"], watchlisted_at=marks["watchlisted_at"],
+                     cursor=latest(state.get("cursor"), *(rec.get("watched_at") for rec in history)))
+    save_state(state_file, new_state)
+    report["cursor"] = new_state["cursor"]
+    logger.info(f"Sync complete: {len(history)} history and {len(watchlist)} watchlist record(s) fetched; "
+                f"cursor now {new_state['cursor']}.")
+    return report
+
+# --- MAIN SCRIPT ---
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync new Trakt history and watchlist entries into the tracker JSON.")
+    parser.add_argument("output_file", help="Converter output to update (created if missing; a directory with --layout sharded)")
+    parser.add_argument("--client-id", default=os.environ.get(CLIENT_ID_ENV),
+                        help=f"Trakt API client id (default ${CLIENT_ID_ENV})")
+    parser.add_argument("--access-token", default=os.environ.get(ACCESS_TOKEN_ENV),
+                        help=f"OAuth access token of the account to sync (default ${ACCESS_TOKEN_ENV})")
+    parser.add_argument("--trakt-url", default=TRAKT_API_URL, help=f"Trakt API base URL (default {TRAKT_API_URL})")
+    parser.add_argument("--state", help=f"Sync state file (default <output_file>{SYNC_STATE_SUFFIX})")
+    parser.add_argument("--full", action="store_true", help="Ignore the cursor and fetch everything again")
+    parser.add_argument("--page-size", type=int, default=SYNC_PAGE_SIZE, help=f"Items per page (default {SYNC_PAGE_SIZE})")
+    parser.add_argument("--non-interactive", action="store_true", help="Run in non-interactive mode (no pauses or prompts)")
+    parser.add_argument("--defer-review", action="store_true",
+                        help="Queue ambiguous and unmatched records for one grouped review session at the end")
+    parser.add_argument("--layout", choices=["backend", "sharded", "flat"], default=tc.OUTPUT_LAYOUT,
+                        help=f"Layout of a newly created output (default {tc.OUTPUT_LAYOUT})")
+    parser.add_argument("--cache", default=tc.CACHE_FILENAME, help=f"Wikidata cache store (default {tc.CACHE_FILENAME})")
+    parser.add_argument("--sparql-url", default=tc.SPARQL_URL, help="SPARQL endpoint to query")
+    parser.add_argument("--api-url", default=tc.API_URL, help="MediaWiki API endpoint to query")
+    parser.add_argument("--rate", action="append", default=[], metavar="HOST=RPS",
+                        help="Override the request rate for an endpoint host, e.g. api.trakt.tv=1")
+    parser.add_argument("--stats", metavar="REPORT_JSON", help="Write the sync report and run statistics here")
+    parser.add_argument("--log-level", default="INFO", help="Logging level (DEBUG, INFO, WARNING, ...)")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=args.log_level.upper(),
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+    if not args.client_id:
+        parser.error(f"a Trakt client id is needed (--client-id or ${CLIENT_ID_ENV})")
+
+    trakt_host = urlparse(args.trakt_url).netloc
+    rate_limits = dict(tc.RATE_LIMITS, **{trakt_host: TRAKT_RATE_LIMIT})
+    for override in args.rate:
+        host, _, rps = override.partition("=")
+        rate_limits[host] = (float(rps), max(1, int(float(rps))))
+
+    stats = tc.RunStats(enabled=bool(args.stats))
+    # One transport for Trakt and Wikidata alike: a single connection pool and per-host rate limits.
+    transport = tc.HttpTransport(rate_limits, tc.HTTP_WORKERS, stats=stats)
+    client = TraktClient(args.client_id, args.access_token, args.trakt_url, transport, args.page_size, stats=stats)
+    cache = tc.open_cache(args.cache, stats=stats)
+    resolver = tc.Resolver(cache, transport, interactive=not args.non_interactive, deferred_review=args.defer_review,
+                           sparql_url=args.sparql_url, api_url=args.api_url, stats=stats)
+    converter = tc.Converter(resolver, layout=args.layout)
+    try:
+        report = sync(client, converter, args.output_file, args.state, full=args.full)
+    except RuntimeError as e:
+        logger.error(f"Sync failed, cursor not advanced: {e}")
+        sys.exit(1)
+    finally:
+        cache.close()
+        transport.close()
+    if args.stats:
+        with open(args.stats, "w", encoding="utf-8") as f:
+            json.dump(dict(stats.report(), sync=report), f, indent=2)
+        logger.info(f"Stats report written to {args.stats}")
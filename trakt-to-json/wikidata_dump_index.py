@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Build a compact external-ID -> QID index from a Wikidata JSON dump, for offline and bulk conversions.
+
+The dump (latest-all.json.bz2, .gz, or plain/filtered .json with one entity per line) is streamed,
+never loaded whole. Lines that can't hold one of the identifier properties trakt_converter uses are
+skipped with a substring check; the rest are parsed on a process pool. Matches are sorted with an
+external merge sort and written to a single index file that the converter memory-maps and
+binary-searches (see DumpIndex), so lookups cost a few page reads and no network.
+
+Index file layout (all integers little-endian):
+  header   MAGIC, entry count, entity count, offset of the entry table, offset of the entity table
+  keys     per entry: u16 key length, key ("<prop>\\x1f<value>" UTF-8), u64 QID number
+  entries  u64 offset of each key record, sorted by key bytes
+  labels   per entity: u16 label length, label, u16 description length, description
+  entities per entity: u64 QID number, u64 offset of its label record, sorted by QID number
+"""
+import argparse
+import bz2
+import gzip
+import heapq
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import time
+from multiprocessing import Pool
+
+logger = logging.getLogger(__name__)
+
+# Identifier properties get_wikidata_key looks up
+INDEX_PROPERTIES = ["P8013", "P12492", "P345", "P4947", "P12196"]
+
+MAGIC = b"WDIDX01\n"
+HEADER = struct.Struct("<8sQQQQ")
+U16 = struct.Struct("<H")
+U64 = struct.Struct("<Q")
+ENTITY = struct.Struct("<QQ")
+KEY_SEPARATOR = "\x1f"
+
+# Raw dump lines sent to a worker at a time
+LINES_PER_TASK = 2000
+
+# Entries kept in memory before a sorted run is spilled to disk
+RUN_SIZE = 1_000_000
+
+# --- DUMP READING ---
+
+def open_dump(path):
+    """
+    Open a dump for binary line reading. .bz2 dumps are piped through lbzip2/pbzip2 when
+    available (parallel decompression); otherwise Python's bz2/gzip modules are used.
+    """
+    if path.endswith(".bz2"):
+        for tool in ("lbzip2", "pbzip2"):
+            if shutil.which(tool):
+                logger.info(f"Decompressing with {tool}.")
+                proc = subprocess.Popen([tool, "-dc", path], stdout=subprocess.PIPE, bufsize=1 << 20)
+                return proc.stdout
+        return bz2.open(path, "rb")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+def iter_line_batches(path):
+    """Yield batches of dump lines that mention at least one indexed property."""
+    needles = [f'"{prop}"'.encode() for prop in INDEX_PROPERTIES]
+    batch = []
+    with open_dump(path) as f:
+        for line in f:
+            if any(needle in line for needle in needles):
+                batch.append(line)
+                if len(batch) >= LINES_PER_TASK:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+def extract_entities(lines):
+    """
+    Worker: parse dump lines and return [(qid, label, description, [(prop, value), ...])]
+    for entities with at least one indexed identifier.
+    """
+    found = []
+    for line in lines:
+        line = line.strip().rstrip(b",")
+        if not line or line in (b"[", b"]"):
+            continue
+        try:
+            entity = json.loads(line)
+        except ValueError:
+            continue
+        qid = entity.get("id", "")
+        if not qid.startswith("Q"):
+            continue
+        claims = entity.get("claims", {})
+        ids = []
+        for prop in INDEX_PROPERTIES:
+            for claim in claims.get(prop, []):
+                value = claim.get("mainsnak", {}).get("datavalue", {}).get("value")
+                # Control characters would break the tab-separated runs and their sort order.
+                if isinstance(value, str) and value.isprintable():
+                    ids.append((prop, value))
+        if ids:
+            label = entity.get("labels", {}).get("en", {}).get("value", "")
+            description = entity.get("descriptions", {}).get("en", {}).get("value", "")
+            found.append((qid, label, description, ids))
+    return found
+
+# --- EXTERNAL SORT ---
+
+class RunWriter:
+    """Collect text lines, spilling sorted runs to temp files every RUN_SIZE lines."""
+
+    def __init__(self, tmp_dir, name):
+        self.tmp_dir = tmp_dir
+        self.name = name
+        self.lines = []
+        self.runs = []
+
+    def add(self, line):
+        self.lines.append(line)
+        if len(self.lines) >= RUN_SIZE:
+            self.spill()
+
+    def spill(self):
+        if not self.lines:
+            return
+        self.lines.sort(key=lambda l: l.encode("utf-8"))
+        path = os.path.join(self.tmp_dir, f"{self.name}-{len(self.runs)}.run")
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(self.lines)
+        self.runs.append(path)
+        self.lines = []
+
+    def merged(self):
+        """All lines in sorted order, merged from the spilled runs."""
+        self.spill()
+        files = [open(path, "r", encoding="utf-8") for path in self.runs]
+        try:
+            yield from heapq.merge(*files, key=lambda l: l.encode("utf-8"))
+        finally:
+            for f in files:
+                f.close()
+
+def write_index(index_path, key_lines, entity_lines):
+    """Write the index file from sorted "key\\tqid\\n" and "qidnum\\tlabel\\tdescription\\n" lines."""
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as out, tempfile.TemporaryFile() as offsets:
+        out.write(HEADER.pack(MAGIC, 0, 0, 0, 0))
+        entry_count = 0
+        for line in key_lines:
+            key, qid = line.rstrip("\n").rsplit("\t", 1)
+            offsets.write(U64.pack(out.tell()))
+            key_bytes = key.encode("utf-8")
+            out.write(U16.pack(len(key_bytes)) + key_bytes + U64.pack(int(qid[1:])))
+            entry_count += 1
+        entries_pos = out.tell()
+        offsets.seek(0)
+        shutil.copyfileobj(offsets, out)
+
+        offsets.seek(0)
+        offsets.truncate()
+        entity_count = 0
+        for line in entity_lines:
+            qid_num, label, description = line.rstrip("\n").split("\t", 2)
+            offsets.write(ENTITY.pack(int(qid_num), out.tell()))
+            label_bytes = label.encode("utf-8")[:0xFFFF]
+            description_bytes = description.encode("utf-8")[:0xFFFF]
+            out.write(U16.pack(len(label_bytes)) + label_bytes + U16.pack(len(description_bytes)) + description_bytes)
+            entity_count += 1
+        entities_pos = out.tell()
+        offsets.seek(0)
+        shutil.copyfileobj(offsets, out)
+
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, entry_count, entity_count, entries_pos, entities_pos))
+    os.replace(tmp_path, index_path)
+    return entry_count, entity_count
+
+def clean_text(text):
+    return text.replace("\t", " ").replace("\n", " ")
+
+def build_index(dump_paths, index_path, workers):
+    started = time.time()
+    with tempfile.TemporaryDirectory(prefix="wdidx-", dir=os.path.dirname(os.path.abspath(index_path))) as tmp_dir:
+        keys = RunWriter(tmp_dir, "keys")
+        entities = RunWriter(tmp_dir, "entities")
+        parsed = 0
+        with Pool(workers) as pool:
+            for dump_path in dump_paths:
+                logger.info(f"Reading {dump_path} with {workers} worker(s).")
+                for batch, found in enumerate(pool.imap(extract_entities, iter_line_batches(dump_path)), 1):
+                    for qid, label, description, ids in found:
+                        for prop, value in ids:
+                            keys.add(f"{prop}{KEY_SEPARATOR}{value}\t{qid}\n")
+                        # Zero-padded so text order of the runs equals numeric QID order.
+                        entities.add(f"{int(qid[1:]):012d}\t{clean_text(label)}\t{clean_text(description)}\n")
+                        parsed += 1
+                    if batch % 100 == 0:
+                        logger.info(f"Indexed {parsed} entities so far ({time.time() - started:.0f}s).")
+        entry_count, entity_count = write_index(index_path, keys.merged(), entities.merged())
+    logger.info(f"Wrote {entry_count} identifiers for {entity_count} entities to {index_path} "
+                f"in {time.time() - started:.0f}s.")
+
+# --- INDEX LOOKUPS ---
+
+class DumpIndex:
+    """Read-only, memory-mapped view of an index file with binary-search lookups."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.entry_count, self.entity_count, self.entries_pos, self.entities_pos = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a Wikidata ID index")
+
+    def key_at(self, i):
+        offset = U64.unpack_from(self.map, self.entries_pos + i * U64.size)[0]
+        length = U16.unpack_from(self.map, offset)[0]
+        start = offset + U16.size
+        return self.map[start:start + length], U64.unpack_from(self.map, start + length)[0]
+
+    def meta(self, qid_num):
+        lo, hi = 0, self.entity_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            num, offset = ENTITY.unpack_from(self.map, self.entities_pos + mid * ENTITY.size)
+            if num < qid_num:
+                lo = mid + 1
+            elif num > qid_num:
+                hi = mid
+            else:
+                length = U16.unpack_from(self.map, offset)[0]
+                label = self.map[offset + 2:offset + 2 + length].decode("utf-8", "replace")
+                offset += 2 + length
+                length = U16.unpack_from(self.map, offset)[0]
+                description = self.map[offset + 2:offset + 2 + length].decode("utf-8", "replace")
+                return label, description
+        return "", ""
+
+    def lookup(self, prop, value):
+        """Results for a property value, shaped like Resolver.lookup_by_property's (possibly empty)."""
+        key = f"{prop}{KEY_SEPARATOR}{value}".encode("utf-8")
+        lo, hi = 0, self.entry_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key_at(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        results = []
+        while lo < self.entry_count:
+            found, qid_num = self.key_at(lo)
+            if found != key:
+                break
+            label, description = self.meta(qid_num)
+            results.append({
+                "id": f"Q{qid_num}",
+                "url": f"http://www.wikidata.org/entity/Q{qid_num}",
+                "label": label,
+                "description": description
+            })
+            lo += 1
+        return results
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build an external-ID -> QID index from a Wikidata JSON dump.")
+    parser.add_argument("dumps", nargs="*", help="Dump files (.json.bz2, .json.gz or .json, one entity per line)")
+    parser.add_argument("-o", "--output", default="wikidata_ids.idx", help="Index file to write")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="Parser processes")
+    parser.add_argument("--lookup", nargs=2, metavar=("PROP", "VALUE"),
+                        help="Look a value up in an existing index instead of building one")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+    if args.lookup:
+        with DumpIndex(args.output) as index:
+            print(json.dumps(index.lookup(*args.lookup), indent=2, ensure_ascii=False))
+    elif args.dumps:
+        build_index(args.dumps, args.output, max(1, args.workers))
+    else:
+        parser.error("no dump files given")
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Offline stand-in for the two Wikidata endpoints trakt_converter uses:
+  /sparql      (query.wikidata.org) - property lookups, batched VALUES lookups and series episode lists
+  /w/api.php   (www.wikidata.org)   - wbsearchentities title search, wbgetentities labels and redirects
+
+Answers come from a seed file in the wikidata_cache.json format ("prop:P|value:V" and title keys),
+optionally with "series:Q…" keys listing a show's episodes with "season" and "number", and
+"redirect:Q…" keys whose single result is the item that QID redirects to. wbgetentities knows
+every entity that appears in any seed result.
+A SQLite cache store (wikidata_cache.sqlite3) can be used as the seed too.
+
+Point the converter at it with --sparql-url http://127.0.0.1:8099/sparql --api-url http://127.0.0.1:8099/w/api.php.
+GET /stats returns request counters; POST /stats returns and zeroes them.
+"""
+import argparse
+import json
+import logging
+import random
+import re
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+SINGLE_RE = re.compile(r'\?item\s+wdt:(P\d+)\s+"((?:[^"\\]|\\.)*)"')
+VALUES_RE = re.compile(r'VALUES\s+\?v\s*\{(.*?)\}\s*\?item\s+wdt:(P\d+)\s+\?v', re.S)
+LITERAL_RE = re.compile(r'"((?:[^"\\]|\\.)*)"')
+SERIES_RE = re.compile(r'\?item\s+wdt:P179\s+wd:(Q\d+)')
+
+def unescape_literal(value):
+    return re.sub(r'\\(.)', r'\1', value)
+
+def load_seed(path):
+    """Load a seed into {"prop": {(P, V): results}, "title": {title: results}, "series": {Q: episodes}}."""
+    seed = {"prop": {}, "title": {}, "series": {}, "redirect": {}}
+    if path.endswith(".sqlite3"):
+        conn = sqlite3.connect(path)
+        rows = conn.execute("SELECT namespace, key, results FROM entries").fetchall()
+        conn.close()
+        for namespace, key, results in rows:
+            if namespace == "prop":
+                prop, value = key.split("|", 1)
+                seed["prop"][(prop, value)] = json.loads(results)
+            elif namespace in ("title", "series", "redirect"):
+                seed[namespace][key] = json.loads(results)
+        return index_entities(seed)
+    with open(path, "r", encoding="utf-8") as f:
+        legacy = json.load(f)
+    for key, results in legacy.items():
+        if key.startswith("prop:") and "|value:" in key:
+            prop, value = key[len("prop:"):].split("|value:", 1)
+            seed["prop"][(prop, value)] = results
+        elif key.startswith("series:"):
+            seed["series"][key[len("series:"):]] = results
+        elif key.startswith("redirect:"):
+            seed["redirect"][key[len("redirect:"):]] = results
+        else:
+            seed["title"][key] = results
+    return index_entities(seed)
+
+def index_entities(seed):
+    """Collect every entity mentioned in the seed into seed["entities"] for wbgetentities."""
+    entities = {}
+    for namespace in ("prop", "title", "series", "redirect"):
+        for results in seed[namespace].values():
+            for r in results:
+                if r.get("id") and (r.get("label") or r.get("id") not in entities):
+                    entities[r["id"]] = r
+    seed["entities"] = entities
+    return seed
+
+class StubState:
+    def __init__(self, seed, latency, jitter, error_rate, retry_after):
+        self.seed = seed
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stats = {"requests": 0, "sparql": 0, "api": 0, "throttled": 0, "bytes_sent": 0}
+
+    def count(self, **deltas):
+        with self.lock:
+            for name, delta in deltas.items():
+                self.stats[name] += delta
+
+def sparql_binding(result, value=None):
+    binding = {
+        "item": {"type": "uri", "value": result["url"]},
+        "itemLabel": {"type": "literal", "value": result.get("label", "")},
+    }
+    if result.get("description"):
+        binding["itemDescription"] = {"type": "literal", "value": result["description"]}
+    if value is not None:
+        binding["v"] = {"type": "literal", "value": value}
+    return binding
+
+def answer_sparql(seed, query):
+    bindings = []
+    series = SERIES_RE.search(query)
+    values = VALUES_RE.search(query)
+    single = SINGLE_RE.search(query)
+    if series:
+        for ep in seed["series"].get(series.group(1), []):
+            binding = sparql_binding(ep)
+            binding["seasonNumber"] = {"type": "literal", "value": str(ep.get("season"))}
+            binding["episodeNumber"] = {"type": "literal", "value": str(ep.get("number"))}
+            bindings.append(binding)
+    elif values:
+        prop = values.group(2)
+        for literal in LITERAL_RE.findall(values.group(1)):
+            value = unescape_literal(literal)
+            for result in seed["prop"].get((prop, value), []):
+                bindings.append(sparql_binding(result, value))
+    elif single:
+        prop, value = single.group(1), unescape_literal(single.group(2))
+        for result in seed["prop"].get((prop, value), []):
+            bindings.append(sparql_binding(result))
+    return {"head": {"vars": ["item", "itemLabel", "itemDescription"]}, "results": {"bindings": bindings}}
+
+def answer_api(seed, params):
+    action = params.get("action", [""])[0]
+    if action == "wbsearchentities":
+        search = params.get("search", [""])[0].strip()
+        return {"search": [{"id": r.get("id"), "label": r.get("label", ""), "description": r.get("description", "")}
+                           for r in seed["title"].get(search, [])]}
+    if action == "wbgetentities":
+        props = params.get("props", ["info|labels|descriptions"])[0].split("|")
+        languages = params.get("languages", ["en"])[0].split("|")
+        entities = {}
+        for qid in params.get("ids", [""])[0].split("|"):
+            target = (seed["redirect"].get(qid) or [{}])[0].get("id")
+            entity_id = target or qid
+            known = seed["entities"].get(entity_id)
+            if known is None and not target:
+                entities[qid] = {"id": qid, "missing": ""}
+                continue
+            entity = {"type": "item", "id": entity_id}
+            if target:
+                entity["redirects"] = {"from": qid, "to": target}
+            for prop, field in (("labels", "label"), ("descriptions", "description")):
+                if prop in props and known and known.get(field):
+                    entity[prop] = {lang: {"language": lang, "value": known[field]} for lang in languages[:1]}
+            # Keyed by the requested id, so a redirect and its target can both be asked for.
+            entities[qid] = entity
+        return {"entities": entities, "success": 1}
+    return {"error": {"code": "badvalue", "info": f"Unsupported action '{action}'"}}
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def send_json(self, status, body, headers=None):
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+            return len(payload)
+
+        def params(self):
+            parsed = urlparse(self.path)
+            params = parse_qs(parsed.query)
+            if self.command == "POST":
+                length = int(self.headers.get("Content-Length", 0))
+                params.update(parse_qs(self.rfile.read(length).decode("utf-8")))
+            return parsed.path, params
+
+        def handle_request(self):
+            path, params = self.params()
+            if path == "/stats":
+                if self.command == "POST":
+                    state.reset()
+                with state.lock:
+                    stats = dict(state.stats)
+                self.send_json(200, stats)
+                return
+            if path not in ("/sparql", "/w/api.php"):
+                self.send_json(404, {"error": f"unknown path {path}"})
+                return
+            state.count(requests=1, **{"sparql" if path == "/sparql" else "api": 1})
+            if state.latency or state.jitter:
+                time.sleep(state.latency + random.uniform(0, state.jitter))
+            if state.error_rate and random.random() < state.error_rate:
+                state.count(throttled=1)
+                self.send_json(429, {"error": "Too Many Requests"}, {"Retry-After": str(state.retry_after)})
+                return
+            if path == "/sparql":
+                body = answer_sparql(state.seed, params.get("query", [""])[0])
+            else:
+                body = answer_api(state.seed, params)
+            state.count(bytes_sent=self.send_json(200, body))
+
+        do_GET = handle_request
+        do_POST = handle_request
+    return Handler
+
+def make_server(seed_path, host="127.0.0.1", port=8099, latency=0.0, jitter=0.0, error_rate=0.0, retry_after=1):
+    state = StubState(load_seed(seed_path), latency, jitter, error_rate, retry_after)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    logger.info(f"Seeded with {len(state.seed['prop'])} property, {len(state.seed['title'])} title, "
+                f"{len(state.seed['series'])} series and {len(state.seed['redirect'])} redirect entries.")
+    return server
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+    parser = argparse.ArgumentParser(description="Serve an offline stand-in for the Wikidata endpoints used by trakt_converter.")
+    parser.add_argument("--seed", default="wikidata_cache.json",
+                        help="Seed file: a wikidata_cache.json-style JSON file or a .sqlite3 cache store")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency of up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with injected 429s")
+    args = parser.parse_args()
+
+    server = make_server(args.seed, args.host, args.port, args.latency, args.jitter, args.error_rate, args.retry_after)
+    logger.info(f"Listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass